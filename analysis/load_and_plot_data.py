@@ -12,7 +12,8 @@ from scipy.io import savemat, loadmat
 import mpl_toolkits.mplot3d.axes3d as p3
 import sys
 sys.path.append("../metrics/")
-from animate_JCS import plot_gymnasium_symmetrized
+from gaze_position_gymnasium import Gymnasium
+from trial_manifest import TrialManifest
 
 
 def load_eye_tracking_metrics(path, file):
@@ -139,29 +140,29 @@ def trajectory_plots(df, move_list, subelite_names, elite_names):
 
         return
 
-    bound_side = 3 + 121 * 0.0254 / 2
+    gymnasium = Gymnasium()
 
     plt.close('all')
 
     fig1 = plt.figure(0)
     ax1 = p3.Axes3D(fig1)
     ax1.set_box_aspect([1, 1, 1])
-    plot_gymnasium_symmetrized(bound_side, ax1)
+    gymnasium.plot(ax1, facing_front_wall=True)
 
     fig2 = plt.figure(1)
     ax2 = p3.Axes3D(fig2)
     ax2.set_box_aspect([1, 1, 1])
-    plot_gymnasium_symmetrized(bound_side, ax2)
+    gymnasium.plot(ax2, facing_front_wall=True)
 
     fig3 = plt.figure(2)
     ax3 = p3.Axes3D(fig3)
     ax3.set_box_aspect([1, 1, 1])
-    plot_gymnasium_symmetrized(bound_side, ax3)
+    gymnasium.plot(ax3, facing_front_wall=True)
 
     fig4 = plt.figure(3)
     ax4 = p3.Axes3D(fig4)
     ax4.set_box_aspect([1, 1, 1])
-    plot_gymnasium_symmetrized(bound_side, ax4)
+    gymnasium.plot(ax4, facing_front_wall=True)
 
     ax_list = [ax1, ax2, ax3, ax4]
 
@@ -906,7 +907,7 @@ else:
     plot_path = home_path + f"/disk/Eye-tracking/plots"
 
 csv_name = home_path + "/disk/Eye-tracking/Trials_name_mapping.csv"
-trial_table = np.char.split(pd.read_csv(csv_name, sep="\t").values.astype("str"), sep=",")
+trial_manifest = TrialManifest(csv_name)
 
 primary_table = [["Name", "Expertise", "Acrobatics",
                   "Fixations duration absolute", "Fixations duration relative", "Number of fixations",
@@ -954,9 +955,7 @@ if GENRATE_DATA_FRAME_FLAG:
                             expertise = eye_tracking_metrics["subject_expertise"]
                             subject_name = eye_tracking_metrics["subject_name"]
 
-                            for i_trial in range(len(trial_table)):
-                                if trial_table[i_trial][0][0] == subject_name:
-                                    twist_side = trial_table[i_trial][0][25]
+                            twist_side = trial_manifest.twist_side(subject_name)
 
                             acrobatics = folder_move
                             fixation_duration_absolute = np.mean(eye_tracking_metrics["fixation_duration_absolute"])
@@ -6,12 +6,14 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
-from matplotlib.patches import Rectangle
 import spm1d
 from scipy.interpolate import interp1d
 from scipy.stats import multivariate_normal
 import csv
+import sys
 from IPython import embed
+sys.path.append("../metrics/")
+from gaze_position_gymnasium import Gymnasium
 
 
 ##########################################################################################
@@ -29,6 +31,7 @@ SPREADING_HEATMAP_FLAG = True
 QUALITATIVE_ANALYSIS_FLAG = True
 
 move_list = ['4-', '41', '42', '43']
+gymnasium = Gymnasium()
 
 pd.set_option('display.max_rows', 500)
 pd.set_option('display.max_columns', 500)
@@ -304,44 +307,7 @@ def find_significant_timings(xi_interp, subelites_data, elites_data):
     return admissible_timings, significant_timings
 
 def plot_gymnasium_unwrapped(axs, j, FLAG_3D=False):
-
-    bound_side = 3 + 121 * 0.0254 / 2
-
-    # Plot trampo bed
-    if FLAG_3D:
-        X, Y = np.meshgrid([-7 * 0.3048, 7 * 0.3048], [-3.5 * 0.3048, 3.5 * 0.3048])
-        Z = np.zeros(X.shape)
-        axs[j].plot_surface(X, Y, Z, color="k", alpha=0.4)
-    else:
-        axs[j].add_patch(Rectangle((-7 * 0.3048, -3.5 * 0.3048), 14 * 0.3048, 7 * 0.3048, facecolor='k', alpha=0.2))
-    # Plot vertical lines of the symmetrized gymnasium
-    axs[j].plot(np.array([-7.2, -7.2]), np.array([-bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([7.2, 7.2]), np.array([-bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([-7.2 - (9.4620-1.2192), -7.2 - (9.4620-1.2192)]), np.array([-bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([7.2 + 9.4620-1.2192, 7.2 + 9.4620-1.2192]), np.array([-bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([-7.2 - (9.4620-1.2192) - 2*7.2, -7.2 - (9.4620-1.2192) - 2*7.2]), np.array([-bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([-7.2, -7.2]), np.array([-bound_side - (9.4620-1.2192), bound_side]), '-k')
-    axs[j].plot(np.array([7.2, 7.2]), np.array([-bound_side - (9.4620-1.2192), bound_side]), '-k')
-    axs[j].plot(np.array([-7.2, -7.2]), np.array([bound_side, bound_side + 9.4620 - 1.2192]), '-k')
-    axs[j].plot(np.array([7.2, 7.2]), np.array([bound_side, bound_side + 9.4620 - 1.2192]), '-k')
-    # Plot horizontal lines of the symmetrized gymnasium
-    axs[j].plot(np.array([-7.2, 7.2]), np.array([-bound_side, -bound_side]), '-k')
-    axs[j].plot(np.array([-7.2, 7.2]), np.array([bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([-7.2, 7.2]), np.array([-bound_side - (9.4620-1.2192), -bound_side - (9.4620-1.2192)]), '-k')
-    axs[j].plot(np.array([-7.2, 7.2]), np.array([bound_side + 9.4620-1.2192, bound_side + 9.4620-1.2192]), '-k')
-    axs[j].plot(np.array([7.2, 7.2 + 9.4620-1.2192]), np.array([-bound_side, -bound_side]), '-k')
-    axs[j].plot(np.array([7.2, 7.2 + 9.4620-1.2192]), np.array([bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([-7.2 - (9.4620-1.2192), 7.2]), np.array([-bound_side, -bound_side]), '-k')
-    axs[j].plot(np.array([-7.2 - (9.4620-1.2192), 7.2]), np.array([bound_side, bound_side]), '-k')
-    axs[j].plot(np.array([-7.2 - (9.4620-1.2192) - 2*7.2, -7.2 - (9.4620-1.2192)]), np.array([-bound_side, -bound_side]), '-k')
-    axs[j].plot(np.array([-7.2 - (9.4620-1.2192) - 2*7.2, -7.2 - (9.4620-1.2192)]), np.array([bound_side, bound_side]), '-k')
-
-    axs[j].text(-7.2 - (9.4620-1.2192) - 2*7.2 + 7.2/2 + 1, bound_side + 0.1, "Ceiling", fontsize=10)
-    axs[j].text(-7.2 - (9.4620-1.2192) + 1, bound_side + 0.1, "Wall back", fontsize=10)
-    axs[j].text(7.2 + 1, bound_side + 0.1, "Wall front", fontsize=10)
-    axs[j].text(-7.2 + 7.2/2 + 1, bound_side + 9.4620-1.2192 + 0.1, "Wall left", fontsize=10)
-    axs[j].text(-7.2 + 7.2/2 + 0.5, -bound_side - (9.4620-1.2192) - 1, "Wall right", fontsize=10)
-
+    gymnasium.plot_unwrapped(axs[j], FLAG_3D)
     return
 
 def plot_trajectories_data_frame(
@@ -460,23 +426,11 @@ def plot_projection_of_PGOS(name, move, original_trajectory, projected_interpola
     # plt.show()
     return
 
-def unwrap_gaze_positions(gaze_position, wall_index, bound_side):
-
-    gaze_position_x_y = np.zeros((2, np.shape(wall_index)[0]))
-    gaze_position_x_y[:, :] = np.nan
-    for i in range(1, len(wall_index)):
-        if wall_index[i] == 0:  # trampoline
-            gaze_position_x_y[:, i] = gaze_position[i][:2]
-        if wall_index[i] == 1:  # wall front
-            gaze_position_x_y[:, i] = [gaze_position[i][2] + 7.2, gaze_position[i][1]]
-        elif wall_index[i] == 2:  # ceiling
-            gaze_position_x_y[:, i] = [-7.2 - (9.4620-1.2192) - 7.2 - gaze_position[i][0], gaze_position[i][1]]
-        elif wall_index[i] == 3:  # wall back
-            gaze_position_x_y[:, i] = [-7.2 - gaze_position[i][2], gaze_position[i][1]]
-        elif wall_index[i] == 4:  # bound right
-            gaze_position_x_y[:, i] = [gaze_position[i][0], -bound_side - gaze_position[i][2]]
-        elif wall_index[i] == 5:  # bound left
-            gaze_position_x_y[:, i] = [gaze_position[i][0], bound_side + gaze_position[i][2]]
+def unwrap_gaze_positions(gaze_position, wall_index, gymnasium):
+
+    gaze_position_x_y = gymnasium.unwrap(gaze_position, wall_index)
+    # The first sample is not unwrapped
+    gaze_position_x_y[:, 0] = np.nan
     return gaze_position_x_y
 
 
@@ -489,8 +443,6 @@ def nearest_interp(xi, x, y):
 
 if TRAJECTORIES_ANALYSIS_FLAG:
 
-    bound_side = 3 + 121 * 0.0254 / 2
-
     nb_interp_points = 500
     xi_interp = np.linspace(0, 1, nb_interp_points)
     trajectory_curves_per_athelte_per_move = {}
@@ -525,7 +477,7 @@ if TRAJECTORIES_ANALYSIS_FLAG:
                 unwrapped_trajectory_this_time = unwrap_gaze_positions(
                     trajectory_this_time_3d,
                     wall_index_closest,
-                    bound_side)
+                    gymnasium)
                 trajectory_curves = np.concatenate((trajectory_curves, unwrapped_trajectory_this_time[:, :, np.newaxis]), axis=2)
                 trajectory_curves_3D = np.concatenate((trajectory_curves_3D, trajectory_this_time_3d.T[:, :, np.newaxis]), axis=2)
 
@@ -654,33 +606,11 @@ if TRAJECTORIES_ANALYSIS_FLAG:
 
 if TRAJECTORIES_HEATMAPS_FLAG:
     def put_lines_on_fig(ax):
-        ax.plot(np.array([0, 0]), np.array([82, 173]), '-k', linewidth=1)
-        ax.plot(np.array([144, 144]), np.array([82, 173]), '-k', linewidth=1)
-        ax.plot(np.array([226, 226]), np.array([0, 255]), '-k', linewidth=1)
-        ax.plot(np.array([370, 370]), np.array([0, 255]), '-k', linewidth=1)
-        ax.plot(np.array([453, 453]), np.array([82, 173]), '-k', linewidth=1)
-
-        ax.plot(np.array([226, 370]), np.array([0, 0]), '-k', linewidth=1)
-        ax.plot(np.array([0, 453]), np.array([82, 82]), '-k', linewidth=1)
-        ax.plot(np.array([0, 453]), np.array([173, 173]), '-k', linewidth=1)
-        ax.plot(np.array([226, 370]), np.array([255, 255]), '-k', linewidth=1)
-
-        ax.plot(np.array([277, 277]), np.array([117, 138]), '-k', linewidth=1)
-        ax.plot(np.array([320, 320]), np.array([117, 138]), '-k', linewidth=1)
-        ax.plot(np.array([277, 320]), np.array([117, 117]), '-k', linewidth=1)
-        ax.plot(np.array([277, 320]), np.array([138, 138]), '-k', linewidth=1)
-
-        ax.text((-7.2 - (9.4620 - 1.2192) - 2 * 7.2 + 7.2 / 2 + 1) * 10 + 298.428, (4.5367 + 0.1)*10 + 27.295 + 5, "Ceiling", fontsize=10)
-        ax.text((-7.2 - (9.4620 - 1.2192) + 1)*10 + 298.428, (4.5367 + 0.1)*10 + 27.295 + 5, "Wall back", fontsize=10)
-        ax.text((7.2 + 1)*10 + 298.428, (4.5367 + 0.1)*10 + 27.295 + 5, "Wall front", fontsize=10)
-        ax.text((-7.2 + 7.2 / 2 + 1)*10 + 298.428, (4.5367 + 9.4620 - 1.2192 + 1)*10 + 127.295 + 5, "Wall left", fontsize=10)
-        ax.text((-7.2 + 7.2 / 2 + 0.5)*10 + 298.428, (-4.5367 - (9.4620 - 1.2192))*10 + 127.295 - 5, "Wall right", fontsize=10)
+        gymnasium.plot_heatmap_lines(ax)
         return
 
     def transform_gaze_unwrapped_to_heatmap(gaze_position_unwrapped, width, height):
-        centers = gaze_position_unwrapped * 10
-        centers[0, :] += 298.428
-        centers[1, :] += 127.295
+        centers = gymnasium.to_heatmap_pixels(gaze_position_unwrapped)
 
         scale = 5
         gaussians = []
@@ -719,7 +649,6 @@ if TRAJECTORIES_HEATMAPS_FLAG:
         # plt.show()
         return
 
-    bound_side = 3 + 121 * 0.0254 / 2
     width_heatmap = 453
     height_heatmap = 255
 
@@ -746,7 +675,7 @@ if TRAJECTORIES_HEATMAPS_FLAG:
                         wall_index_facing_front_wall[index_4] = 5
                     if len(index_5) > 0:
                         wall_index_facing_front_wall[index_5] = 4
-                gaze_position_unwrapped = unwrap_gaze_positions(SPGO, wall_index_facing_front_wall, bound_side)
+                gaze_position_unwrapped = unwrap_gaze_positions(SPGO, wall_index_facing_front_wall, gymnasium)
                 heatmap_unwraped += transform_gaze_unwrapped_to_heatmap(gaze_position_unwrapped, width_heatmap, height_heatmap)
                 fixation_index = trajectories_table[k][8].astype(bool)
                 heatmap_unwraped_fixations += transform_gaze_unwrapped_to_heatmap(gaze_position_unwrapped[:, fixation_index], width_heatmap, height_heatmap)
@@ -7,47 +7,15 @@ import biorbd
 import math
 import scipy.io as sio
 import pickle
+import os
+import sys
 from IPython import embed
+sys.path.append('metrics/')
+from xsens_trial import XsensTrial
+from xsens_trial_store import get_store_name, convert_mat_directory_to_store
 
 
 
-def load_xsens(file_dir, xsens_file_name):
-    """
-    This function loads the xsens data which were exported using Xsens .mvnx and unpacked with the Matlab code main_gaze_mapping.m.
-    """
-
-    # Order of the links between the points (joint coordinates system) provided by Xsens
-    links = np.array([[0, 1],
-                      [1, 2],
-                      [2, 3],
-                      [3, 4],
-                      [4, 5],
-                      [5, 6],
-                      [4, 7],
-                      [7, 8],
-                      [8, 9],
-                      [9, 10],
-                      [4, 11],
-                      [11, 12],
-                      [12, 13],
-                      [13, 14],
-                      [0, 15],
-                      [15, 16],
-                      [16, 17],
-                      [17, 18],
-                      [0, 19],
-                      [19, 20],
-                      [20, 21],
-                      [21, 22]])
-
-    Xsens_position = sio.loadmat(file_dir + xsens_file_name + '/' + "position.mat")["position"]
-    Xsens_orientation = sio.loadmat(file_dir + xsens_file_name + '/' + "orientation_original_file_with_head_sideways.mat")["orientation"]
-
-    num_joints = int(round(np.shape(Xsens_position)[1]) / 3)
-
-    return Xsens_position, Xsens_orientation, links, num_joints
-
-
 def Xsens_quat_to_orientation(
         Xsens_orientation,
         Xsens_position,
@@ -262,7 +230,11 @@ xsens_file_name = "AnBe_16"
 # frame_range = range(250, 450)  # Synchro clap Xsens frames
 head_orientation_zero_frame = 310
 xsens_file_dir = f"/home/charbie/disk/Eye-tracking/XsensData/{xsens_file_name[:4]}/exports_shoulder_height/"
-Xsens_position, Xsens_orientation, links, num_joints = load_xsens(xsens_file_dir, xsens_file_name)
+xsens_trial = XsensTrial(xsens_file_dir, xsens_file_name, orientation_file_name="orientation_original_file_with_head_sideways")
+Xsens_position = xsens_trial.position
+Xsens_orientation = xsens_trial.orientation
+links = xsens_trial.links
+num_joints = xsens_trial.num_joints
 
 if not FIND_FRAMES_CLAP_FLAG:
     rotation_nothing = biorbd.Rotation.fromEulerAngles(np.array([0, 0, 0]), "xyz").to_array()
@@ -293,6 +265,9 @@ if not FIND_FRAMES_CLAP_FLAG:
         new_Xsens_orientation["orientation"][i, 24:28] = New_quaternion_head
 
     sio.savemat(f"/home/charbie/disk/Eye-tracking/XsensData/{xsens_file_name[:4]}/exports_shoulder_height/{xsens_file_name}/orientation.mat", new_Xsens_orientation)
+    # The single file store (if any) must contain the corrected orientation
+    if os.path.exists(get_store_name(xsens_file_dir, xsens_file_name)):
+        convert_mat_directory_to_store(xsens_file_dir, xsens_file_name)
 else:
     RotMat_head_orientation_zero = None
 
@@ -1,4 +1,3 @@
-import biorbd
 import numpy as np
 import matplotlib.pyplot as plt
 import pickle
@@ -8,11 +7,29 @@ import mpl_toolkits.mplot3d.axes3d as p3
 import matplotlib.animation as animation
 import itertools
 from operator import itemgetter
-from gaze_position_gymnasium import get_gaze_position_from_intersection
+from gaze_position_gymnasium import Gymnasium
 from sync_jump import moving_average
+from closest_index import find_closest_index
+from interval_membership import index_to_segments
 
 
-def Xsens_quat_to_orientation(
+def quaternion_to_rotation_matrix(quat):
+    """
+    This function converts quaternions (..., 4) (w, x, y, z) into rotation matrices (..., 3, 3) like
+    biorbd.Quaternion.toMatrix.
+    """
+    w, x, y, z = np.moveaxis(quat, -1, 0)
+    return np.stack(
+        (
+            np.stack((1 - 2 * y * y - 2 * z * z, 2 * x * y - 2 * w * z, 2 * x * z + 2 * w * y), axis=-1),
+            np.stack((2 * x * y + 2 * w * z, 1 - 2 * x * x - 2 * z * z, 2 * y * z - 2 * w * x), axis=-1),
+            np.stack((2 * x * z - 2 * w * y, 2 * y * z + 2 * w * x, 1 - 2 * x * x - 2 * y * y), axis=-1),
+        ),
+        axis=-2,
+    )
+
+
+def Xsens_quat_to_orientation_batch(
         Xsens_orientation,
         Xsens_position,
         elevation,
@@ -22,57 +39,52 @@ def Xsens_quat_to_orientation(
 ):
     """
     This function computes the orientation of the head, the eye and the gaze orientation in the global coordinate system
-    and relative to each other.
+    and relative to each other, for all the frames at once (the outputs are stacked along the first axis).
     The head orientation has to be computed from the quaternion returned by Xsens since it is the end of the kinematic
-    chain.
+    chain. The rotation matrices and Euler angles are computed on the arrays with the same conventions as biorbd
+    (toEulerAngles 'xyz' for the head and 'zy' for the neck, fromEulerAngles 'zy' for the gaze).
     """
-    Xsens_head_position_calculated = np.zeros((6,))
-    Xsens_orthogonal_thorax_position = np.zeros((6,))
-    Xsens_orthogonal_head_position = np.zeros((6,))
-    Quat_normalized_head = Xsens_orientation[24:28] / np.linalg.norm(
-        Xsens_orientation[24:28]
-    )
-    Quat_normalized_thorax = Xsens_orientation[16:20] / np.linalg.norm(
-        Xsens_orientation[16:20]
-    )
-    Quat_head = biorbd.Quaternion(Quat_normalized_head[0], Quat_normalized_head[1], Quat_normalized_head[2],
-                                  Quat_normalized_head[3])
-    Quat_thorax = biorbd.Quaternion(Quat_normalized_thorax[0], Quat_normalized_thorax[1], Quat_normalized_thorax[2],
-                                    Quat_normalized_thorax[3])
-    RotMat_head = biorbd.Quaternion.toMatrix(Quat_head)
-    EulAngles_head_global = biorbd.Rotation.toEulerAngles(RotMat_head, 'xyz').to_array()
-    RotMat_head = biorbd.Quaternion.toMatrix(Quat_head).to_array()
-    RotMat_thorax = biorbd.Quaternion.toMatrix(Quat_thorax).to_array()
-
-    Xsens_head_position_calculated[:3] = Xsens_position[18:21]
-    Xsens_head_position_calculated[3:] = (
-            RotMat_head @ np.array([0, 0, 0.1]) + Xsens_position[18:21]
-    )
+    nb_frames = np.shape(Xsens_orientation)[0]
+    Xsens_head_position_calculated = np.zeros((nb_frames, 6))
+    Xsens_orthogonal_thorax_position = np.zeros((nb_frames, 6))
+    Xsens_orthogonal_head_position = np.zeros((nb_frames, 6))
+
+    Quat_normalized_head = Xsens_orientation[:, 24:28] / np.linalg.norm(Xsens_orientation[:, 24:28], axis=1)[:, np.newaxis]
+    Quat_normalized_thorax = Xsens_orientation[:, 16:20] / np.linalg.norm(Xsens_orientation[:, 16:20], axis=1)[:, np.newaxis]
+    RotMat_head = quaternion_to_rotation_matrix(Quat_normalized_head)
+    RotMat_thorax = quaternion_to_rotation_matrix(Quat_normalized_thorax)
+    EulAngles_head_global = np.vstack(
+        (
+            np.arctan2(-RotMat_head[:, 1, 2], RotMat_head[:, 2, 2]),
+            np.arcsin(RotMat_head[:, 0, 2]),
+            np.arctan2(-RotMat_head[:, 0, 1], RotMat_head[:, 0, 0]),
+        )
+    ).T
 
-    Xsens_orthogonal_thorax_position[:3] = Xsens_position[12:15]
-    Xsens_orthogonal_thorax_position[3:] = (
-            RotMat_head @ np.array([0.1, 0, 0]) + Xsens_position[12:15]
-    )
+    Xsens_head_position_calculated[:, :3] = Xsens_position[:, 18:21]
+    Xsens_head_position_calculated[:, 3:] = RotMat_head @ np.array([0, 0, 0.1]) + Xsens_position[:, 18:21]
 
-    Xsens_orthogonal_head_position[:3] = Xsens_position[18:21]
-    Xsens_orthogonal_head_position[3:] = (
-            RotMat_head @ np.array([0.1, 0, 0]) + Xsens_position[18:21]
-    )
+    Xsens_orthogonal_thorax_position[:, :3] = Xsens_position[:, 12:15]
+    Xsens_orthogonal_thorax_position[:, 3:] = RotMat_head @ np.array([0.1, 0, 0]) + Xsens_position[:, 12:15]
 
-    eye_position = (
-            RotMat_head @ np.array([eye_position_depth, 0, eye_position_height])
-            + Xsens_position[18:21]
-    )
-    gaze_rotMat = biorbd.Rotation.fromEulerAngles(np.array([azimuth, elevation]), "zy").to_array()
+    Xsens_orthogonal_head_position[:, :3] = Xsens_position[:, 18:21]
+    Xsens_orthogonal_head_position[:, 3:] = RotMat_head @ np.array([0.1, 0, 0]) + Xsens_position[:, 18:21]
+
+    eye_position = RotMat_head @ np.array([eye_position_depth, 0, eye_position_height]) + Xsens_position[:, 18:21]
+
+    # fromEulerAngles([azimuth, elevation], "zy") = Rz(azimuth) @ Ry(elevation)
+    cos_azimuth, sin_azimuth = np.cos(azimuth), np.sin(azimuth)
+    cos_elevation, sin_elevation = np.cos(elevation), np.sin(elevation)
+    gaze_rotMat = np.zeros((nb_frames, 3, 3))
+    gaze_rotMat[:, 0, :] = np.vstack((cos_azimuth * cos_elevation, -sin_azimuth, cos_azimuth * sin_elevation)).T
+    gaze_rotMat[:, 1, :] = np.vstack((sin_azimuth * cos_elevation, cos_azimuth, sin_azimuth * sin_elevation)).T
+    gaze_rotMat[:, 2, :] = np.vstack((-sin_elevation, np.zeros((nb_frames, )), cos_elevation)).T
     gaze_orientation = gaze_rotMat @ RotMat_head @ np.array([10, 0, 0]) + eye_position
 
     RotMat_between = np.linalg.inv(RotMat_thorax) @ RotMat_head
-    EulAngles_neck = biorbd.Rotation.toEulerAngles(
-        biorbd.Rotation(RotMat_between[0, 0], RotMat_between[0, 1], RotMat_between[0, 2],
-                        RotMat_between[1, 0], RotMat_between[1, 1], RotMat_between[1, 2],
-                        RotMat_between[2, 0], RotMat_between[2, 1], RotMat_between[2, 2]), 'zy').to_array()
+    EulAngles_neck = np.vstack((np.arcsin(RotMat_between[:, 1, 0]), -np.arcsin(RotMat_between[:, 2, 0]))).T
 
-    return Xsens_head_position_calculated, eye_position, gaze_orientation, EulAngles_head_global, EulAngles_neck, Xsens_orthogonal_thorax_position, Xsens_orthogonal_head_position  # EulAngles_neck_xsens #
+    return Xsens_head_position_calculated, eye_position, gaze_orientation, EulAngles_head_global, EulAngles_neck, Xsens_orthogonal_thorax_position, Xsens_orthogonal_head_position
 
 
 def compute_eye_related_positions(
@@ -82,90 +94,354 @@ def compute_eye_related_positions(
         azimuth,
         eye_position_height,
         eye_position_depth,
-        bound_side,
+        gymnasium,
         facing_front_wall=False,
 ):
     """
     This function computes the position of the eye and the gaze orientation and the gaze projected on the gymnasium in
     the global coordinate system.
     """
-    Xsens_head_position_calculated = np.zeros((np.shape(Xsens_position)[0], 6))
-    Xsens_orthogonal_thorax_position = np.zeros((np.shape(Xsens_position)[0], 6))
-    Xsens_orthogonal_head_position = np.zeros((np.shape(Xsens_position)[0], 6))
-    eye_position = np.zeros((np.shape(Xsens_position)[0], 3))
-    gaze_orientation = np.zeros((np.shape(Xsens_position)[0], 3))
-    EulAngles_head_global = np.zeros((np.shape(Xsens_position)[0], 3))
-    EulAngles_neck = np.zeros((np.shape(Xsens_position)[0], 2))
-    gaze_position_temporal_evolution_projected = np.zeros((np.shape(Xsens_position)[0], 3))
-    wall_index = np.zeros((np.shape(Xsens_position)[0], 3))
-
-    for i_time in range(len(Xsens_orientation)):
-        (
-            Xsens_head_position_calculated[i_time, :],
-            eye_position[i_time, :],
-            gaze_orientation[i_time, :],
-            EulAngles_head_global[i_time, :],
-            EulAngles_neck[i_time, :],
-            Xsens_orthogonal_thorax_position[i_time, :],
-            Xsens_orthogonal_head_position[i_time, :],
-        ) = Xsens_quat_to_orientation(
-            Xsens_orientation[i_time, :],
-            Xsens_position[i_time, :],
-            elevation[i_time],
-            azimuth[i_time],
-            eye_position_height,
-            eye_position_depth,
-        )
-        gaze_position_temporal_evolution_projected[i_time, :], wall_index[i_time, :] = get_gaze_position_from_intersection(
-            eye_position[i_time, :], gaze_orientation[i_time, :], bound_side, facing_front_wall
-        )
+    (
+        Xsens_head_position_calculated,
+        eye_position,
+        gaze_orientation,
+        EulAngles_head_global,
+        EulAngles_neck,
+        Xsens_orthogonal_thorax_position,
+        Xsens_orthogonal_head_position,
+    ) = Xsens_quat_to_orientation_batch(
+        Xsens_orientation,
+        Xsens_position,
+        elevation,
+        azimuth,
+        eye_position_height,
+        eye_position_depth,
+    )
+
+    gaze_position_temporal_evolution_projected, wall_index_per_sample = gymnasium.project_gaze(
+        eye_position, gaze_orientation, facing_front_wall
+    )
+    wall_index = np.repeat(wall_index_per_sample[:, np.newaxis], 3, axis=1)
 
     return Xsens_head_position_calculated, eye_position, gaze_orientation, gaze_position_temporal_evolution_projected, wall_index, EulAngles_head_global, EulAngles_neck, Xsens_orthogonal_thorax_position, Xsens_orthogonal_head_position
 
 
-def identify_fixations(time_vector_pupil, gaze_position_temporal_evolution_projected, eye_position, wall_index, folder_name):
+def fixation_window_ends(time_vector_pupil, window_start, duration_threshold):
     """
-    This function identifies the fixations based on an angle threshold of 5 degrees which is projected on the gymnasium
-    to be converted in a distance threshold.
-    We consider that if all the points in a window of 40 ms are within the threshold, then it is a fixation.
+    This function returns the end of the sliding windows of duration_threshold starting at window_start: the sample
+    closest to the start + duration_threshold (sorted search).
+    """
+    window_end = find_closest_index(time_vector_pupil, time_vector_pupil[window_start] + duration_threshold)
+    window_end[time_vector_pupil[window_end] - duration_threshold < 0] += 1
+    return window_end
+
+
+def fixation_windows(time_vector_pupil, duration_threshold):
+    """
+    This function returns the sliding windows of duration_threshold used to detect the fixations: one window starting at
+    each sample until duration_threshold before the end of the trial (see fixation_window_ends). The samples
+    window_start to last_sample (included) are in the window, and the samples window_start to window_end (excluded) are
+    labeled if the window is a fixation candidate.
+    """
+    nb_samples = len(time_vector_pupil)
+    last_index = find_closest_index(time_vector_pupil, [time_vector_pupil[-1] - duration_threshold])[0]
+    window_start = np.arange(last_index)
+    window_end = fixation_window_ends(time_vector_pupil, window_start, duration_threshold)
+    last_sample = np.minimum(window_end, nb_samples - 1)
+    return window_start, window_end, last_sample
+
+
+def window_sums(data, window_start, last_sample):
+    """
+    This function computes the sum of data (frames x channels) in each window with cumulative sums.
+    """
+    cumsum_data = np.vstack((np.zeros((1, np.shape(data)[1])), np.cumsum(data, axis=0)))
+    return cumsum_data[last_sample + 1] - cumsum_data[window_start]
+
+
+def window_samples_index(window_start, last_sample):
+    """
+    This function returns the index of the samples of each window (windows x longest window), the shorter windows
+    repeat their last sample.
+    """
+    longest_window = np.max(last_sample - window_start + 1)
+    return np.minimum(window_start[:, np.newaxis] + np.arange(longest_window), last_sample[:, np.newaxis])
+
+
+def candidate_windows_to_index(nb_samples, window_start, window_end, is_candidate):
+    """
+    This function labels (1) the samples window_start to window_end (excluded) of each candidate window and (0) the
+    others.
+    """
+    index = np.zeros((nb_samples,))
+    window_limits = np.zeros((nb_samples + 2,), dtype=int)
+    np.add.at(window_limits, window_start[is_candidate], 1)
+    np.add.at(window_limits, window_end[is_candidate], -1)
+    index[np.cumsum(window_limits)[:nb_samples] > 0] = 1
+    return index
+
+
+def sliding_window_fixation_candidates(time_vector_pupil, gaze_position_temporal_evolution_projected, eye_position, angle_threshold, duration_threshold):
+    """
+    This function labels (1) the samples which are in at least one window of duration_threshold where all the gaze
+    points are within the angle_threshold (projected on the gymnasium as a distance threshold from the mean gaze
+    position) and (0) the others.
+    The window ends are found with a sorted search, the window means with cumulative sums and the largest deviation
+    of each window from its mean on the whole array at once (instead of one window at a time).
+    A window containing a nan is never a fixation candidate.
+    """
+    nb_samples = len(time_vector_pupil)
+    window_start, window_end, last_sample = fixation_windows(time_vector_pupil, duration_threshold)
+    if len(window_start) == 0:
+        return np.zeros((nb_samples,))
+    nb_samples_in_window = (last_sample - window_start + 1)[:, np.newaxis]
+
+    is_nan = np.any(np.isnan(gaze_position_temporal_evolution_projected), axis=1) | np.any(np.isnan(eye_position), axis=1)
+    gaze_position = np.where(is_nan[:, np.newaxis], 0, gaze_position_temporal_evolution_projected)
+    has_nan = window_sums(is_nan[:, np.newaxis], window_start, last_sample)[:, 0] > 0
+    mean_gaze_position = window_sums(gaze_position, window_start, last_sample) / nb_samples_in_window
+    mean_eye_position = window_sums(np.where(is_nan[:, np.newaxis], 0, eye_position), window_start, last_sample) / nb_samples_in_window
+    position_threshold = np.tan(angle_threshold) * np.linalg.norm(mean_eye_position - mean_gaze_position, axis=1)
+
+    # Largest deviation from the mean in each window
+    window_samples = window_samples_index(window_start, last_sample)
+    max_gaze_position = np.max(gaze_position[window_samples], axis=1)
+    min_gaze_position = np.min(gaze_position[window_samples], axis=1)
+    max_deviation = np.max(np.maximum(max_gaze_position - mean_gaze_position, mean_gaze_position - min_gaze_position), axis=1)
+    is_candidate = ~has_nan & (max_deviation < position_threshold)
+
+    return candidate_windows_to_index(nb_samples, window_start, window_end, is_candidate)
+
+
+def gaze_directions(eye_position, gaze_orientation):
+    """
+    This function computes the unit vectors of the gaze direction in the global coordinate system.
+    """
+    gaze_direction = gaze_orientation - eye_position
+    return gaze_direction / np.linalg.norm(gaze_direction, axis=1)[:, np.newaxis]
+
+
+def gaze_angular_velocity(time_vector_pupil, gaze_direction):
+    """
+    This function computes the angular velocity (rad/s) of the gaze between each pair of consecutive samples
+    (nan if one of the two directions is nan).
+    """
+    cross_product = np.cross(gaze_direction[:-1, :], gaze_direction[1:, :])
+    dot_product = np.sum(gaze_direction[:-1, :] * gaze_direction[1:, :], axis=1)
+    angle = np.arctan2(np.linalg.norm(cross_product, axis=1), dot_product)
+    return angle / (time_vector_pupil[1:] - time_vector_pupil[:-1])
+
+
+def close_fixation_blocks(time_vector_pupil, fixation_idx_candidates, state, last_chunk):
+    """
+    This function returns the blocks of consecutive fixation candidates which are closed in this chunk: start index,
+    end index (excluded) and duration (global index since the first chunk). time_vector_pupil starts at the sample
+    state["first_index"] and fixation_idx_candidates are the final labels of its first samples.
+    A block still open at the end of the chunk is kept in state (start index and time) and closed in the next chunks, or
+    at the last sample if last_chunk is True (as in index_to_segments).
+    """
+    nb_labels = len(fixation_idx_candidates)
+    is_open = state["block_start"] is not None
+    padded_index = np.hstack((int(is_open), (np.asarray(fixation_idx_candidates) == 1).astype(int), 0))
+    diff_index = padded_index[1:] - padded_index[:-1]
+    local_starts = np.where(diff_index == 1)[0]
+    local_ends = np.where(diff_index == -1)[0]
+
+    fixation_blocks_start = state["first_index"] + local_starts
+    start_times = time_vector_pupil[local_starts]
+    if is_open:
+        fixation_blocks_start = np.hstack((state["block_start"], fixation_blocks_start))
+        start_times = np.hstack((state["block_start_time"], start_times))
+
+    state["block_start"] = None
+    state["block_start_time"] = None
+    if not last_chunk and len(local_ends) > 0 and local_ends[-1] == nb_labels:
+        state["block_start"] = fixation_blocks_start[-1]
+        state["block_start_time"] = start_times[-1]
+        fixation_blocks_start = fixation_blocks_start[:-1]
+        start_times = start_times[:-1]
+        local_ends = local_ends[:-1]
+
+    fixation_blocks_end = state["first_index"] + local_ends
+    fixation_blocks_duration = time_vector_pupil[np.minimum(local_ends, len(time_vector_pupil) - 1)] - start_times
+    return fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration
+
+
+def new_fixation_detection_state():
+    """
+    This function returns the state to give with the first chunk of data to the streaming fixation detections
+    (identify_fixation_blocks_velocity_chunk and identify_fixation_blocks_dispersion_chunk): the samples kept from the
+    previous chunks, the global index of the first of them, the fixation block which is still open and the end of the
+    last candidate window.
+    """
+    return {
+        "time": np.zeros((0,)),
+        "gaze_direction": np.zeros((0, 3)),
+        "first_index": 0,
+        "block_start": None,
+        "block_start_time": None,
+        "covered_until": 0,
+    }
+
+
+def identify_fixation_blocks_velocity_chunk(
+        time_chunk,
+        gaze_direction_chunk,
+        state=None,
+        velocity_threshold=30 * np.pi / 180,
+        duration_threshold=0.04,
+        last_chunk=False,
+):
+    """
+    This function identifies the fixations with a velocity threshold (I-VT) on the gaze direction unit vectors, on a
+    chunk of data.
+    The samples from which the gaze moves slower than velocity_threshold (rad/s) until the next sample are fixation
+    candidates, and the blocks of candidates lasting at least duration_threshold are fixations.
+    Only the last sample (and the fixation block still open) is kept in state for the next chunk.
+    Returns the start index, end index (excluded) and duration of the fixations closed in this chunk (global index
+    since the first chunk) and the state to give with the next chunk. The fixations of the whole trial are the same
+    whatever the chunks.
+    """
+    if state is None:
+        state = new_fixation_detection_state()
+    time_vector_pupil = np.hstack((state["time"], time_chunk))
+    gaze_direction = np.vstack((state["gaze_direction"], np.reshape(gaze_direction_chunk, (-1, 3))))
+
+    # The label of the last sample depends on the next one (0 at the end of the trial)
+    fixation_idx_candidates = (gaze_angular_velocity(time_vector_pupil, gaze_direction) < velocity_threshold).astype(float)
+    if last_chunk:
+        fixation_idx_candidates = np.hstack((fixation_idx_candidates, 0))
+    fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration = close_fixation_blocks(
+        time_vector_pupil, fixation_idx_candidates, state, last_chunk
+    )
+
+    nb_final = len(fixation_idx_candidates)
+    state["first_index"] += nb_final
+    state["time"] = time_vector_pupil[nb_final:]
+    state["gaze_direction"] = gaze_direction[nb_final:]
+    is_long_enough = fixation_blocks_duration >= duration_threshold
+    return fixation_blocks_start[is_long_enough], fixation_blocks_end[is_long_enough], fixation_blocks_duration[is_long_enough], state
+
+
+def identify_fixation_blocks_velocity(time_vector_pupil, gaze_direction, velocity_threshold=30 * np.pi / 180, duration_threshold=0.04):
+    """
+    This function identifies the fixations of a whole trial with a velocity threshold (I-VT), see
+    identify_fixation_blocks_velocity_chunk.
+    Returns the start index, end index (excluded) and duration of each fixation.
+    """
+    fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration, _ = identify_fixation_blocks_velocity_chunk(
+        time_vector_pupil, gaze_direction, None, velocity_threshold, duration_threshold, last_chunk=True
+    )
+    return fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration
+
+
+def dispersion_candidate_windows(gaze_direction, window_start, last_sample, dispersion_threshold):
+    """
+    This function tests if all the gaze directions of each window are within dispersion_threshold (rad) of the mean
+    gaze direction of the window (a window containing a nan is never a candidate).
+    The sums are computed on the samples of each window (not with cumulative sums), so that the result does not depend
+    on the first sample of gaze_direction.
+    """
+    window_samples = window_samples_index(window_start, last_sample)
+    is_in_window = window_start[:, np.newaxis] + np.arange(np.shape(window_samples)[1]) <= last_sample[:, np.newaxis]
+    window_directions = np.where(is_in_window[:, :, np.newaxis], gaze_direction[window_samples], 0)
+    has_nan = np.any(np.isnan(window_directions), axis=(1, 2))
+    mean_gaze_direction = np.sum(window_directions, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_gaze_direction = mean_gaze_direction / np.linalg.norm(mean_gaze_direction, axis=1)[:, np.newaxis]
+
+    # Largest angle between the gaze directions and the mean gaze direction in each window
+    min_dot_product = np.min(np.einsum("wsi,wi->ws", gaze_direction[window_samples], mean_gaze_direction), axis=1)
+    max_angle = np.arccos(np.clip(min_dot_product, -1.0, 1.0))
+    return ~has_nan & (max_angle < dispersion_threshold)
+
+
+def identify_fixation_blocks_dispersion_chunk(
+        time_chunk,
+        gaze_direction_chunk,
+        state=None,
+        dispersion_threshold=2.5 * np.pi / 180,
+        duration_threshold=0.04,
+        last_chunk=False,
+):
+    """
+    This function identifies the fixations with a dispersion threshold (I-DT) on the gaze direction unit vectors, on a
+    chunk of data.
+    A window of duration_threshold is a fixation candidate if all the gaze directions are within dispersion_threshold
+    (rad) of the mean gaze direction of the window. The consecutive candidate windows are merged in fixations.
+    A window is only tested once it is sure that it is not one of the last duration_threshold of the trial (a later
+    sample is at least duration_threshold before the last sample received) and all its samples were received. The
+    samples of the windows which are not tested yet (about duration_threshold of data) are kept in state for the next
+    chunk.
+    Returns the start index, end index (excluded) and duration of the fixations closed in this chunk (global index
+    since the first chunk) and the state to give with the next chunk. The fixations of the whole trial are the same
+    whatever the chunks.
+    """
+    if state is None:
+        state = new_fixation_detection_state()
+    time_vector_pupil = np.hstack((state["time"], time_chunk))
+    gaze_direction = np.vstack((state["gaze_direction"], np.reshape(gaze_direction_chunk, (-1, 3))))
+    nb_samples = len(time_vector_pupil)
+
+    if nb_samples == 0:
+        nb_windows = 0
+    elif last_chunk:
+        nb_windows = find_closest_index(time_vector_pupil, [time_vector_pupil[-1] - duration_threshold])[0]
+    else:
+        # The windows starting before a sample which is duration_threshold before the last sample received
+        nb_before_limit = np.searchsorted(time_vector_pupil, time_vector_pupil[-1] - duration_threshold, side="right")
+        nb_windows = 0
+        if nb_before_limit > 0:
+            nb_windows = np.searchsorted(time_vector_pupil, time_vector_pupil[nb_before_limit - 1], side="left")
+    window_start = np.arange(nb_windows)
+    window_end = fixation_window_ends(time_vector_pupil, window_start, duration_threshold)
+    if not last_chunk:
+        # ... which were completely received
+        nb_windows = int(np.sum(np.cumprod(window_end <= nb_samples - 1)))
+        window_start = window_start[:nb_windows]
+        window_end = window_end[:nb_windows]
+    last_sample = np.minimum(window_end, nb_samples - 1)
+
+    # The candidate windows of the previous chunks can cover the first samples
+    fixation_idx_candidates = np.zeros((nb_samples,))
+    fixation_idx_candidates[: max(state["covered_until"] - state["first_index"], 0)] = 1
+    if nb_windows > 0:
+        is_candidate = dispersion_candidate_windows(gaze_direction, window_start, last_sample, dispersion_threshold)
+        fixation_idx_candidates[candidate_windows_to_index(nb_samples, window_start, window_end, is_candidate) == 1] = 1
+        if np.any(is_candidate):
+            state["covered_until"] = max(state["covered_until"], state["first_index"] + np.max(window_end[is_candidate]))
+
+    # The labels of the samples before the first window which is not tested yet are final
+    nb_final = nb_samples if last_chunk else nb_windows
+    fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration = close_fixation_blocks(
+        time_vector_pupil, fixation_idx_candidates[:nb_final], state, last_chunk
+    )
+
+    state["first_index"] += nb_final
+    state["time"] = time_vector_pupil[nb_final:]
+    state["gaze_direction"] = gaze_direction[nb_final:]
+    return fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration, state
+
+
+def identify_fixation_blocks_dispersion(time_vector_pupil, gaze_direction, dispersion_threshold=2.5 * np.pi / 180, duration_threshold=0.04):
+    """
+    This function identifies the fixations of a whole trial with a dispersion threshold (I-DT), see
+    identify_fixation_blocks_dispersion_chunk.
+    Returns the start index, end index (excluded) and duration of each fixation.
+    """
+    fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration, _ = identify_fixation_blocks_dispersion_chunk(
+        time_vector_pupil, gaze_direction, None, dispersion_threshold, duration_threshold, last_chunk=True
+    )
+    return fixation_blocks_start, fixation_blocks_end, fixation_blocks_duration
+
+
+def fixation_blocks_metrics(time_vector_pupil, gaze_position_temporal_evolution_projected, eye_position, wall_index, fixation_blocks_start, fixation_blocks_end, folder_name):
+    """
+    This function computes the fixation metrics (position on the gymnasium, timing, durations and quiet eye) from the
+    fixation blocks (start index, end index excluded) of any fixation detection algorithm.
+    The fixations which are not within 10 degrees of their mean position are plotted as gliding fixations.
     """
     treshold_block = 10 * np.pi / 180  # Only for plotting the gliding fixations
-    treshold_detection = 2.5 * np.pi / 180  # Real fixation threshold
-    duration_threshold = 0.04
-    
-    fixation_timing_candidates = np.array([])
-    fixation_timing_candidates_start = np.array([])
-    fixation_timing_candidates_end = np.array([])
-    last_index = np.argmin(np.abs((time_vector_pupil[-1] - duration_threshold) - time_vector_pupil))
-    for i in range(last_index):
-        ms_40_idx = np.argmin(np.abs((time_vector_pupil[i] + duration_threshold) - time_vector_pupil))
-        if time_vector_pupil[ms_40_idx] - duration_threshold < 0:
-            ms_40_idx += 1
-        current_time = np.mean(time_vector_pupil[i: ms_40_idx + 1])
-        mean_gaze_position_temporal_evolution_projected = np.mean(gaze_position_temporal_evolution_projected[i: ms_40_idx + 1, :], axis=0)
-        mean_eye_position = np.mean(eye_position[i: ms_40_idx + 1, :], axis=0)
-        position_threshold = np.tan(treshold_detection) * np.linalg.norm(mean_eye_position - mean_gaze_position_temporal_evolution_projected)
-
-        if np.all(np.abs(gaze_position_temporal_evolution_projected[i: ms_40_idx + 1, :] - mean_gaze_position_temporal_evolution_projected) < position_threshold):
-            if len(fixation_timing_candidates) == 0:
-                fixation_timing_candidates = np.array([current_time])
-                fixation_timing_candidates_start = np.array([i])
-                fixation_timing_candidates_end = np.array([ms_40_idx])
-            else:
-                fixation_timing_candidates = np.vstack((fixation_timing_candidates, current_time))
-                fixation_timing_candidates_start = np.vstack((fixation_timing_candidates_start, i))
-                fixation_timing_candidates_end = np.vstack((fixation_timing_candidates_end, ms_40_idx))
-    fixation_idx_candidates = np.zeros((len(time_vector_pupil),))
-    for i in range(len(fixation_timing_candidates_start)):
-        fixation_idx_candidates[int(fixation_timing_candidates_start[i]): int(fixation_timing_candidates_end[i])] = 1
-    diff_index = fixation_idx_candidates[1:] - fixation_idx_candidates[:-1]
-
-    fixation_blocks_start = np.where(diff_index == 1)[0] + 1
-    fixation_blocks_end = np.where(diff_index == -1)[0] + 1
-    if fixation_idx_candidates[0] == 1.0:
-        fixation_blocks_start = np.hstack((0, fixation_blocks_start))
-    if fixation_idx_candidates[-1] == 1.0:
-        fixation_blocks_end = np.hstack((fixation_blocks_start, len(fixation_idx_candidates) - 1))
 
     fixation_positions = np.array([])
     fixation_timing = [np.array([]) for _ in range(len(fixation_blocks_start))]
@@ -230,6 +506,71 @@ def identify_fixations(time_vector_pupil, gaze_position_temporal_evolution_proje
     return fixation_positions, fixation_timing, position_threshold_block, wall_index_block, fixation_index, fixation_duration_absolute, fixation_duration_relative, quiet_eye_duration_absolute, quiet_eye_duration_relative, number_of_fixation, quiet_eye_onset_relative
 
 
+def identify_fixations(time_vector_pupil, gaze_position_temporal_evolution_projected, eye_position, wall_index, folder_name):
+    """
+    This function identifies the fixations based on an angle threshold of 5 degrees which is projected on the gymnasium
+    to be converted in a distance threshold.
+    We consider that if all the points in a window of 40 ms are within the threshold, then it is a fixation.
+    """
+    treshold_detection = 2.5 * np.pi / 180  # Real fixation threshold
+    duration_threshold = 0.04
+
+    fixation_idx_candidates = sliding_window_fixation_candidates(
+        time_vector_pupil, gaze_position_temporal_evolution_projected, eye_position, treshold_detection, duration_threshold
+    )
+    fixation_blocks_start, fixation_blocks_end, _ = index_to_segments(time_vector_pupil, fixation_idx_candidates)
+
+    return fixation_blocks_metrics(
+        time_vector_pupil,
+        gaze_position_temporal_evolution_projected,
+        eye_position,
+        wall_index,
+        fixation_blocks_start,
+        fixation_blocks_end,
+        folder_name,
+    )
+
+
+def detect_fixations(
+        fixation_algorithm,
+        time_vector_pupil,
+        gaze_position_temporal_evolution_projected,
+        eye_position,
+        gaze_orientation,
+        wall_index,
+        folder_name,
+):
+    """
+    This function identifies the fixations with the chosen algorithm and returns the same metrics as identify_fixations.
+    fixation_algorithm is "distance" (threshold on the gaze positions projected on the gymnasium, identify_fixations),
+    "velocity" (I-VT on the gaze direction) or "dispersion" (I-DT on the gaze direction).
+    With "velocity" and "dispersion", the samples where the gaze does not hit the gymnasium are never in a fixation.
+    """
+    if fixation_algorithm == "distance":
+        return identify_fixations(
+            time_vector_pupil, gaze_position_temporal_evolution_projected, eye_position, wall_index, folder_name
+        )
+
+    gaze_direction = gaze_directions(eye_position, gaze_orientation)
+    gaze_direction[np.any(np.isnan(gaze_position_temporal_evolution_projected), axis=1), :] = np.nan
+    if fixation_algorithm == "velocity":
+        fixation_blocks_start, fixation_blocks_end, _ = identify_fixation_blocks_velocity(time_vector_pupil, gaze_direction)
+    elif fixation_algorithm == "dispersion":
+        fixation_blocks_start, fixation_blocks_end, _ = identify_fixation_blocks_dispersion(time_vector_pupil, gaze_direction)
+    else:
+        raise RuntimeError(f"fixation_algorithm {fixation_algorithm} is not implemented, use 'distance', 'velocity' or 'dispersion'")
+
+    return fixation_blocks_metrics(
+        time_vector_pupil,
+        gaze_position_temporal_evolution_projected,
+        eye_position,
+        wall_index,
+        fixation_blocks_start,
+        fixation_blocks_end,
+        folder_name,
+    )
+
+
 def find_neighbouring_candidates(time_vector_pupil, candidates, duration_threshold):
     """
     This function determines if the candidate data points form a block of consecutive data of more than the duration
@@ -617,7 +958,7 @@ def plot_gaze_trajectory(
         fixation_positions,
         fixation_timing,
         time_vector_pupil,
-        bound_side,
+        gymnasium,
         position_threshold_block,
         output_file_name,
         facing_front_wall,
@@ -628,10 +969,7 @@ def plot_gaze_trajectory(
     fig = plt.figure()
     ax = p3.Axes3D(fig)
 
-    if not facing_front_wall:
-        plot_gymnasium(bound_side, ax)
-    else:
-        plot_gymnasium_symmetrized(bound_side, ax)
+    gymnasium.plot(ax, facing_front_wall)
 
     N = len(gaze_position_temporal_evolution_projected[:, 0]) - 1
     for j in range(N):
@@ -662,142 +1000,6 @@ def plot_gaze_trajectory(
     return
 
 
-def plot_gymnasium(bound_side, ax):
-    """
-    Plot the gymnasium in 3D with the walls and trampoline bed.
-    """
-    ax.set_box_aspect([1, 1, 1])
-    ax.view_init(elev=10.0, azim=-90)
-
-    ax.set_xlim3d([-8.0, 8.0])
-    ax.set_ylim3d([-8.0, 8.0])
-    ax.set_zlim3d([-3.0, 13.0])
-    ax.set_xlabel("X")
-    ax.set_ylabel("Y")
-    ax.set_zlabel("Z")
-
-    # Front right, to front left (bottom)
-    plt.plot(np.array([7.193, 7.360]), np.array([-bound_side, bound_side]), np.array([0, 0]), "-k")
-    # Front right, to back right (bottom)
-    plt.plot(np.array([-8.881, 7.193]), np.array([-bound_side, -bound_side]), np.array([0, 0]), "-k")
-    # Front left, to back left (bottom)
-    plt.plot(np.array([-8.881, 7.360]), np.array([bound_side, bound_side]), np.array([0, 0]), "-k")
-    # Back right, to back left (bottom)
-    plt.plot(np.array([-8.881, -8.881]), np.array([-bound_side, bound_side]), np.array([0, 0]), "-k")
-
-    # Front right, to front left (ceiling)
-    plt.plot(
-        np.array([7.193, 7.360]),
-        np.array([-bound_side, bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k",
-    )
-
-    # Front right, to back right (ceiling)
-    plt.plot(
-        np.array([-8.881, 7.193]),
-        np.array([-bound_side, -bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k",
-    )
-    # Front left, to back left (ceiling)
-    plt.plot(
-        np.array([-8.881, 7.360]),
-        np.array([bound_side, bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k",
-    )
-    # Back right, to back left (ceiling)
-    plt.plot(
-        np.array([-8.881, -8.881]),
-        np.array([-bound_side, bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k",
-    )
-
-    # Front right bottom, to front right ceiling
-    plt.plot(np.array([7.193, 7.193]), np.array([-bound_side, -bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-    # Front left bottom, to front left ceiling
-    plt.plot(np.array([7.360, 7.360]), np.array([bound_side, bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-    # Back right bottom, to back right ceiling
-    plt.plot(np.array([-8.881, -8.881]), np.array([-bound_side, -bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-    # Back left bottom, to back left ceiling
-    plt.plot(np.array([-8.881, -8.881]), np.array([bound_side, bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-
-    # Trampoline
-    X, Y = np.meshgrid([-7 * 0.3048, 7 * 0.3048], [-3.5 * 0.3048, 3.5 * 0.3048])
-    Z = np.zeros(X.shape)
-    ax.plot_surface(X, Y, Z, color="k", alpha=0.4)
-    return
-
-def plot_gymnasium_symmetrized(bound_side, ax):
-    """
-    Plot the gymnasium in 3D with the walls and trampoline bed.
-    """
-    ax.set_box_aspect([1, 1, 1])
-    ax.view_init(elev=10.0, azim=-90)
-
-    ax.set_xlim3d([-8.0, 8.0])
-    ax.set_ylim3d([-8.0, 8.0])
-    ax.set_zlim3d([-3.0, 13.0])
-    ax.set_xlabel("X")
-    ax.set_ylabel("Y")
-    ax.set_zlabel("Z")
-
-    # Front right, to front left (bottom)
-    plt.plot(np.array([7.2, 7.2]), np.array([-bound_side, bound_side]), np.array([0, 0]), "-k")
-    # Front right, to back right (bottom)
-    plt.plot(np.array([-7.2, 7.2]), np.array([-bound_side, -bound_side]), np.array([0, 0]), "-k")
-    # Front left, to back left (bottom)
-    plt.plot(np.array([-7.2, 7.2]), np.array([bound_side, bound_side]), np.array([0, 0]), "-k")
-    # Back right, to back left (bottom)
-    plt.plot(np.array([-7.2, -7.2]), np.array([-bound_side, bound_side]), np.array([0, 0]), "-k")
-
-    # Front right, to front left (ceiling)
-    plt.plot(
-        np.array([7.2, 7.2]),
-        np.array([-bound_side, bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k")
-
-    # Front right, to back right (ceiling)
-    plt.plot(
-        np.array([-7.2, 7.2]),
-        np.array([-bound_side, -bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k",
-    )
-    # Front left, to back left (ceiling)
-    plt.plot(
-        np.array([-7.2, 7.2]),
-        np.array([bound_side, bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k",
-    )
-    # Back right, to back left (ceiling)
-    plt.plot(
-        np.array([-7.2, -7.2]),
-        np.array([-bound_side, bound_side]),
-        np.array([9.4620 - 1.2192, 9.4620 - 1.2192]),
-        "-k",
-    )
-
-    # Front right bottom, to front right ceiling
-    plt.plot(np.array([7.2, 7.2]), np.array([-bound_side, -bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-    # Front left bottom, to front left ceiling
-    plt.plot(np.array([7.2, 7.2]), np.array([bound_side, bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-    # Back right bottom, to back right ceiling
-    plt.plot(np.array([-7.2, -7.2]), np.array([-bound_side, -bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-    # Back left bottom, to back left ceiling
-    plt.plot(np.array([-7.2, -7.2]), np.array([bound_side, bound_side]), np.array([0, 9.4620 - 1.2192]), "-k")
-
-    # Trampoline
-    X, Y = np.meshgrid([-7 * 0.3048, 7 * 0.3048], [-3.5 * 0.3048, 3.5 * 0.3048])
-    Z = np.zeros(X.shape)
-    ax.plot_surface(X, Y, Z, color="k", alpha=0.4)
-    return
-
-
 def animate(
         time_vector_pupil,
         Xsens_orientation,
@@ -819,21 +1021,22 @@ def animate(
         FLAG_GAZE_TRAJECTORY=True,
         FLAG_GENERATE_STATS_METRICS=True,
         FLAG_PUPIL_ANGLES_PLOT=True,
+        fixation_algorithm="distance",
 ):
     """
     This function creates an animation of the athlete's body orientation and gaze orientation.
     It also creates a 3D plot of the projected gaze trajectory.
-    And it computes the gaze metrics.
+    And it computes the gaze metrics (the fixations are detected with fixation_algorithm, see detect_fixations).
     """
 
-    bound_side = 3 + 121 * 0.0254 / 2
+    gymnasium = Gymnasium()
 
     if FLAG_ANIMAITON:
         fig = plt.figure()
         ax = p3.Axes3D(fig)
         ax.set_box_aspect([1, 1, 1])
 
-        plot_gymnasium(bound_side, ax)
+        gymnasium.plot(ax)
 
         # Initialization of the figure for the animation
         CoM_point = [ax.plot(0, 0, 0, ".r")]
@@ -869,7 +1072,7 @@ def animate(
         azimuth,
         eye_position_height,
         eye_position_depth,
-        bound_side,
+        gymnasium,
         facing_front_wall=False
     )
 
@@ -891,7 +1094,7 @@ def animate(
         azimuth,
         eye_position_height,
         eye_position_depth,
-        bound_side,
+        gymnasium,
         facing_front_wall=True
     )
 
@@ -906,10 +1109,12 @@ def animate(
      quiet_eye_duration_relative,
      number_of_fixation,
      quiet_eye_onset_relative,
-     ) = identify_fixations(
+     ) = detect_fixations(
+    fixation_algorithm,
     time_vector_pupil,
     gaze_position_temporal_evolution_projected,
     eye_position,
+    gaze_orientation,
     wall_index,
     folder_name,
     )
@@ -980,7 +1185,7 @@ def animate(
             fixation_positions,
             fixation_timing,
             time_vector_pupil,
-            bound_side,
+            gymnasium,
             position_threshold_block,
             output_file_name,
             facing_front_wall=False,
@@ -991,7 +1196,7 @@ def animate(
             None,
             None,
             time_vector_pupil,
-            bound_side,
+            gymnasium,
             None,
             output_file_name[:-4] + "_facing_front_wall.png",
             facing_front_wall=True,
@@ -0,0 +1,26 @@
+import numpy as np
+
+
+def find_closest_index(sorted_vector, values):
+    """
+    This function finds the index of the closest element of sorted_vector for each element of values.
+    It gives the same result as np.argmin(np.abs(sorted_vector - value)) for each value (the first index is kept in case
+    of a tie), but with a sorted search in O(log(len(sorted_vector))) per value instead of a full scan.
+    sorted_vector must be sorted in ascending order.
+    """
+    sorted_vector = np.reshape(sorted_vector, (-1,))
+    values = np.asarray(values, dtype=float)
+
+    index_right = np.searchsorted(sorted_vector, values, side="left")
+    index_right = np.clip(index_right, 0, len(sorted_vector) - 1)
+    index_left = np.clip(index_right - 1, 0, len(sorted_vector) - 1)
+
+    distance_left = np.abs(values - sorted_vector[index_left])
+    distance_right = np.abs(values - sorted_vector[index_right])
+    closest_index = np.where(distance_left <= distance_right, index_left, index_right)
+
+    # If the same timestamp is repeated, np.argmin returns the first occurrence
+    closest_index = np.searchsorted(sorted_vector, sorted_vector[closest_index], side="left")
+    # np.argmin returns 0 when the value is nan
+    closest_index[np.isnan(values)] = 0
+    return closest_index
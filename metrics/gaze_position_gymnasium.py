@@ -1,67 +1,88 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.patches import Rectangle
 from IPython import embed
 
-def get_gaze_position_from_intersection(vector_origin, vector_end, bound_side, facing_front_wall):
-    def intersection_plane_vector(vector_origin, vector_end, planes_points, planes_normal_vector):
 
-        vector_orientation = vector_end - vector_origin
-        t = (np.dot(planes_points, planes_normal_vector) - np.dot(planes_normal_vector, vector_origin)) / np.dot(
-            vector_orientation, planes_normal_vector
-        )
-        return vector_origin + vector_orientation * np.abs(t)
-
-    def verify_intersection_position(vector_origin, vector_end, wall_index, bound_side, facing_front_wall):
-        vector_orientation = vector_end - vector_origin
-        if not facing_front_wall:
-            if wall_index == 0:  # trampoline
-                t = (0 - vector_origin[2]) / vector_orientation[2]
-            elif wall_index == 1:  # wall front
-                a = (bound_side - -bound_side) / (7.360 - 7.193)
-                b = bound_side - a * 7.360
-                t = (b + a * vector_origin[0] - vector_origin[1]) / (vector_orientation[1] - a * vector_orientation[0])
-            elif wall_index == 2:  # ceiling
-                t = (9.4620 - 1.2192 - vector_origin[2]) / vector_orientation[2]
-            elif wall_index == 3:  # wall back
-                t = (-8.881 - vector_origin[0]) / vector_orientation[0]
-            elif wall_index == 4:  # bound right
-                t = (-bound_side - vector_origin[1]) / vector_orientation[1]
-            elif wall_index == 5:  # bound left
-                t = (bound_side - vector_origin[1]) / vector_orientation[1]
+class Gymnasium:
+    """
+    Geometry of the gymnasium where the trials were recorded (in m, zero at the center of the trampoline bed, x toward
+    the front wall, y toward the left wall and z upward).
+    The planes of the walls (real gymnasium with the slanted front wall, and symmetrized box used when the athlete is
+    turned to face the front wall) and the unwrapped 2D layout are computed once and reused for the gaze projection,
+    the plots and the heatmaps.
+    """
+
+    def __init__(
+            self,
+            front_wall_right=7.193,
+            front_wall_left=7.360,
+            back_wall=-8.881,
+            ceiling=9.4620 - 1.2192,
+            bound_side=3 + 121 * 0.0254 / 2,
+            symmetrized_wall=7.2,
+            trampoline_length=14 * 0.3048,
+            trampoline_width=7 * 0.3048,
+            heatmap_pixels_per_meter=10,
+            heatmap_origin=(298.428, 127.295),
+    ):
+        self.front_wall_right = front_wall_right
+        self.front_wall_left = front_wall_left
+        self.back_wall = back_wall
+        self.ceiling = ceiling
+        self.bound_side = bound_side
+        self.symmetrized_wall = symmetrized_wall
+        self.trampoline_length = trampoline_length
+        self.trampoline_width = trampoline_width
+        self.heatmap_pixels_per_meter = heatmap_pixels_per_meter
+        self.heatmap_origin = heatmap_origin
+
+        # planes_points, planes_normal_vector, plane_bounds for facing_front_wall = False / True
+        self.planes = {
+            False: self.build_planes(False),
+            True: self.build_planes(True),
+        }
+
+    def walls_x(self, facing_front_wall):
+        """
+        x of the right and left ends of the front wall and x of the back wall.
+        """
+        if facing_front_wall:
+            return self.symmetrized_wall, self.symmetrized_wall, -self.symmetrized_wall
         else:
-            if wall_index == 0:  # trampoline
-                t = (0 - vector_origin[2]) / vector_orientation[2]
-            elif wall_index == 1:  # wall front
-                t = (7.2 - vector_origin[0]) / vector_orientation[0]
-            elif wall_index == 2:  # ceiling
-                t = (9.4620 - 1.2192 - vector_origin[2]) / vector_orientation[2]
-            elif wall_index == 3:  # wall back
-                t = (-7.2 - vector_origin[0]) / vector_orientation[0]
-            elif wall_index == 4:  # bound right
-                t = (-bound_side - vector_origin[1]) / vector_orientation[1]
-            elif wall_index == 5:  # bound left
-                t = (bound_side - vector_origin[1]) / vector_orientation[1]
-        return vector_origin + vector_orientation * t
-
-    if not facing_front_wall:
+            return self.front_wall_right, self.front_wall_left, self.back_wall
+
+    def build_planes(self, facing_front_wall):
+        """
+        A point and the normal vector of each of the six planes (trampoline, wall front, ceiling, wall back,
+        bound right, bound left) and their bounds (plane x axis x [min, max]).
+        """
+        front_right, front_left, back = self.walls_x(facing_front_wall)
+        bound_side = self.bound_side
+        ceiling = self.ceiling
+
         # zero is positioned at the center of the trampoline
         planes_points = np.array(
             [
-                [7.193, bound_side, 0],  # trampoline
-                [7.193, bound_side, 0],  # wall front
-                [7.193, bound_side, 9.4620 - 1.2192],  # ceiling
-                [-8.881, bound_side, 0],  # wall back
-                [7.193, bound_side, 0],  # bound right
-                [7.360, -bound_side, 0],  # bound left
+                [front_right, bound_side, 0],  # trampoline
+                [front_right, bound_side, 0],  # wall front
+                [front_right, bound_side, ceiling],  # ceiling
+                [back, bound_side, 0],  # wall back
+                [front_right, bound_side, 0],  # bound right
+                [front_left, -bound_side, 0],  # bound left
             ]
         )
 
+        if facing_front_wall:
+            front_wall_normal = [-1, 0, 0]
+        else:
+            front_wall_normal = np.cross(
+                np.array([front_right, bound_side, 0]) - np.array([front_left, -bound_side, 0]), np.array([0, 0, -1])
+            ).tolist()
         planes_normal_vector = np.array(
             [
                 [0, 0, 1],  # trampoline
-                np.cross(
-                    np.array([7.193, bound_side, 0]) - np.array([7.360, -bound_side, 0]), np.array([0, 0, -1])
-                ).tolist(),  # wall front
+                front_wall_normal,  # wall front
                 [0, 0, -1],  # ceiling
                 [1, 0, 0],  # wall back
                 [0, 1, 0],  # bound right
@@ -69,98 +90,270 @@ def get_gaze_position_from_intersection(vector_origin, vector_end, bound_side, f
             ]
         )
 
-        plane_bounds = [
-            np.array([[-8.881, 7.360], [-bound_side, bound_side], [0, 0]]),
-            np.array([[7.193, 7.360], [-bound_side, bound_side], [0, 9.4620 - 1.2192]]),
-            np.array([[-8.881, 7.360], [-bound_side, bound_side], [9.4620 - 1.2192, 9.4620 - 1.2192]]),
-            np.array([[-8.881, -8.881], [-bound_side, bound_side], [0, 9.4620 - 1.2192]]),
-            np.array([[-8.881, 7.193], [-bound_side, -bound_side], [0, 9.4620 - 1.2192]]),
-            np.array([[-8.881, 7.360], [bound_side, bound_side], [0, 9.4620 - 1.2192]]),
-        ]
-
-    else:
-        # zero is positioned at the center of the trampoline
-        planes_points = np.array(
+        plane_bounds = np.array(
             [
-                [7.2, bound_side, 0],  # trampoline
-                [7.2, bound_side, 0],  # wall front
-                [7.2, bound_side, 9.4620 - 1.2192],  # ceiling
-                [-7.2, bound_side, 0],  # wall back
-                [7.2, bound_side, 0],  # bound right
-                [7.2, -bound_side, 0],  # bound left
+                [[back, front_left], [-bound_side, bound_side], [0, 0]],
+                [[front_right, front_left], [-bound_side, bound_side], [0, ceiling]],
+                [[back, front_left], [-bound_side, bound_side], [ceiling, ceiling]],
+                [[back, back], [-bound_side, bound_side], [0, ceiling]],
+                [[back, front_right], [-bound_side, -bound_side], [0, ceiling]],
+                [[back, front_left], [bound_side, bound_side], [0, ceiling]],
             ]
         )
+        return planes_points, planes_normal_vector, plane_bounds
 
-        planes_normal_vector = np.array(
-            [
-                [0, 0, 1],  # trampoline
-                [-1, 0, 0],  # wall front
-                [0, 0, -1],  # ceiling
-                [1, 0, 0],  # wall back
-                [0, 1, 0],  # bound right
-                [0, -1, 0],  # bound left
-            ]
+    def wall_intersection_parameter(self, vector_origins, vector_orientations, wall_index, facing_front_wall):
+        """
+        Parameter t such that vector_origin + t * vector_orientation is on the wall wall_index (N x 3 arrays and N wall
+        indices, nan if no wall).
+        """
+        front_right, front_left, back = self.walls_x(facing_front_wall)
+        t = np.full((len(vector_origins),), np.nan)
+        walls = [
+            (0, 2, 0),  # trampoline
+            (1, 0, front_right),  # wall front
+            (2, 2, self.ceiling),  # ceiling
+            (3, 0, back),  # wall back
+            (4, 1, -self.bound_side),  # bound right
+            (5, 1, self.bound_side),  # bound left
+        ]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i_wall, axis, coordinate in walls:
+                on_wall = wall_index == i_wall
+                origin = vector_origins[on_wall]
+                orientation = vector_orientations[on_wall]
+                if i_wall == 1 and front_right != front_left:
+                    # slanted front wall: y = a * x + b
+                    a = (self.bound_side - -self.bound_side) / (front_left - front_right)
+                    b = self.bound_side - a * front_left
+                    t[on_wall] = (b + a * origin[:, 0] - origin[:, 1]) / (orientation[:, 1] - a * orientation[:, 0])
+                else:
+                    t[on_wall] = (coordinate - origin[:, axis]) / orientation[:, axis]
+        return t
+
+    def project_gaze(self, vector_origins, vector_ends, facing_front_wall):
+        """
+        This function projects all the gaze vectors of a move (eye positions and gaze end points, N x 3 arrays) on the
+        gymnasium at once. A plane is hit if the intersection is in the direction of the gaze and inside the plane
+        bounds +- 1 m. When several planes are hit, the plane with the smallest bound crossing is kept (the first one
+        in case of equality).
+        Returns the projected gaze positions (N x 3) and the wall indices (N, nan when no wall is hit).
+        """
+        vector_origins = np.asarray(vector_origins, dtype=float)
+        vector_orientations = np.asarray(vector_ends, dtype=float) - vector_origins
+        planes_points, planes_normal_vector, plane_bounds = self.planes[facing_front_wall]
+        nb_planes = len(planes_points)
+
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            # Intersection of the gaze lines with all the planes (samples x planes)
+            planes_offset = np.sum(planes_points * planes_normal_vector, axis=1)
+            t = (planes_offset[np.newaxis, :] - vector_origins @ planes_normal_vector.T) / (vector_orientations @ planes_normal_vector.T)
+            potential_gaze_orientation = vector_orientations[:, np.newaxis, :] * np.abs(t)[:, :, np.newaxis]
+            intersections = vector_origins[:, np.newaxis, :] + potential_gaze_orientation
+
+            cross_condition = np.linalg.norm(np.cross(vector_orientations[:, np.newaxis, :], potential_gaze_orientation), axis=2)
+            dot_condition = np.sum(vector_orientations[:, np.newaxis, :] * potential_gaze_orientation, axis=2)
+            in_bounds = np.all(
+                (intersections > plane_bounds[np.newaxis, :, :, 0] - 1) & (intersections < plane_bounds[np.newaxis, :, :, 1] + 1),
+                axis=2,
+            )
+            is_hit = (dot_condition > 0) & (cross_condition > -0.01) & (cross_condition < 0.01) & in_bounds
+
+            # Distance outside of the plane bounds, used to choose between the planes hit
+            bound_crossing = np.zeros((len(vector_origins), nb_planes))
+            for j in range(3):
+                bound_crossing += np.maximum(plane_bounds[np.newaxis, :, j, 0] - intersections[:, :, j], 0)
+                bound_crossing += np.maximum(intersections[:, :, j] - plane_bounds[np.newaxis, :, j, 1], 0)
+        bound_crossing[~is_hit] = np.inf
+        closest_plane = np.argmin(bound_crossing, axis=1)
+
+        wall_index = np.full((len(vector_origins),), np.nan)
+        has_hit = np.any(is_hit, axis=1)
+        wall_index[has_hit] = closest_plane[has_hit]
+
+        t_wall = self.wall_intersection_parameter(vector_origins, vector_orientations, wall_index, facing_front_wall)
+        gaze_positions = vector_origins + vector_orientations * t_wall[:, np.newaxis]
+        gaze_positions[~has_hit, :] = np.nan
+        return gaze_positions, wall_index
+
+    def plot(self, ax, facing_front_wall=False):
+        """
+        Plot the gymnasium in 3D with the walls and trampoline bed.
+        """
+        ax.set_box_aspect([1, 1, 1])
+        ax.view_init(elev=10.0, azim=-90)
+
+        ax.set_xlim3d([-8.0, 8.0])
+        ax.set_ylim3d([-8.0, 8.0])
+        ax.set_zlim3d([-3.0, 13.0])
+        ax.set_xlabel("X")
+        ax.set_ylabel("Y")
+        ax.set_zlabel("Z")
+
+        front_right, front_left, back = self.walls_x(facing_front_wall)
+        bound_side = self.bound_side
+        for z in [0, self.ceiling]:
+            # Front right, to front left
+            ax.plot(np.array([front_right, front_left]), np.array([-bound_side, bound_side]), np.array([z, z]), "-k")
+            # Front right, to back right
+            ax.plot(np.array([back, front_right]), np.array([-bound_side, -bound_side]), np.array([z, z]), "-k")
+            # Front left, to back left
+            ax.plot(np.array([back, front_left]), np.array([bound_side, bound_side]), np.array([z, z]), "-k")
+            # Back right, to back left
+            ax.plot(np.array([back, back]), np.array([-bound_side, bound_side]), np.array([z, z]), "-k")
+
+        # Vertical edges (front right, front left, back right, back left)
+        for x, y in [(front_right, -bound_side), (front_left, bound_side), (back, -bound_side), (back, bound_side)]:
+            ax.plot(np.array([x, x]), np.array([y, y]), np.array([0, self.ceiling]), "-k")
+
+        # Trampoline
+        X, Y = np.meshgrid(
+            [-self.trampoline_length / 2, self.trampoline_length / 2], [-self.trampoline_width / 2, self.trampoline_width / 2]
         )
+        Z = np.zeros(X.shape)
+        ax.plot_surface(X, Y, Z, color="k", alpha=0.4)
+        return
 
-        plane_bounds = [
-            np.array([[-7.2, 7.2], [-bound_side, bound_side], [0, 0]]),
-            np.array([[7.2, 7.2], [-bound_side, bound_side], [0, 9.4620 - 1.2192]]),
-            np.array([[-7.2, 7.2], [-bound_side, bound_side], [9.4620 - 1.2192, 9.4620 - 1.2192]]),
-            np.array([[-7.2, -7.2], [-bound_side, bound_side], [0, 9.4620 - 1.2192]]),
-            np.array([[-7.2, 7.2], [-bound_side, -bound_side], [0, 9.4620 - 1.2192]]),
-            np.array([[-7.2, 7.2], [bound_side, bound_side], [0, 9.4620 - 1.2192]]),
+    def unwrap(self, gaze_position, wall_index):
+        """
+        This function unwraps the gaze positions projected on the symmetrized gymnasium (N x 3) on a 2D layout
+        (2 x N): the trampoline in the center, the front and back walls on each side along x, the ceiling after the back
+        wall, and the right and left walls on each side along y. The samples without wall index are nan.
+        """
+        gaze_position = np.asarray(gaze_position, dtype=float)
+        wall_index = np.asarray(wall_index)
+        gaze_position_x_y = np.full((2, len(wall_index)), np.nan)
+        x, y, z = gaze_position[:, 0], gaze_position[:, 1], gaze_position[:, 2]
+        layout = [
+            (x, y),  # trampoline
+            (z + self.symmetrized_wall, y),  # wall front
+            (-self.symmetrized_wall - self.ceiling - self.symmetrized_wall - x, y),  # ceiling
+            (-self.symmetrized_wall - z, y),  # wall back
+            (x, -self.bound_side - z),  # bound right
+            (x, self.bound_side + z),  # bound left
         ]
+        for i_wall, (unwrapped_x, unwrapped_y) in enumerate(layout):
+            on_wall = wall_index == i_wall
+            gaze_position_x_y[0, on_wall] = unwrapped_x[on_wall]
+            gaze_position_x_y[1, on_wall] = unwrapped_y[on_wall]
+        return gaze_position_x_y
 
+    def unwrapped_lines(self):
+        """
+        Segments ([x_start, x_end], [y_start, y_end]) drawing the walls of the unwrapped gymnasium.
+        """
+        wall = self.symmetrized_wall
+        bound_side = self.bound_side
+        ceiling = self.ceiling
+        ceiling_end = -wall - ceiling - 2 * wall
+        return [
+            # Vertical lines
+            ([ceiling_end, ceiling_end], [-bound_side, bound_side]),
+            ([-wall - ceiling, -wall - ceiling], [-bound_side, bound_side]),
+            ([-wall, -wall], [-bound_side - ceiling, bound_side + ceiling]),
+            ([wall, wall], [-bound_side - ceiling, bound_side + ceiling]),
+            ([wall + ceiling, wall + ceiling], [-bound_side, bound_side]),
+            # Horizontal lines
+            ([-wall, wall], [-bound_side - ceiling, -bound_side - ceiling]),
+            ([ceiling_end, wall + ceiling], [-bound_side, -bound_side]),
+            ([ceiling_end, wall + ceiling], [bound_side, bound_side]),
+            ([-wall, wall], [bound_side + ceiling, bound_side + ceiling]),
+        ]
 
-    intersection = []
-    wall_index = None
-    intersection_index = np.zeros((len(planes_points)))
-    for i in range(len(planes_points)):
-        current_interaction = intersection_plane_vector(
-            vector_origin, vector_end, planes_points[i, :], planes_normal_vector[i, :],
-        )
+    def unwrapped_labels(self):
+        """
+        Position ([x, y]) of the name of each wall on the unwrapped gymnasium.
+        """
+        wall = self.symmetrized_wall
+        bound_side = self.bound_side
+        ceiling = self.ceiling
+        return {
+            "Ceiling": [-wall - ceiling - 2 * wall + wall / 2 + 1, bound_side + 0.1],
+            "Wall back": [-wall - ceiling + 1, bound_side + 0.1],
+            "Wall front": [wall + 1, bound_side + 0.1],
+            "Wall left": [-wall + wall / 2 + 1, bound_side + ceiling + 0.1],
+            "Wall right": [-wall + wall / 2 + 0.5, -bound_side - ceiling - 1],
+        }
 
-        if current_interaction is not None:
-            bounds_bool = True
-            vector_orientation = vector_end - vector_origin
-            potential_gaze_orientation = current_interaction - vector_origin
-            cross_condition = np.linalg.norm(np.cross(vector_orientation, potential_gaze_orientation))
-            dot_condition = np.dot(vector_orientation, potential_gaze_orientation)
-            if dot_condition > 0:
-                if cross_condition > -0.01 and cross_condition < 0.01:
-                    for i_bool in range(3):
-                        if (
-                            current_interaction[i_bool] > plane_bounds[i][i_bool, 0] - 1
-                            and current_interaction[i_bool] < plane_bounds[i][i_bool, 1] + 1
-                        ):
-                            a = 1
-                        else:
-                            bounds_bool = False
-                else:
-                    bounds_bool = False
-            else:
-                bounds_bool = False
+    def plot_unwrapped(self, ax, FLAG_3D=False):
+        """
+        Plot the unwrapped gymnasium in 2D (or on the z = 0 plane of a 3D axis for the trampoline bed).
+        """
+        # Plot trampo bed
+        if FLAG_3D:
+            X, Y = np.meshgrid(
+                [-self.trampoline_length / 2, self.trampoline_length / 2], [-self.trampoline_width / 2, self.trampoline_width / 2]
+            )
+            Z = np.zeros(X.shape)
+            ax.plot_surface(X, Y, Z, color="k", alpha=0.4)
+        else:
+            ax.add_patch(
+                Rectangle(
+                    (-self.trampoline_length / 2, -self.trampoline_width / 2),
+                    self.trampoline_length,
+                    self.trampoline_width,
+                    facecolor='k',
+                    alpha=0.2,
+                )
+            )
+        # Plot the lines of the symmetrized gymnasium
+        for line_x, line_y in self.unwrapped_lines():
+            ax.plot(np.array(line_x), np.array(line_y), '-k')
 
-        if bounds_bool:
-            intersection += [current_interaction]
-            intersection_index[i] = 1
-            wall_index = i
+        for label, position in self.unwrapped_labels().items():
+            if FLAG_3D:
+                ax.text(position[0], position[1], 0, label, fontsize=10)
+            else:
+                ax.text(position[0], position[1], label, fontsize=10)
+        return
 
-    if intersection_index.sum() > 1:
-        bound_crossing = np.zeros((len(np.where(intersection_index == 1)[0])))
-        for idx, i in enumerate(np.where(intersection_index == 1)[0]):
-            for j in range(3):
-                if plane_bounds[i][j, 0] - intersection[idx][j] > 0:
-                    bound_crossing[idx] += np.abs(plane_bounds[i][j, 0] - intersection[idx][j])
-                if plane_bounds[i][j, 1] - intersection[idx][j] < 0:
-                    bound_crossing[idx] += np.abs(plane_bounds[i][j, 1] - intersection[idx][j])
-        closest_index = np.argmin(bound_crossing)
-        wall_index = np.where(intersection_index == 1)[0][closest_index]
+    def to_heatmap_pixels(self, gaze_position_unwrapped):
+        """
+        Position in the unwrapped heatmap image (pixels) of the unwrapped gaze positions (2 x N, m).
+        """
+        centers = np.asarray(gaze_position_unwrapped) * self.heatmap_pixels_per_meter
+        centers[0, :] += self.heatmap_origin[0]
+        centers[1, :] += self.heatmap_origin[1]
+        return centers
 
-    if wall_index is not None:
-        gaze_position = verify_intersection_position(vector_origin, vector_end, wall_index, bound_side, facing_front_wall)
-    else:
-        gaze_position = None
+    def plot_heatmap_lines(self, ax):
+        """
+        Plot the walls and trampoline bed on top of an unwrapped heatmap image (rounded to the pixel).
+        """
+        for line_x, line_y in self.unwrapped_lines():
+            pixels = np.round(self.to_heatmap_pixels(np.array([line_x, line_y])))
+            ax.plot(pixels[0, :], pixels[1, :], '-k', linewidth=1)
 
-    return gaze_position, wall_index
+        trampoline = np.round(
+            self.to_heatmap_pixels(
+                np.array([[-self.trampoline_length / 2, self.trampoline_length / 2], [-self.trampoline_width / 2, self.trampoline_width / 2]])
+            )
+        )
+        ax.plot(np.array([trampoline[0, 0], trampoline[0, 0]]), trampoline[1, :], '-k', linewidth=1)
+        ax.plot(np.array([trampoline[0, 1], trampoline[0, 1]]), trampoline[1, :], '-k', linewidth=1)
+        ax.plot(trampoline[0, :], np.array([trampoline[1, 0], trampoline[1, 0]]), '-k', linewidth=1)
+        ax.plot(trampoline[0, :], np.array([trampoline[1, 1], trampoline[1, 1]]), '-k', linewidth=1)
 
+        # The image rows go downward, so the labels of the walls along x are written above the upper line (-bound_side)
+        labels = self.unwrapped_labels()
+        pixels_per_meter = self.heatmap_pixels_per_meter
+        for label in ["Ceiling", "Wall back", "Wall front"]:
+            ax.text(
+                labels[label][0] * pixels_per_meter + self.heatmap_origin[0],
+                labels[label][1] * pixels_per_meter + self.heatmap_origin[1] - 100 + 5,
+                label,
+                fontsize=10,
+            )
+        ax.text(
+            labels["Wall left"][0] * pixels_per_meter + self.heatmap_origin[0],
+            (labels["Wall left"][1] + 0.9) * pixels_per_meter + self.heatmap_origin[1] + 5,
+            "Wall left",
+            fontsize=10,
+        )
+        ax.text(
+            labels["Wall right"][0] * pixels_per_meter + self.heatmap_origin[0],
+            (labels["Wall right"][1] + 1) * pixels_per_meter + self.heatmap_origin[1] - 5,
+            "Wall right",
+            fontsize=10,
+        )
+        return
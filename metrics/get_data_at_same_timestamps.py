@@ -1,12 +1,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import pickle
-import scipy
 from IPython import embed
 import biorbd
-import quaternion
 from unproject_PI_2d_pixel_gaze_estimates import pixelPoints_to_gazeAngles
 from set_initial_orientation import rotate_xsens
+from resampling import linear_interpolation_brackets, interpolate_linear, slerp_brackets, slerp
 
 
 def get_data_at_same_timestamps(
@@ -39,76 +38,28 @@ def get_data_at_same_timestamps(
             int(start_of_move_index[i]) : int(end_of_move_index[i]) + 1
         ]
 
+    # The interpolation intervals are computed once per move and shared by all the Xsens channels
+    xsens_frames_per_move = [None for i in range(len(start_of_move_index))]
+    interpolation_brackets_per_move = [None for i in range(len(start_of_move_index))]
+    for i in range(len(start_of_move_index)):
+        xsens_frames_per_move[i] = slice(int(xsens_start_of_move_index[i] - 2), int(xsens_end_of_move_index[i]) + 2)
+        interpolation_brackets_per_move[i] = linear_interpolation_brackets(time_vector_xsens[xsens_frames_per_move[i]], time_vector_pupil_per_move[i])
+
     Xsens_position_per_move = [np.array([]) for i in range(len(start_of_move_index))]
     Xsens_position_facing_front_wall_per_move = [np.array([]) for i in range(len(start_of_move_index))]
     Xsens_jointAngle_per_move = [np.array([]) for i in range(len(start_of_move_index))]
     for i in range(len(start_of_move_index)):
-        Xsens_position_per_move[i] = np.zeros((len(time_vector_pupil_per_move[i]), np.shape(Xsens_position)[1]))
-        Xsens_jointAngle_per_move[i] = np.zeros((len(time_vector_pupil_per_move[i]), np.shape(Xsens_jointAngle)[1]))
-        for j in range(np.shape(Xsens_position)[1]):
-            xsens_interp_on_pupil = scipy.interpolate.interp1d(
-                np.reshape(
-                    time_vector_xsens[int(xsens_start_of_move_index[i] - 2) : int(xsens_end_of_move_index[i]) + 2],
-                    (
-                        len(
-                            time_vector_xsens[
-                                int(xsens_start_of_move_index[i] - 2) : int(xsens_end_of_move_index[i]) + 2
-                            ]
-                        )
-                    ),
-                ),
-                Xsens_position[int(xsens_start_of_move_index[i] - 2) : int(xsens_end_of_move_index[i]) + 2, j],
-            )
-            Xsens_position_per_move[i][:, j] = xsens_interp_on_pupil(time_vector_pupil_per_move[i])
-
-        for j in range(np.shape(Xsens_jointAngle)[1]):
-            xsens_interp_on_pupil = scipy.interpolate.interp1d(
-                np.reshape(
-                    time_vector_xsens[int(xsens_start_of_move_index[i] - 2) : int(xsens_end_of_move_index[i]) + 2],
-                    (
-                        len(
-                            time_vector_xsens[
-                                int(xsens_start_of_move_index[i] - 2) : int(xsens_end_of_move_index[i]) + 2
-                            ]
-                        )
-                    ),
-                ),
-                Xsens_jointAngle[int(xsens_start_of_move_index[i] - 2) : int(xsens_end_of_move_index[i]) + 2, j],
-            )
-            Xsens_jointAngle_per_move[i][:, j] = xsens_interp_on_pupil(time_vector_pupil_per_move[i])
-
+        Xsens_position_per_move[i] = interpolate_linear(Xsens_position[xsens_frames_per_move[i], :], interpolation_brackets_per_move[i])
+        Xsens_jointAngle_per_move[i] = interpolate_linear(Xsens_jointAngle[xsens_frames_per_move[i], :], interpolation_brackets_per_move[i])
 
     Xsens_orientation_per_move = [np.array([]) for _ in range(len(start_of_move_index))]
     Xsens_orientation_facing_front_wall_per_move = [np.array([]) for i in range(len(start_of_move_index))]
     for i in range(len(start_of_move_index)):
-        Xsens_orientation_per_move[i] = np.zeros((len(time_vector_pupil_per_move[i]), 4 * num_joints))
-        for j in range(len(time_vector_pupil_per_move[i])):
-            idx_closest = np.argmin(np.abs(time_vector_pupil_per_move[i][j] - time_vector_xsens))
-            if time_vector_xsens[idx_closest] < time_vector_pupil_per_move[i][j]:
-                idx_0 = idx_closest
-                idx_1 = idx_closest + 1
-            else:
-                idx_0 = idx_closest - 1
-                idx_1 = idx_closest
-            t0 = time_vector_xsens[idx_0]
-            t1 = time_vector_xsens[idx_1]
-            for k in range(num_joints):
-                quat_0 = np.quaternion(
-                    Xsens_orientation[idx_0, 4 * k],
-                    Xsens_orientation[idx_0, 4 * k + 1],
-                    Xsens_orientation[idx_0, 4 * k + 2],
-                    Xsens_orientation[idx_0, 4 * k + 3],
-                )
-                quat_1 = np.quaternion(
-                    Xsens_orientation[idx_1, 4 * k],
-                    Xsens_orientation[idx_1, 4 * k + 1],
-                    Xsens_orientation[idx_1, 4 * k + 2],
-                    Xsens_orientation[idx_1, 4 * k + 3],
-                )
-                relative_time = (time_vector_pupil_per_move[i][j] - t0) / (t1 - t0)
-                interp_quat = quaternion.slerp_evaluate(quat_0, quat_1, relative_time).components
-
-                Xsens_orientation_per_move[i][j, 4 * k : 4 * (k + 1)] = interp_quat
+        index_0, index_1, relative_time = slerp_brackets(time_vector_xsens, time_vector_pupil_per_move[i])
+        quat_0 = np.reshape(Xsens_orientation[index_0, : 4 * num_joints], (len(index_0), num_joints, 4))
+        quat_1 = np.reshape(Xsens_orientation[index_1, : 4 * num_joints], (len(index_1), num_joints, 4))
+        interp_quat = slerp(quat_0, quat_1, relative_time[:, np.newaxis])
+        Xsens_orientation_per_move[i] = np.reshape(interp_quat, (len(index_0), 4 * num_joints))
 
     for i in range(len(start_of_move_index)):
         if move_orientation[i] == -1:
@@ -122,16 +73,7 @@ def get_data_at_same_timestamps(
 
     Xsens_CoM_per_move = [np.array([]) for i in range(len(start_of_move_index))]
     for i in range(len(start_of_move_index)):
-        Xsens_CoM_per_move[i] = np.zeros((len(time_vector_pupil_per_move[i]), 9))
-        for j in range(9):
-            xsens_interp_on_pupil = scipy.interpolate.interp1d(
-                np.reshape(
-                    time_vector_xsens[int(xsens_start_of_move_index[i]) - 2 : int(xsens_end_of_move_index[i]) + 2],
-                    len(time_vector_xsens[int(xsens_start_of_move_index[i]) - 2 : int(xsens_end_of_move_index[i]) + 2]),
-                ),
-                Xsens_centerOfMass[int(xsens_start_of_move_index[i]) - 2 : int(xsens_end_of_move_index[i]) + 2, j],
-            )
-            Xsens_CoM_per_move[i][:, j] = xsens_interp_on_pupil(time_vector_pupil_per_move[i])
+        Xsens_CoM_per_move[i] = interpolate_linear(Xsens_centerOfMass[xsens_frames_per_move[i], :9], interpolation_brackets_per_move[i])
 
     elevation_pupil_pixel = csv_eye_tracking[:, 1]
     azimuth_pupil_pixel = csv_eye_tracking[:, 2]
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def samples_in_intervals(time_vector, interval_starts, interval_ends):
+    """
+    This function labels (1) the samples of time_vector which are strictly inside at least one of the intervals
+    ]interval_starts[j], interval_ends[j][ and (0) the others, like the nested loop
+    for i in samples: for j in intervals: if start[j] < time[i] < end[j].
+    The intervals are sorted by start and the running maximum of their ends is kept, so that each sample only needs one
+    sorted search (O((N + B) log B) instead of O(N * B)). The intervals can overlap.
+    """
+    time_vector = np.asarray(time_vector, dtype=float)
+    interval_starts = np.reshape(np.asarray(interval_starts, dtype=float), (-1,))
+    interval_ends = np.reshape(np.asarray(interval_ends, dtype=float), (-1,))
+
+    candidates = np.zeros((len(time_vector)))
+    # Intervals with a nan bound never contain a sample (the comparisons are False)
+    valid_intervals = ~(np.isnan(interval_starts) | np.isnan(interval_ends))
+    interval_starts = interval_starts[valid_intervals]
+    interval_ends = interval_ends[valid_intervals]
+    if len(interval_starts) == 0:
+        return candidates
+
+    order = np.argsort(interval_starts, kind="stable")
+    sorted_starts = interval_starts[order]
+    running_max_ends = np.maximum.accumulate(interval_ends[order])
+
+    # Number of intervals which started strictly before each sample
+    number_of_started_intervals = np.searchsorted(sorted_starts, time_vector, side="left")
+    has_started = number_of_started_intervals > 0
+    last_started = np.maximum(number_of_started_intervals - 1, 0)
+    candidates[has_started & (running_max_ends[last_started] > time_vector)] = 1
+    return candidates
+
+
+def index_to_segments(time_vector, index):
+    """
+    This function returns the consecutive blocks of samples labeled 1 in index.
+    Each block goes from start (included) to end (excluded) and its duration is
+    time_vector[end] - time_vector[start] (the last sample is used as end for a block which finishes the trial).
+    """
+    index = np.asarray(index)
+    padded_index = np.hstack((0, (index == 1).astype(int), 0))
+    diff_index = padded_index[1:] - padded_index[:-1]
+    segment_starts = np.where(diff_index == 1)[0]
+    segment_ends = np.where(diff_index == -1)[0]
+    if len(segment_starts) == 0:
+        return segment_starts, segment_ends, np.zeros((0,))
+    time_vector = np.asarray(time_vector)
+    durations = time_vector[np.minimum(segment_ends, len(time_vector) - 1)] - time_vector[segment_starts]
+    return segment_starts, segment_ends, durations
@@ -2,14 +2,15 @@ import biorbd
 import numpy as np
 import matplotlib.pyplot as plt
 import pickle
-import scipy.io as sio
 import pandas as pd
 import argparse
 import os
 import sys
 
 from sync_jump import sync_jump
-from CoM_transfo import CoM_transfo
+from xsens_trial import XsensTrial
+from trial_manifest import TrialManifest
+from CoM_transfo import CoM_free_fall_trajectory, apply_CoM_correction, plot_CoM
 from get_data_at_same_timestamps import get_data_at_same_timestamps
 from animate_JCS import animate
 from remove_data_during_blinks import remove_data_during_blinks_pupil, home_made_blink_confidence_threshold, remove_data_during_blinks_manual_labeling
@@ -33,61 +34,6 @@ def load_anthropo(anthropo_name):
     return hip_height
 
 
-def load_xsens(file_dir, xsens_file_name):
-    """
-    This function loads the xsens data which were exported using Xsens .mvnx and unpacked with the Matlab code main_gaze_mapping.m.
-    """
-
-    # Order of the links between the points (joint coordinates system) provided by Xsens
-    links = np.array([[0, 1],
-                      [1, 2],
-                      [2, 3],
-                      [3, 4],
-                      [4, 5],
-                      [5, 6],
-                      [4, 7],
-                      [7, 8],
-                      [8, 9],
-                      [9, 10],
-                      [4, 11],
-                      [11, 12],
-                      [12, 13],
-                      [13, 14],
-                      [0, 15],
-                      [15, 16],
-                      [16, 17],
-                      [17, 18],
-                      [0, 19],
-                      [19, 20],
-                      [20, 21],
-                      [21, 22]])
-
-    Xsens_Subject_name = sio.loadmat(file_dir + xsens_file_name + '/' + "Subject_name.mat")["Subject_name"]
-    Xsens_frameRate = sio.loadmat(file_dir + xsens_file_name + '/'  + "frameRate.mat")["frameRate"]
-    Xsens_time = sio.loadmat(file_dir + xsens_file_name + '/' + "time.mat")["time"]
-    Xsens_index = sio.loadmat(file_dir + xsens_file_name + '/' + "index.mat")["index"]
-    Xsens_ms = sio.loadmat(file_dir + xsens_file_name + '/' + "ms.mat")["ms"]
-
-    Xsens_position = sio.loadmat(file_dir + xsens_file_name + '/' + "position.mat")["position"]
-    Xsens_orientation = sio.loadmat(file_dir + xsens_file_name + '/' + "orientation.mat")["orientation"]
-    Xsens_sensorFreeAcceleration = sio.loadmat(file_dir + xsens_file_name + '/' + "sensorFreeAcceleration.mat")[
-        "sensorFreeAcceleration"
-    ]
-    Xsens_jointAngle = sio.loadmat(file_dir + xsens_file_name + '/' + "jointAngle.mat")["jointAngle"]
-    Xsens_jointAngle = Xsens_jointAngle * np.pi / 180
-    Xsens_centerOfMass = sio.loadmat(file_dir + xsens_file_name + '/' + "centerOfMass.mat")["centerOfMass"]
-    Xsens_global_JCS_positions = sio.loadmat(file_dir + xsens_file_name + '/' + "global_JCS_positions.mat")[
-        "global_JCS_positions"
-    ]
-    Xsens_global_JCS_orientations = sio.loadmat(file_dir + xsens_file_name + '/' + "global_JCS_orientations.mat")[
-        "global_JCS_orientations"
-    ]
-
-    num_joints = int(round(np.shape(Xsens_position)[1]) / 3)
-
-    return Xsens_ms, Xsens_position, Xsens_orientation, Xsens_centerOfMass, links, num_joints, Xsens_sensorFreeAcceleration, Xsens_global_JCS_positions, Xsens_global_JCS_orientations, Xsens_jointAngle
-
-
 def run_analysis(
     home_path,
     subject_name,
@@ -117,6 +63,8 @@ def run_analysis(
     FLAG_ANALYSIS,
     GENERATE_STICK_FIGURE_FOR_GRAPHS,
     API_KEY,
+    SYNC_METHOD="combinations",
+    FIXATION_ALGORITHM="distance",
 ):
     """
     This function is the main function of the analysis pipeline. It is called by the main.py script.
@@ -125,9 +73,8 @@ def run_analysis(
         hip_height = load_anthropo(anthropo_name)
 
         file_dir = home_path + f'/disk/Eye-tracking/XsensData/{subject_name}/exports_shoulder_height/'
-        (Xsens_ms, Xsens_position, Xsens_orientation, Xsens_centerOfMass, links, num_joints,
-         Xsens_sensorFreeAcceleration, Xsens_global_JCS_positions, Xsens_global_JCS_orientations, Xsens_jointAngle
-         ) = load_xsens(file_dir, xsens_file_name)
+        # The Xsens channels are only loaded when they are used
+        xsens_trial = XsensTrial(file_dir, xsens_file_name)
 
     if gaze_position_labels is not None:
         (
@@ -183,13 +130,16 @@ def run_analysis(
 
     if FLAG_ANALYSIS:
         # If the position of the pelvis in Xsens in not (0, 0, 0), for all frames, the data were not exported with the right options.
-        if np.logical_and(np.any(Xsens_position[:, :2] > 0.01), np.any(Xsens_position[:, :2] < -0.01)):
+        if np.logical_and(np.any(xsens_trial.position[:, :2] > 0.01), np.any(xsens_trial.position[:, :2] < -0.01)):
             plt.figure()
-            plt.plot(Xsens_position[:, :3])
+            plt.plot(xsens_trial.position[:, :3])
             plt.show()
             raise RuntimeError("Warning: Xsens not well exported, see graph of the pelvis position")
 
         sync_output_save_name = f"{out_path}/{subject_name}/{movie_name}__sync.png"
+        sync_results_save_name = f"{out_path}/{subject_name}/{movie_name}__sync.pkl"
+        if not os.path.exists(f"{out_path}/{subject_name}"):
+            os.makedirs(f"{out_path}/{subject_name}")
         (
             xsens_start_of_jump_index,
             xsens_end_of_jump_index,
@@ -199,7 +149,7 @@ def run_analysis(
             time_vector_pupil_offset,
             csv_eye_tracking_confident_synced,
         ) = sync_jump(
-            Xsens_sensorFreeAcceleration,
+            xsens_trial.sensor_free_acceleration,
             start_of_jump_index,
             end_of_jump_index,
             start_of_move_index,
@@ -207,15 +157,17 @@ def run_analysis(
             FLAG_SYNCHRO_PLOTS,
             sync_output_save_name,
             csv_eye_tracking_confident,
-            Xsens_ms,
+            xsens_trial.ms,
             max_threshold,
             air_time_threshold,
             Xsens_jump_idx,
             Pupil_jump_idx,
+            sync_method=SYNC_METHOD,
+            sync_results_name=sync_results_save_name,
         )
 
         pelvis_resting_frames = np.arange(Xsens_frames_zero[0], Xsens_frames_zero[1])
-        Xsens_position_rotated, Xsens_orientation_rotated = rotate_pelvis_to_initial_orientation(num_joints, move_orientation, Xsens_position, Xsens_orientation, pelvis_resting_frames)
+        Xsens_position_rotated, Xsens_orientation_rotated = rotate_pelvis_to_initial_orientation(xsens_trial.num_joints, move_orientation, xsens_trial.position, xsens_trial.orientation, pelvis_resting_frames)
 
         (
             time_vector_pupil_per_move,
@@ -233,7 +185,7 @@ def run_analysis(
         ) = get_data_at_same_timestamps(
             Xsens_orientation_rotated,
             Xsens_position_rotated,
-            Xsens_jointAngle,
+            xsens_trial.joint_angle,
             xsens_start_of_move_index,
             xsens_end_of_move_index,
             time_vector_xsens,
@@ -242,19 +194,26 @@ def run_analysis(
             time_vector_pupil_offset,
             csv_eye_tracking_confident_synced,
             blink_index,
-            Xsens_centerOfMass,
+            xsens_trial.center_of_mass,
             SCENE_CAMERA_SERIAL_NUMBER,
             API_KEY,
-            num_joints,
+            xsens_trial.num_joints,
             move_orientation,
             FLAG_PUPIL_ANGLES_PLOT,
         )
 
-        Xsens_position_no_level_CoM_corrected_rotated_per_move, CoM_trajectory_per_move = CoM_transfo(
-            time_vector_pupil_per_move, Xsens_position_rotated_per_move, Xsens_CoM_per_move, num_joints, hip_height, FLAG_COM_PLOTS
+        # The athlete facing the front wall is only rotated around the vertical axis, so the CoM trajectory is computed
+        # once and applied to both position sets
+        CoM_trajectory_per_move, CoM_shift_per_move = CoM_free_fall_trajectory(
+            time_vector_pupil_per_move, Xsens_position_rotated_per_move, Xsens_CoM_per_move, hip_height
+        )
+        if FLAG_COM_PLOTS:
+            plot_CoM(time_vector_pupil_per_move, Xsens_CoM_per_move, CoM_trajectory_per_move)
+        Xsens_position_no_level_CoM_corrected_rotated_per_move = apply_CoM_correction(
+            Xsens_position_rotated_per_move, CoM_shift_per_move, xsens_trial.num_joints
         )
-        Xsens_position_facing_front_wall_no_level_CoM_corrected_rotated_per_move, _ = CoM_transfo(
-            time_vector_pupil_per_move, Xsens_position_facing_front_wall_per_move, Xsens_CoM_per_move, num_joints, hip_height, FLAG_COM_PLOTS
+        Xsens_position_facing_front_wall_no_level_CoM_corrected_rotated_per_move = apply_CoM_correction(
+            Xsens_position_facing_front_wall_per_move, CoM_shift_per_move, xsens_trial.num_joints
         )
         
         for j in range(len(Xsens_position_rotated_per_move)):
@@ -284,7 +243,7 @@ def run_analysis(
                 generate_stick_figure(
                     Xsens_orientation_per_move[j],
                     Xsens_position_no_level_CoM_corrected_rotated_per_move[j],
-                    links,
+                    xsens_trial.links,
                     move_surname,
                     repetition_number[j],
                 )
@@ -340,8 +299,8 @@ def run_analysis(
                     blink_index_per_move[j],
                     eye_position_height,
                     eye_position_depth,
-                    links,
-                    num_joints,
+                    xsens_trial.links,
+                    xsens_trial.num_joints,
                     output_file_name,
                     folder_name,
                     0,
@@ -349,6 +308,7 @@ def run_analysis(
                     FLAG_GAZE_TRAJECTORY,
                     FLAG_GENERATE_STATS_METRICS,
                     FLAG_PUPIL_ANGLES_PLOT,
+                    FIXATION_ALGORITHM,
                 )
 
             if GENERATE_HEATMAPS:
@@ -381,6 +341,7 @@ def run_analysis(
 
             # Save the data in a dictionnary for the stats analysis and plots.
             move_summary = {"subject_expertise": subject_expertise,
+                            "fixation_algorithm": FIXATION_ALGORITHM,
                             "subject_name": subject_name,
                             "number_of_fixation": number_of_fixation,
                             "fixation_duration_absolute" : fixation_duration_absolute,
@@ -441,11 +402,11 @@ def run_analysis(
                             "time_vector_pupil_per_move": time_vector_pupil_per_move[j],
                             "camera_matrix": camera_matrix,
                             "distortion_coeff": distortion_coeff,
-                            "Xsens_global_JCS_positions": Xsens_global_JCS_positions,
-                            "Xsens_global_JCS_orientations": Xsens_global_JCS_orientations,
+                            "Xsens_global_JCS_positions": xsens_trial.global_JCS_positions,
+                            "Xsens_global_JCS_orientations": xsens_trial.global_JCS_orientations,
                             "Xsens_position_rotated_per_move": Xsens_position_rotated_per_move[j],
                             "Xsens_position_rotated": Xsens_position_rotated,
-                            "Xsens_position": Xsens_position,
+                            "Xsens_position": xsens_trial.position,
                             }
 
             with open(output_file_name[:-4] + "__eyetracking_metrics.pkl", 'wb') as handle:
@@ -461,6 +422,10 @@ def run_analysis(
 # args = parser.parse_args()
 # API_KEY = args.API_KEY
 
+# The camera intrinsics are read from the local registry (metrics/camera_intrinsics.json), the API_KEY is only used to
+# download the intrinsics of a scene camera which is not in the registry yet
+API_KEY = None
+
 ##Changer au dessus si commit
 
 if os.path.exists("/home/user"):
@@ -523,6 +488,8 @@ FLAG_GENERATE_STATS_METRICS = True
 FLAG_ANALYSIS = True
 FLAG_TURN_ATHLETES_FOR_PGO = False
 GENERATE_STICK_FIGURE_FOR_GRAPHS = False
+SYNC_METHOD = "combinations"  # "combinations" or "cross_correlation"
+FIXATION_ALGORITHM = "distance"  # "distance", "velocity" or "dispersion"
 csv_name = home_path + "/Documents/StageMathieu/Trials_name_mapping.csv"
 out_path = home_path + "/Documents/StageMathieu/DataTrampo/Xsens_pkl"
 points_labeled_path = home_path + "/disk/Eye-tracking/PupilData/points_labeled/"
@@ -531,34 +498,24 @@ eye_tracking_data_path = home_path + "/disk/Eye-tracking/PupilData/CloudExport/"
 
 
 # Code beginning
-trial_table = np.char.split(pd.read_csv(csv_name, sep="\t").values.astype("str"), sep=",")
-
-for i_trial in range(len(trial_table)):
-
-    if trial_table[i_trial][0][22] != "True":
-        continue
-
-    subject_name = trial_table[i_trial][0][0]
-    move_names = trial_table[i_trial][0][1].split(" ")
-    repetition_number = trial_table[i_trial][0][2].split(" ")
-    move_orientation = [int(x) for x in trial_table[i_trial][0][3].split(" ")]
-    xsens_file_name = trial_table[i_trial][0][4]
-    eye_tracking_folder = trial_table[i_trial][0][10]
-    movie_name = trial_table[i_trial][0][11].replace(".", "_")
-    subject_expertise = trial_table[i_trial][0][13]
-    if trial_table[i_trial][0][16] != "":
-        max_threshold = float(trial_table[i_trial][0][16])
-    else:
-        max_threshold = 2
-    if trial_table[i_trial][0][17] != "":
-        air_time_threshold = float(trial_table[i_trial][0][17])
-    else:
-        air_time_threshold = 0.25
-    Xsens_jump_idx = ([int(x) for x in trial_table[i_trial][0][18].split(" ")] if trial_table[i_trial][0][18] != "" else [])
-    Pupil_jump_idx = ([int(x) for x in trial_table[i_trial][0][19].split(" ")] if trial_table[i_trial][0][19] != "" else [])
-    # No zero for Pupil, we decided to trust their zero since it is odd to find a personal zero for each subject
-    Pupil_frames_zero = ([int(x) for x in trial_table[i_trial][0][20].split(" ")] if trial_table[i_trial][0][20] != "" else [0, 30])
-    Xsens_frames_zero = ([int(x) for x in trial_table[i_trial][0][21].split(" ")] if trial_table[i_trial][0][21] != "" else [0, 30])
+trial_manifest = TrialManifest(csv_name)
+
+for trial in trial_manifest.included_trials():
+
+    subject_name = trial.subject_name
+    move_names = trial.move_names
+    repetition_number = trial.repetition_number
+    move_orientation = trial.move_orientation
+    xsens_file_name = trial.xsens_file_name
+    eye_tracking_folder = trial.eye_tracking_folder
+    movie_name = trial.movie_name
+    subject_expertise = trial.subject_expertise
+    max_threshold = trial.max_threshold
+    air_time_threshold = trial.air_time_threshold
+    Xsens_jump_idx = trial.Xsens_jump_idx
+    Pupil_jump_idx = trial.Pupil_jump_idx
+    Pupil_frames_zero = trial.Pupil_frames_zero
+    Xsens_frames_zero = trial.Xsens_frames_zero
 
     print(f'Analysis of trial {xsens_file_name} started')
 
@@ -602,6 +559,8 @@ for i_trial in range(len(trial_table)):
         FLAG_ANALYSIS,
         GENERATE_STICK_FIGURE_FOR_GRAPHS,
         API_KEY,
+        SYNC_METHOD,
+        FIXATION_ALGORITHM,
     )
 
     plt.close("all")
@@ -3,8 +3,8 @@ from IPython import embed
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from animate_JCS import find_neighbouring_candidates
-import itertools
-from operator import itemgetter
+from closest_index import find_closest_index
+from interval_membership import samples_in_intervals, index_to_segments
 
 
 def animate_confidence_threshold(pos_xy, idx_reject_points, timestamps_relative, frames, max_frame, movie_name, out_path):
@@ -84,6 +84,50 @@ def animate_confidence_threshold(pos_xy, idx_reject_points, timestamps_relative,
 
     return
 
+
+def identify_incoherent_gaze_points(pos_xy, nb_points=10, orientation_angle_threshold=15 * np.pi / 180, distance_threshold=5):
+    """
+    This function identifies the gaze points which are not coherent with their neighbours: in a window of nb_points,
+    more than half of the displacements are larger than distance_threshold (pixels) and more than half of the changes
+    of direction are larger than orientation_angle_threshold (rad).
+    The angles and the window counts are computed on the whole arrays (cumulative sums), so it can be used on a whole
+    session as a pre-filter.
+    """
+    nb_samples = len(pos_xy)
+    diff_xy = pos_xy[1:, :2] - pos_xy[:-1, :2]
+    diff_xy_norm = np.sqrt(diff_xy[:, 0] ** 2 + diff_xy[:, 1] ** 2)
+
+    # Angle between two consecutive displacements (0 if one of them is null)
+    angle_xy = np.zeros((nb_samples,))
+    if nb_samples > 3:
+        norm_before = diff_xy_norm[: nb_samples - 3]
+        norm_after = diff_xy_norm[1 : nb_samples - 2]
+        dot_product = diff_xy[: nb_samples - 3, 0] * diff_xy[1 : nb_samples - 2, 0] + diff_xy[: nb_samples - 3, 1] * diff_xy[1 : nb_samples - 2, 1]
+        is_null = (norm_before == 0) | (norm_after == 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            prod_div_norm = dot_product / (norm_after * norm_before)
+        angle_xy[1 : nb_samples - 2] = np.where(is_null, 0, np.arccos(np.clip(prod_div_norm, -1.0, 1.0)))
+
+    idx_reject_points = np.zeros((nb_samples,), dtype=int)
+    nb_windows = nb_samples - nb_points
+    if nb_windows <= 0:
+        return idx_reject_points
+
+    # Number of large displacements and large angles in the windows [i, i + nb_points[
+    cumsum_distance = np.hstack((0, np.cumsum(diff_xy_norm > distance_threshold)))
+    cumsum_angle = np.hstack((0, np.cumsum(angle_xy > orientation_angle_threshold)))
+    nb_distance = cumsum_distance[nb_points : nb_points + nb_windows] - cumsum_distance[:nb_windows]
+    nb_angle = cumsum_angle[nb_points : nb_points + nb_windows] - cumsum_angle[:nb_windows]
+    rejected_windows = np.where((nb_distance > nb_points / 2) & (nb_angle > nb_points / 2))[0]
+
+    # Points i + 1 to i + nb_points - 1 (excluded) of each rejected window are rejected
+    window_limits = np.zeros((nb_samples + 1,), dtype=int)
+    np.add.at(window_limits, rejected_windows + 1, 1)
+    np.add.at(window_limits, rejected_windows + nb_points - 1, -1)
+    idx_reject_points[np.cumsum(window_limits[:-1]) > 0] = 1
+    return idx_reject_points
+
+
 def home_made_blink_confidence_threshold(csv_eye_tracking, csv_blinks, blink_duration_threshold, frames=None, GENERATE_VIDEO_CONFIDENCE_THRESHOLD=None, movie_name=None, out_path=None):
     """
     This function identifies the Pupil gaze data which can be trusted since the data is soherent
@@ -91,43 +135,10 @@ def home_made_blink_confidence_threshold(csv_eye_tracking, csv_blinks, blink_dur
     This function is not used, since manual labelling was safer.
     """
 
-    timestamps = csv_eye_tracking[:, 0]
     pos_xy = csv_eye_tracking[:, 1:3]
     timestamps_relative = csv_eye_tracking[:, 4]
 
-    diff_dt = np.zeros((len(timestamps),))
-    diff_dt[0] = timestamps[1] - timestamps[0]
-    diff_dt[-1] = timestamps[-1] - timestamps[-2]
-    diff_dt[1:-1] = timestamps[2:] - timestamps[:-2]
-
-    diff_xy = np.array([(pos_xy[1:, 0] - pos_xy[:-1, 0]), pos_xy[1:, 1] - pos_xy[:-1, 1]]).T
-    diff_xy_norm = np.sqrt(diff_xy[:, 0] ** 2 + diff_xy[:, 1] ** 2)
-
-    angle_xy = np.zeros((len(timestamps),))
-    for i in range(len(timestamps) - 3):
-        if diff_xy_norm[i + 1] == 0 or diff_xy_norm[i] == 0:
-            angle_xy[i + 1] = 0
-        else:
-            prod_div_norm = np.dot(diff_xy[i, :], diff_xy[i + 1, :]) / (diff_xy_norm[i + 1] * diff_xy_norm[i])
-            if prod_div_norm > 1.0:
-                angle_xy[i + 1] = 0
-            elif prod_div_norm < -1.0:
-                angle_xy[i + 1] = np.pi
-            else:
-                angle_xy[i + 1] = np.arccos(prod_div_norm)
-
-    nb_points = 10
-    orientation_angle_threshold = 15 * np.pi / 180  # degrees
-    distance_threshold = 5  # pixels
-    idx_reject_points = np.zeros((len(timestamps),))
-    for i in range(len(timestamps) - nb_points):
-        if (
-            np.sum(diff_xy_norm[i : i + nb_points] > distance_threshold) > nb_points / 2
-            and np.sum(angle_xy[i : i + nb_points] > orientation_angle_threshold) > nb_points / 2
-        ):
-            # if np.all(diff_xy_norm[i:i+nb_points] > distance_threshold) and np.sum(angle_xy[i:i+nb_points] > orientation_angle_threshold) > nb_points/2:
-            idx_reject_points[i + 1 : i + nb_points - 1] = 1
-    idx_reject_points = idx_reject_points.astype(np.int)
+    idx_reject_points = identify_incoherent_gaze_points(pos_xy)
 
     if GENERATE_VIDEO_CONFIDENCE_THRESHOLD:
         animate_confidence_threshold(pos_xy, idx_reject_points, timestamps_relative, frames, 100, movie_name, out_path)
@@ -138,12 +149,7 @@ def home_made_blink_confidence_threshold(csv_eye_tracking, csv_blinks, blink_dur
     time_vector = (csv_eye_tracking[:, 0] - csv_eye_tracking[0, 0]) / 1e9
 
     if np.shape(csv_blinks) != 0:
-        number_of_blinks = csv_blinks.shape[0]
-        blinks_candidates = np.zeros((len(time_vector)))
-        for i in range(len(time_vector)):
-            for j in range(number_of_blinks):
-                if time_vector[i] > blink_starts[j] and time_vector[i] < blink_ends[j]:
-                    blinks_candidates[i] = 1
+        blinks_candidates = samples_in_intervals(time_vector, blink_starts, blink_ends)
         blinks_index_pupil = find_neighbouring_candidates(time_vector, blinks_candidates, blink_duration_threshold)
 
     blinks_index_home_made = find_neighbouring_candidates(time_vector, idx_reject_points, blink_duration_threshold)
@@ -163,6 +169,17 @@ def home_made_blink_confidence_threshold(csv_eye_tracking, csv_blinks, blink_dur
 
 
 
+def identify_blink_segments(csv_blinks, time_vector_pupil, blink_duration_threshold):
+    """
+    Labels the samples which are in a blink of blink.csv (Pupil) lasting more than the minimum duration threshold.
+    Returns the blink index and the start index, end index (excluded) and duration of each blink.
+    """
+    blinks_candidates = samples_in_intervals(time_vector_pupil, csv_blinks[:, 0], csv_blinks[:, 1])
+    blinks_index = find_neighbouring_candidates(time_vector_pupil, blinks_candidates, blink_duration_threshold)
+    blink_starts, blink_ends, blink_durations = index_to_segments(time_vector_pupil, blinks_index)
+    return blinks_index, blink_starts, blink_ends, blink_durations
+
+
 def identify_blinks(csv_blinks, time_vector_pupil, blink_duration_threshold):
     """
     Extract from the data the number of blinks (blinks that are longer than the minimum duration threshold) and their
@@ -170,18 +187,8 @@ def identify_blinks(csv_blinks, time_vector_pupil, blink_duration_threshold):
     This function is not used, since manual labelling was safer.
     """
     if np.shape(csv_blinks) != 0:
-        number_of_blinks = csv_blinks.shape[0]
-        blinks_candidates = np.zeros((len(time_vector_pupil)))
-        for i in range(len(time_vector_pupil)):
-            for j in range(number_of_blinks):
-                if time_vector_pupil[i] > csv_blinks[j, 0] and time_vector_pupil[i] < csv_blinks[j, 1]:
-                    blinks_candidates[i] = 1
-        blinks_index = find_neighbouring_candidates(time_vector_pupil, blinks_candidates, blink_duration_threshold)
-
-        blinks_list = []
-        for k, g in itertools.groupby(enumerate(np.where(blinks_index == 1)[0]), lambda ix: ix[0] - ix[1]):
-            blinks_list.append(list(map(itemgetter(1), g)))
-        number_of_blinks = len(blinks_list)
+        blinks_index, blink_starts, _, _ = identify_blink_segments(csv_blinks, time_vector_pupil, blink_duration_threshold)
+        number_of_blinks = len(blink_starts)
 
     else:
         number_of_blinks = 0
@@ -201,12 +208,7 @@ def remove_data_during_blinks_pupil(csv_eye_tracking, csv_blinks, blink_duration
     time_vector = (csv_eye_tracking[:, 0] - csv_eye_tracking[0, 0]) / 1e9
 
     if np.shape(csv_blinks) != 0:
-        number_of_blinks = csv_blinks.shape[0]
-        blinks_candidates = np.zeros((len(time_vector)))
-        for i in range(len(time_vector)):
-            for j in range(number_of_blinks):
-                if time_vector[i] > blink_starts[j] and time_vector[i] < blink_ends[j]:
-                    blinks_candidates[i] = 1
+        blinks_candidates = samples_in_intervals(time_vector, blink_starts, blink_ends)
         blinks_index = find_neighbouring_candidates(time_vector, blinks_candidates, blink_duration_threshold)
 
     csv_eye_tracking[np.where(blinks_index), 1] = np.nan
@@ -216,20 +218,31 @@ def remove_data_during_blinks_pupil(csv_eye_tracking, csv_blinks, blink_duration
     return csv_eye_tracking
 
 
-def remove_data_during_blinks_manual_labeling(csv_eye_tracking, active_blinks, time_stamps_left_eye):
+def remove_data_during_blinks_manual_labeling(csv_eye_tracking, active_blinks, time_stamps_left_eye, inplace=True):
     """
     This function allows to extract the blink index from the manual labeling of the blinks.
+    Each gaze sample takes the label of the closest eye camera image (sorted search if the eye camera timestamps are
+    sorted).
+    If inplace is False, csv_eye_tracking is not modified and a copy is returned.
     """
+    if not inplace:
+        csv_eye_tracking = np.copy(csv_eye_tracking)
 
     time_vector = csv_eye_tracking[:, 0]
-    blink_index = np.zeros((len(time_vector)))
-    for i in range(len(time_vector)):
-        index_closest = np.argmin(np.abs(time_stamps_left_eye - time_vector[i]))
-        if len(active_blinks["Eyes closed"]) > index_closest:
-            if active_blinks["Eyes closed"][index_closest] == 1:
-                csv_eye_tracking[i, 1] = np.nan
-                csv_eye_tracking[i, 2] = np.nan
-                csv_eye_tracking[i, 3] = 0
-                blink_index[i] = 1
-
-    return csv_eye_tracking, blink_index
\ No newline at end of file
+    time_stamps_left_eye = np.reshape(time_stamps_left_eye, (-1,))
+    if np.all(time_stamps_left_eye[1:] >= time_stamps_left_eye[:-1]):
+        index_closest = find_closest_index(time_stamps_left_eye, time_vector)
+    else:
+        index_closest = np.array([np.argmin(np.abs(time_stamps_left_eye - t)) for t in time_vector], dtype=int)
+
+    eyes_closed = np.asarray(active_blinks["Eyes closed"])
+    is_labeled = index_closest < len(eyes_closed)
+    blink_mask = np.zeros((len(time_vector),), dtype=bool)
+    blink_mask[is_labeled] = eyes_closed[index_closest[is_labeled]] == 1
+
+    csv_eye_tracking[blink_mask, 1] = np.nan
+    csv_eye_tracking[blink_mask, 2] = np.nan
+    csv_eye_tracking[blink_mask, 3] = 0
+    blink_index = blink_mask.astype(float)
+
+    return csv_eye_tracking, blink_index
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+def linear_interpolation_brackets(time_vector, new_time_vector):
+    """
+    This function computes, once for all the channels, the interval of time_vector in which each element of
+    new_time_vector falls (same intervals as scipy.interpolate.interp1d(kind="linear"), which also raises a ValueError
+    if a new time is outside of time_vector).
+    Returns the index of the lower and upper bounds of the interval, the time elapsed since the lower bound and the
+    duration of the interval.
+    """
+    time_vector = np.reshape(time_vector, (-1,))
+    new_time_vector = np.asarray(new_time_vector, dtype=float)
+
+    order = np.argsort(time_vector, kind="mergesort")
+    sorted_time_vector = time_vector[order]
+
+    if np.any(new_time_vector < sorted_time_vector[0]):
+        raise ValueError(f"A value in new_time_vector is below the interpolation range's minimum value ({sorted_time_vector[0]}).")
+    if np.any(new_time_vector > sorted_time_vector[-1]):
+        raise ValueError(f"A value in new_time_vector is above the interpolation range's maximum value ({sorted_time_vector[-1]}).")
+
+    # Same intervals as np.interp (used by interp1d for 1D data): time_vector[lower] <= new time < time_vector[upper]
+    index_lower = (np.searchsorted(sorted_time_vector, new_time_vector, side="right") - 1).clip(0, len(sorted_time_vector) - 2)
+    index_upper = index_lower + 1
+    # As in np.interp, the last time gets the value of the last frame (the interval is taken backward, time_since_lower = 0)
+    index_lower[new_time_vector == sorted_time_vector[-1]] = len(sorted_time_vector) - 1
+    index_upper[new_time_vector == sorted_time_vector[-1]] = len(sorted_time_vector) - 2
+    time_since_lower = new_time_vector - sorted_time_vector[index_lower]
+    interval_duration = sorted_time_vector[index_upper] - sorted_time_vector[index_lower]
+    return order[index_lower], order[index_upper], time_since_lower, interval_duration
+
+
+def interpolate_linear(data, brackets):
+    """
+    This function interpolates all the columns of data (frames x channels) at once on the new times described by
+    brackets (from linear_interpolation_brackets). The result is the same as one interp1d per column.
+    """
+    index_lower, index_upper, time_since_lower, interval_duration = brackets
+    data = np.asarray(data, dtype=float)
+    slope = (data[index_upper] - data[index_lower]) / interval_duration[:, np.newaxis]
+    return slope * time_since_lower[:, np.newaxis] + data[index_lower]
+
+
+def slerp_brackets(time_vector, new_time_vector):
+    """
+    This function finds, for each element of new_time_vector, the two frames of time_vector (sorted) around it and the
+    relative time between them (0 on the first frame, 1 on the second frame).
+    """
+    time_vector = np.reshape(time_vector, (-1,))
+    new_time_vector = np.asarray(new_time_vector, dtype=float)
+    index_1 = np.searchsorted(time_vector, new_time_vector, side="left")
+    index_0 = index_1 - 1
+    relative_time = (new_time_vector - time_vector[index_0]) / (time_vector[index_1] - time_vector[index_0])
+    return index_0, index_1, relative_time
+
+
+def quaternion_multiply(quat_0, quat_1):
+    w0, x0, y0, z0 = np.moveaxis(quat_0, -1, 0)
+    w1, x1, y1, z1 = np.moveaxis(quat_1, -1, 0)
+    return np.stack(
+        (
+            w0 * w1 - x0 * x1 - y0 * y1 - z0 * z1,
+            w0 * x1 + x0 * w1 + y0 * z1 - z0 * y1,
+            w0 * y1 - x0 * z1 + y0 * w1 + z0 * x1,
+            w0 * z1 + x0 * y1 - y0 * x1 + z0 * w1,
+        ),
+        axis=-1,
+    )
+
+
+def slerp(quat_0, quat_1, relative_time, shortest_path=True, normalize=False):
+    """
+    Spherical linear interpolation between the quaternions (w, x, y, z) in the last dimension of quat_0 and quat_1
+    (any number of samples and segments), computed as (quat_1 / quat_0) ** relative_time * quat_0 like
+    quaternion.slerp_evaluate, but on whole arrays.
+    If shortest_path is True, quat_1 is flipped when it is not in the same hemisphere as quat_0 (chordal distance larger
+    than sqrt(2), as in slerp_evaluate), so that the rotation goes the short way. If normalize is True, the interpolated
+    quaternions are normalized.
+    """
+    quat_0 = np.asarray(quat_0, dtype=float)
+    quat_1 = np.asarray(quat_1, dtype=float)
+    relative_time = np.asarray(relative_time, dtype=float)
+    if shortest_path:
+        chordal_distance = np.linalg.norm(quat_0 - quat_1, axis=-1, keepdims=True)
+        quat_1 = np.where(chordal_distance > np.sqrt(2), -quat_1, quat_1)
+
+    # Relative rotation quat_1 / quat_0 = quat_1 * conjugate(quat_0) / |quat_0|^2
+    quat_0_conjugate = quat_0 * np.array([1, -1, -1, -1])
+    relative_quat = quaternion_multiply(quat_1, quat_0_conjugate) / np.sum(quat_0 ** 2, axis=-1, keepdims=True)
+
+    # relative_quat ** relative_time = exp(relative_time * log(relative_quat))
+    w = relative_quat[..., 0]
+    vector = relative_quat[..., 1:]
+    vector_norm = np.linalg.norm(vector, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_norm = np.log(w ** 2 + vector_norm ** 2) / 2
+        angle = np.arctan2(vector_norm, w)
+        axis = vector / vector_norm[..., np.newaxis]
+    # Without vector part, the rotation is the identity (or an half turn around x if w < 0, as in numpy-quaternion)
+    no_vector = vector_norm <= 1e-14 * np.abs(w)
+    axis = np.where(no_vector[..., np.newaxis], np.array([1.0, 0, 0]), axis)
+    angle = np.where(no_vector, np.where(w < 0, np.pi, 0), angle)
+    log_norm = np.where(no_vector, np.log(np.abs(w)), log_norm)
+
+    scaled_angle = relative_time * angle
+    scaled_norm = np.exp(relative_time * log_norm)
+    power_quat = np.concatenate(
+        (
+            (scaled_norm * np.cos(scaled_angle))[..., np.newaxis],
+            (scaled_norm * np.sin(scaled_angle))[..., np.newaxis] * axis,
+        ),
+        axis=-1,
+    )
+    interpolated_quat = quaternion_multiply(power_quat, quat_0)
+    # A null relative time gives exactly quat_0
+    interpolated_quat = np.where((relative_time == 0)[..., np.newaxis], quat_0, interpolated_quat)
+
+    if normalize:
+        interpolated_quat = interpolated_quat / np.linalg.norm(interpolated_quat, axis=-1, keepdims=True)
+    return interpolated_quat
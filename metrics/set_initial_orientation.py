@@ -1,34 +1,58 @@
 import biorbd
 import numpy as np
 from IPython import embed
+from resampling import quaternion_multiply
+
+def rotation_matrix_to_quaternion(rotation_matrix):
+    """
+    This function converts a rotation matrix into a quaternion (w, x, y, z) with w >= 0, like
+    biorbd.Quaternion.fromMatrix, but using the largest diagonal term so that it also works for half turns.
+    """
+    trace = np.trace(rotation_matrix)
+    diagonal = np.diag(rotation_matrix)
+    if trace >= np.max(diagonal):
+        w = np.sqrt(1 + trace) / 2
+        quat = np.array([
+            w,
+            (rotation_matrix[2, 1] - rotation_matrix[1, 2]) / (4 * w),
+            (rotation_matrix[0, 2] - rotation_matrix[2, 0]) / (4 * w),
+            (rotation_matrix[1, 0] - rotation_matrix[0, 1]) / (4 * w),
+        ])
+    else:
+        i = np.argmax(diagonal)
+        j = (i + 1) % 3
+        k = (i + 2) % 3
+        quat = np.zeros((4, ))
+        quat[i + 1] = np.sqrt(1 + rotation_matrix[i, i] - rotation_matrix[j, j] - rotation_matrix[k, k]) / 2
+        quat[0] = (rotation_matrix[k, j] - rotation_matrix[j, k]) / (4 * quat[i + 1])
+        quat[j + 1] = (rotation_matrix[j, i] + rotation_matrix[i, j]) / (4 * quat[i + 1])
+        quat[k + 1] = (rotation_matrix[k, i] + rotation_matrix[i, k]) / (4 * quat[i + 1])
+    if quat[0] < 0:
+        quat = -quat
+    return quat
+
 
 def rotate_xsens(Xsens_position, Xsens_orientation, rotation_matrix, num_joints):
     """
     Actually doing the rotation of the Xsens data
+    The positions of all the frames and joints are rotated in one matrix product and the orientations in one quaternion
+    product with the quaternion of rotation_matrix (same results as rotating the matrix of each segment orientation).
     """
+    nb_frames = np.shape(Xsens_position)[0]
 
     # rotate the xsens positions around the hip
     Xsens_position_rotated = np.zeros(np.shape(Xsens_position))
-    for i in range(np.shape(Xsens_position)[0]):
-        for k in range(num_joints):
-            Xsens_position_rotated[i, 3*k : 3*(k+1)] = rotation_matrix @ Xsens_position[i, 3*k : 3*(k+1)]
+    joint_positions = np.reshape(Xsens_position[:, : 3 * num_joints], (nb_frames * num_joints, 3))
+    Xsens_position_rotated[:, : 3 * num_joints] = np.reshape(joint_positions @ rotation_matrix.T, (nb_frames, 3 * num_joints))
 
     Xsens_orientation_rotated = np.zeros(np.shape(Xsens_orientation))
     Xsens_orientation_rotated[:, :] = Xsens_orientation[:, :]
-    for i_segment in range(23):
-        for i in range(np.shape(Xsens_orientation)[0]):
-            Quat_normalized = Xsens_orientation[i, i_segment*4:(i_segment+1)*4] / np.linalg.norm(
-                Xsens_orientation[i, i_segment*4:(i_segment+1)*4]
-            )
-            Quat = biorbd.Quaternion(Quat_normalized[0], Quat_normalized[1], Quat_normalized[2],
-                                          Quat_normalized[3])
-            RotMat = biorbd.Quaternion.toMatrix(Quat).to_array()
-            RotMat_rotated = rotation_matrix @ RotMat
-
-            Quat_rotated = biorbd.Quaternion.fromMatrix(biorbd.Rotation(RotMat_rotated[0, 0], RotMat_rotated[0, 1], RotMat_rotated[0, 2],
-                                                                             RotMat_rotated[1, 0], RotMat_rotated[1, 1], RotMat_rotated[1, 2],
-                                                                             RotMat_rotated[2, 0], RotMat_rotated[2, 1], RotMat_rotated[2, 2])).to_array()
-            Xsens_orientation_rotated[i, i_segment*4:(i_segment+1)*4] = Quat_rotated
+    segment_quaternions = np.reshape(Xsens_orientation[:, : 23 * 4], (nb_frames, 23, 4))
+    segment_quaternions = segment_quaternions / np.linalg.norm(segment_quaternions, axis=2, keepdims=True)
+    rotated_quaternions = quaternion_multiply(rotation_matrix_to_quaternion(rotation_matrix), segment_quaternions)
+    # Same hemisphere as biorbd.Quaternion.fromMatrix (w >= 0)
+    rotated_quaternions[rotated_quaternions[:, :, 0] < 0] *= -1
+    Xsens_orientation_rotated[:, : 23 * 4] = np.reshape(rotated_quaternions, (nb_frames, 23 * 4))
 
     return Xsens_position_rotated, Xsens_orientation_rotated
 
@@ -77,10 +101,10 @@ def rotate_pelvis_to_initial_orientation(num_joints, move_orientation, Xsens_pos
     Xsens_position_rotated, Xsens_orientation_rotated = rotate_xsens(Xsens_position, Xsens_orientation, rotation_matrix, num_joints)
 
     # import matplotlib.pyplot as plt
-    # from animate_JCS import plot_gymnasium
+    # from gaze_position_gymnasium import Gymnasium
     # fig = plt.figure()
     # ax = plt.axes(projection='3d')
-    # plot_gymnasium(3 + 121 * 0.0254 / 2, ax)
+    # Gymnasium().plot(ax)
     # for i in range(num_joints):
     #     ax.plot(Xsens_position_rotated[pelvis_resting_frames[0], 3*i], Xsens_position_rotated[pelvis_resting_frames[0], 3*i+1], Xsens_position_rotated[pelvis_resting_frames[0], 3*i+2], '.b')
     #     ax.plot(Xsens_position[pelvis_resting_frames[0], 3*i], Xsens_position[pelvis_resting_frames[0], 3*i+1], Xsens_position[pelvis_resting_frames[0], 3*i+2], '.k')
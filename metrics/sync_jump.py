@@ -9,39 +9,44 @@ import pandas as pd
 import mpl_toolkits.mplot3d.axes3d as p3
 import matplotlib.animation as animation
 from os.path import exists
-from casadi import *
 import itertools
+import hashlib
+from interval_membership import samples_in_intervals
+from closest_index import find_closest_index
 
 def moving_average(data_to_be_averaged, moving_average_window_size):
-
-    if len(np.shape(data_to_be_averaged)) == 1:
-        data_averaged = np.zeros((np.shape(data_to_be_averaged)[0]))
-        for i in range(np.shape(data_to_be_averaged)[0]):
-            if i < moving_average_window_size:
-                data_averaged[i] = np.mean(data_to_be_averaged[:2*i+1])
-            elif i > (np.shape(data_to_be_averaged)[0] - moving_average_window_size - 1):
-                data_averaged[i] = np.mean(
-                    data_to_be_averaged[-2*(np.shape(data_to_be_averaged)[0]-i)+1:]
-                )
-            else:
-                data_averaged[i] = np.mean(
-                    data_to_be_averaged[i - moving_average_window_size : i + moving_average_window_size + 1]
-                )
-    elif len(np.shape(data_to_be_averaged)) == 2:
-        data_averaged = np.zeros(np.shape(data_to_be_averaged))
-        for j in range(np.shape(data_to_be_averaged)[1]):
-            for i in range(np.shape(data_to_be_averaged)[0]):
-                if i < moving_average_window_size:
-                    data_averaged[i, j] = np.mean(data_to_be_averaged[:2*i+1, j])
-                elif i > (np.shape(data_to_be_averaged)[0] - moving_average_window_size - 1):
-                    data_averaged[i, j] = np.mean(
-                        data_to_be_averaged[-2*(np.shape(data_to_be_averaged)[0]-i)+1:, j]
-                    )
-                else:
-                    data_averaged[i, j] = np.mean(data_to_be_averaged[i - moving_average_window_size : i + moving_average_window_size + 1, j])
-    else:
-        print('ioci')
-
+    """
+    Centered moving average of 2 * moving_average_window_size + 1 points along the first axis (1D or 2D data).
+    At the edges, the window shrinks so that it stays centered ([:2*i+1] at the beginning and [2*i-N+1:] at the end).
+    The sums over the windows are computed with cumulative sums, so the cost does not depend on the window size.
+    """
+    data_to_be_averaged = np.asarray(data_to_be_averaged, dtype=float)
+    nb_frames = np.shape(data_to_be_averaged)[0]
+
+    frames = np.arange(nb_frames)
+    window_start = frames - moving_average_window_size
+    window_end = frames + moving_average_window_size + 1
+    is_beginning = frames < moving_average_window_size
+    is_end = ~is_beginning & (frames > nb_frames - moving_average_window_size - 1)
+    window_start[is_beginning] = 0
+    window_end[is_beginning] = np.minimum(2 * frames[is_beginning] + 1, nb_frames)
+    window_start[is_end] = np.maximum(2 * frames[is_end] - nb_frames + 1, 0)
+    window_end[is_end] = nb_frames
+
+    # The 1D data is treated as a single column
+    data_columns = np.reshape(data_to_be_averaged, (nb_frames, -1))
+
+    # nan and inf are not added to the cumulative sums, the windows containing them are averaged directly
+    is_finite = np.isfinite(data_columns)
+    cumulative_sum = np.vstack((np.zeros((1, data_columns.shape[1])), np.cumsum(np.where(is_finite, data_columns, 0), axis=0)))
+    cumulative_non_finite = np.vstack((np.zeros((1, data_columns.shape[1]), dtype=int), np.cumsum(~is_finite, axis=0)))
+
+    data_averaged = (cumulative_sum[window_end] - cumulative_sum[window_start]) / (window_end - window_start)[:, np.newaxis]
+    has_non_finite = (cumulative_non_finite[window_end] - cumulative_non_finite[window_start]) > 0
+    for i, j in zip(*np.where(has_non_finite)):
+        data_averaged[i, j] = np.mean(data_columns[window_start[i] : window_end[i], j])
+
+    data_averaged = np.reshape(data_averaged, np.shape(data_to_be_averaged))
     return data_averaged
 
 def plot_xsens_threshold_selection(time_vector_xsens, Xsens_sensorFreeAcceleration_averaged_norm, moving_average_window_size, idx_jump_candidates_xsens, candidate_start_xsens, candidate_end_xsens):
@@ -273,66 +278,177 @@ def chose_closest_index_xsens(time_vector_pupil,
                               end_of_move_index):
     """
     This function finds the closest index in the Xsens time vector to the pupil time vector
+    All the starts and ends of jumps and moves are mapped with a single sorted search on the Xsens time vector.
     """
 
     time_vector_pupil_offset = time_vector_pupil - time_offset
-    xsens_start_of_jump_index = np.zeros((len(start_of_jump_pupil_index)))
-    xsens_end_of_jump_index = np.zeros((len(start_of_jump_pupil_index)))
-    for i in range(len(start_of_jump_pupil_index)):
-        xsens_start_of_jump_index[i] = np.argmin(
-            np.abs(time_vector_pupil_offset[int(start_of_jump_pupil_index[i])] - time_vector_xsens)
-        )
-        xsens_end_of_jump_index[i] = np.argmin(
-            np.abs(time_vector_pupil_offset[int(end_of_jump_pupil_index[i])] - time_vector_xsens)
-        )
-
-    xsens_start_of_move_index = np.zeros((len(start_of_move_index)))
-    xsens_end_of_move_index = np.zeros((len(start_of_move_index)))
-    for i in range(len(start_of_move_index)):
-        xsens_start_of_move_index[i] = np.argmin(
-            np.abs(time_vector_pupil_offset[int(start_of_move_index[i])] - time_vector_xsens)
-        )
-        xsens_end_of_move_index[i] = np.argmin(
-            np.abs(time_vector_pupil_offset[int(end_of_move_index[i])] - time_vector_xsens)
-        )
+    pupil_index = np.hstack((
+        np.asarray(start_of_jump_pupil_index, dtype=float),
+        np.asarray(end_of_jump_pupil_index, dtype=float)[:len(start_of_jump_pupil_index)],
+        np.asarray(start_of_move_index, dtype=float),
+        np.asarray(end_of_move_index, dtype=float)[:len(start_of_move_index)],
+    )).astype(int)
+    time_vector_xsens = np.reshape(time_vector_xsens, (-1,))
+    if np.all(time_vector_xsens[1:] >= time_vector_xsens[:-1]):
+        xsens_index = find_closest_index(time_vector_xsens, time_vector_pupil_offset[pupil_index]).astype(float)
+    else:
+        xsens_index = np.array([np.argmin(np.abs(time_vector_pupil_offset[i] - time_vector_xsens)) for i in pupil_index], dtype=float)
+
+    nb_jumps = len(start_of_jump_pupil_index)
+    nb_moves = len(start_of_move_index)
+    xsens_start_of_jump_index = xsens_index[:nb_jumps]
+    xsens_end_of_jump_index = xsens_index[nb_jumps : 2 * nb_jumps]
+    xsens_start_of_move_index = xsens_index[2 * nb_jumps : 2 * nb_jumps + nb_moves]
+    xsens_end_of_move_index = xsens_index[2 * nb_jumps + nb_moves :]
     return xsens_start_of_jump_index, xsens_end_of_jump_index, xsens_start_of_move_index, xsens_end_of_move_index, time_vector_pupil_offset
 
-def optim_time(time_vector_pupil, time_vector_xsens, start_of_jump_pupil_index_this_time, end_of_jump_pupil_index_this_time, candidate_start_xsens_this_time, candidate_end_xsens_this_time, diff_time, time_offset, pupil_start_index_optim, pupil_end_index_optim, candidate_start_xsens_index_optim, candidate_end_xsens_index_optim):
+def jump_matching_residual(first_differences, first_squared_differences, nb_differences):
+    """
+    Minimal value over the time offset d of sum((differences - d) ** 2), from the sum of the differences and the sum of
+    their squares. The minimum is reached for d = mean(differences).
+    """
+    return first_squared_differences - first_differences ** 2 / nb_differences
+
+
+def optim_time(time_vector_pupil, time_vector_xsens, start_of_jump_pupil_index, end_of_jump_pupil_index, candidate_start_xsens, candidate_end_xsens, comb_xsens, comb_pupil, diff_time):
     """
     This function optimizes the time offset between the Xsens and the Pupil data.
     Xsens begining and end of jumps are determined with the acceleration profile.
     Pupil begining and end of jumps are determined with the manual labeling of the eye-tracking data.
+    comb_xsens and comb_pupil contain the indices of the jumps of each combination (one combination per line), all the
+    pairs (xsens combination, pupil combination) are evaluated in the order of itertools.product.
+    The objective sum((t_pupil - time_offset - t_xsens) ** 2) over the starts and ends of the jumps is quadratic, so its
+    minimum is reached for time_offset = mean(t_pupil - t_xsens) and the residual is the sum of the squared deviations.
+    The residual is accumulated one jump at a time and the pairs whose partial residual (which can only increase) is
+    already larger than the best residual are dropped.
+    Returns the best residual (if lower than diff_time), the time offset and the index of the best pair of
+    combinations (None if no pair is lower than diff_time).
     """
-    x0 = - (time_vector_xsens[candidate_start_xsens_this_time[0]] - time_vector_pupil[start_of_jump_pupil_index_this_time.astype(int)[0]])
+    nb_jumps = comb_xsens.shape[1]
+    if nb_jumps == 0:
+        return diff_time, 0, None
+
+    # Times of the start and end of the jumps of each combination, ordered as start_0, end_0, start_1, end_1, ...
+    times_xsens = np.zeros((comb_xsens.shape[0], 2 * nb_jumps))
+    times_xsens[:, 0::2] = np.reshape(time_vector_xsens, (-1,))[candidate_start_xsens[comb_xsens]]
+    times_xsens[:, 1::2] = np.reshape(time_vector_xsens, (-1,))[candidate_end_xsens[comb_xsens]]
+    times_pupil = np.zeros((comb_pupil.shape[0], 2 * nb_jumps))
+    times_pupil[:, 0::2] = time_vector_pupil[start_of_jump_pupil_index.astype(int)[comb_pupil]]
+    times_pupil[:, 1::2] = time_vector_pupil[end_of_jump_pupil_index.astype(int)[comb_pupil]]
 
-    time_diff = SX.sym("time_diff", 1)
-    f = sum1(
-        (
-                (time_vector_pupil[start_of_jump_pupil_index_this_time.astype(int)] - time_diff)
-                - np.reshape(time_vector_xsens[candidate_start_xsens_this_time], len(candidate_start_xsens_this_time))
-        )
-        ** 2
-    ) + sum1(
-        (
-                (time_vector_pupil[end_of_jump_pupil_index_this_time.astype(int)] - time_diff)
-                - np.reshape(time_vector_xsens[candidate_end_xsens_this_time], len(candidate_end_xsens_this_time))
-        )
-        ** 2
+    time_offset = 0
+    best_pair = None
+    # The pairs are evaluated by blocks of xsens combinations to limit the memory used
+    block_size = max(1, 1000000 // max(1, comb_pupil.shape[0]))
+    for block_start in range(0, comb_xsens.shape[0], block_size):
+        block_xsens = np.arange(block_start, min(block_start + block_size, comb_xsens.shape[0]))
+        pair_xsens = np.repeat(block_xsens, comb_pupil.shape[0])
+        pair_pupil = np.tile(np.arange(comb_pupil.shape[0]), len(block_xsens))
+        sum_differences = np.zeros((len(pair_xsens),))
+        sum_squared_differences = np.zeros((len(pair_xsens),))
+        for i_time in range(2 * nb_jumps):
+            differences = times_pupil[pair_pupil, i_time] - times_xsens[pair_xsens, i_time]
+            sum_differences += differences
+            sum_squared_differences += differences ** 2
+            residual = jump_matching_residual(sum_differences, sum_squared_differences, i_time + 1)
+            still_candidate = residual < diff_time
+            pair_xsens = pair_xsens[still_candidate]
+            pair_pupil = pair_pupil[still_candidate]
+            sum_differences = sum_differences[still_candidate]
+            sum_squared_differences = sum_squared_differences[still_candidate]
+            residual = residual[still_candidate]
+        if len(residual) > 0:
+            # The first pair is kept in case of a tie, as it is the first one evaluated
+            i_best = np.argmin(residual)
+            diff_time = residual[i_best]
+            time_offset = sum_differences[i_best] / (2 * nb_jumps)
+            best_pair = (pair_xsens[i_best], pair_pupil[i_best])
+
+    return diff_time, time_offset, best_pair
+
+
+def cross_correlation_offset(time_vector_pupil, start_of_jump_pupil_index, end_of_jump_pupil_index, time_vector_xsens, idx_jump_candidates_xsens):
+    """
+    This function finds the time offset between the Xsens and the Pupil data by cross-correlating the Xsens free fall
+    indicator (acceleration norm below the threshold) with the Pupil airborne indicator (between the labeled start and
+    end of the jumps), both resampled on a grid at the Xsens frequency. The correlation is computed with FFT, so the
+    cost does not depend on the number of jumps.
+    Returns the time offset (time_vector_pupil - time_offset matches time_vector_xsens), the confidence (normalized
+    correlation at the peak, between -1 and 1) and the width of the correlation peak at half maximum [s].
+    """
+    time_vector_xsens = np.reshape(time_vector_xsens, (-1,))
+    dt = np.median(np.diff(time_vector_xsens))
+
+    grid_xsens = np.arange(0, time_vector_xsens[-1] + dt / 2, dt)
+    xsens_airborne = np.interp(grid_xsens, time_vector_xsens, idx_jump_candidates_xsens)
+    grid_pupil = np.arange(0, np.nanmax(time_vector_pupil) + dt / 2, dt)
+    pupil_airborne = samples_in_intervals(
+        grid_pupil,
+        time_vector_pupil[np.asarray(start_of_jump_pupil_index).astype(int)],
+        time_vector_pupil[np.asarray(end_of_jump_pupil_index).astype(int)],
     )
-    nlp = {"x": time_diff, "f": f}
-    opts = {"ipopt.print_level": 0, "print_time": 0}
-    solver = nlpsol("solver", "ipopt", nlp, opts)
-    sol = solver(x0=x0)
 
-    if sol["f"] < diff_time:
-        diff_time = np.array([sol["f"]])[0][0][0]
-        time_offset = np.array([sol["x"]])[0][0][0]
-        pupil_start_index_optim = start_of_jump_pupil_index_this_time
-        pupil_end_index_optim = end_of_jump_pupil_index_this_time
-        candidate_start_xsens_index_optim = candidate_start_xsens_this_time
-        candidate_end_xsens_index_optim = candidate_end_xsens_this_time
+    xsens_airborne = xsens_airborne - np.mean(xsens_airborne)
+    pupil_airborne = pupil_airborne - np.mean(pupil_airborne)
+    norm = np.sqrt(np.sum(xsens_airborne ** 2) * np.sum(pupil_airborne ** 2))
+    if norm == 0:
+        return 0, 0, np.inf
+
+    # correlation[k] = sum(pupil_airborne[n + lags[k]] * xsens_airborne[n])
+    correlation = signal.correlate(pupil_airborne, xsens_airborne, mode="full", method="fft") / norm
+    lags = signal.correlation_lags(len(pupil_airborne), len(xsens_airborne), mode="full")
+    peak = np.argmax(correlation)
+    confidence = correlation[peak]
+
+    # Parabolic interpolation of the peak to get an offset finer than the grid
+    peak_lag = float(lags[peak])
+    if 0 < peak < len(correlation) - 1:
+        curvature = correlation[peak - 1] - 2 * correlation[peak] + correlation[peak + 1]
+        if curvature < 0:
+            peak_lag += 0.5 * (correlation[peak - 1] - correlation[peak + 1]) / curvature
+    time_offset = peak_lag * dt
 
-    return diff_time, time_offset, pupil_start_index_optim, pupil_end_index_optim, candidate_start_xsens_index_optim, candidate_end_xsens_index_optim
+    below_half_maximum = np.where(correlation <= confidence / 2)[0]
+    left = below_half_maximum[below_half_maximum < peak]
+    right = below_half_maximum[below_half_maximum > peak]
+    left = left[-1] if len(left) > 0 else -1
+    right = right[0] if len(right) > 0 else len(correlation)
+    peak_width = (right - left - 1) * dt
+
+    return time_offset, confidence, peak_width
+
+
+# Increment if the synchronisation changes, so that the saved results are recomputed
+SYNC_RESULTS_VERSION = 1
+
+
+def sync_inputs_key(*inputs):
+    """
+    Hash of the inputs of the synchronisation (arrays, lists, numbers or str).
+    """
+    hash_function = hashlib.blake2b()
+    hash_function.update(str(SYNC_RESULTS_VERSION).encode("utf-8"))
+    for sync_input in inputs:
+        if isinstance(sync_input, str):
+            hash_function.update(b"str" + sync_input.encode("utf-8"))
+        else:
+            sync_input = np.ascontiguousarray(sync_input, dtype=float)
+            hash_function.update(str(sync_input.shape).encode("utf-8") + sync_input.tobytes())
+    return hash_function.hexdigest()
+
+
+def load_sync_results(sync_results_name, sync_key):
+    """
+    Returns the synchronisation results saved in sync_results_name if they were computed from the same inputs, None
+    otherwise.
+    """
+    if sync_results_name is None or not exists(sync_results_name):
+        return None
+    with open(sync_results_name, "rb") as handle:
+        sync_results = pickle.load(handle)
+    if sync_results["key"] != sync_key:
+        return None
+    return sync_results
 
 
 def sync_jump(
@@ -349,11 +465,18 @@ def sync_jump(
     air_time_threshold,
     Xsens_jump_idx,
     Pupil_jump_idx,
+    sync_method="combinations",
+    cross_correlation_confidence_threshold=0.5,
+    sync_results_name=None,
 ):
     """
     Synchronize the Xsens and Pupil data, by minimizing the difference between the start and end timestamps.
     The Pupil timestamps are identified through labeling and the Xsens timestamps are identified through the acceleration profile.
     It returns the pupil time vector that is shifted to match the Xsens timestamps. 
+    If sync_method is "cross_correlation", the offset is first estimated by cross-correlation of the airborne phases and
+    the combinations of jumps are only used if the confidence is lower than cross_correlation_confidence_threshold.
+    If sync_results_name is given, the results (offset, matched jumps, start and end indices, residual) are saved in
+    this file and reused as long as the inputs of the synchronisation are unchanged (no computation and no plot).
     """
 
     # remove nans at the beginning of the trial from csv_eye_tracking
@@ -365,6 +488,34 @@ def sync_jump(
     time_vector_pupil = (csv_eye_tracking[:, 0] - csv_eye_tracking[0, 0]) / 1e9
     time_vector_xsens = (Xsens_ms - Xsens_ms[0]) / 1000
 
+    sync_key = sync_inputs_key(
+        Xsens_sensorFreeAcceleration[:, 6:9],
+        Xsens_ms,
+        csv_eye_tracking[:, 0],
+        start_of_jump_pupil_index,
+        end_of_jump_pupil_index,
+        start_of_move_index,
+        end_of_move_index,
+        max_threshold,
+        air_time_threshold,
+        Xsens_jump_idx,
+        Pupil_jump_idx,
+        sync_method,
+        cross_correlation_confidence_threshold,
+    )
+    sync_results = load_sync_results(sync_results_name, sync_key)
+    if sync_results is not None:
+        print(f"Synchronisation results loaded from {sync_results_name}")
+        return (
+            sync_results["xsens_start_of_jump_index"],
+            sync_results["xsens_end_of_jump_index"],
+            sync_results["xsens_start_of_move_index"],
+            sync_results["xsens_end_of_move_index"],
+            time_vector_xsens,
+            time_vector_pupil - sync_results["time_offset"],
+            csv_eye_tracking,
+        )
+
     # moving average of the acceleration to smooth the signal
     moving_average_window_size = 3
     Xsens_sensorFreeAcceleration_averaged = moving_average(Xsens_sensorFreeAcceleration[:, 6:9], moving_average_window_size)
@@ -429,70 +580,59 @@ def sync_jump(
         )
 
     diff_time = 10000
-    time_offset = 0
     pupil_start_index_optim = 0
     pupil_end_index_optim = 0
     candidate_start_xsens_index_optim = 0
     candidate_end_xsens_index_optim = 0
 
-    if len(Pupil_jump_idx) == 0:
-        if min(len(candidate_start_xsens), len(start_of_jump_pupil_index)) > 2:
-            nb_jumps_considered = min(len(candidate_start_xsens), len(start_of_jump_pupil_index)) - 2
+    time_offset = None
+    confidence = np.nan
+    if sync_method == "cross_correlation":
+        cross_correlation_time_offset, confidence, peak_width = cross_correlation_offset(
+            time_vector_pupil, start_of_jump_pupil_index, end_of_jump_pupil_index, time_vector_xsens, idx_jump_candidates_xsens)
+        print(f"Cross-correlation synchronisation: offset = {cross_correlation_time_offset:.3f}s, confidence = {confidence:.2f}, peak width = {peak_width:.3f}s")
+        if confidence >= cross_correlation_confidence_threshold:
+            time_offset = cross_correlation_time_offset
+            diff_time = np.nan
+            pupil_start_index_optim = start_of_jump_pupil_index
+            pupil_end_index_optim = end_of_jump_pupil_index
+            candidate_start_xsens_index_optim = candidate_start_xsens
+            candidate_end_xsens_index_optim = candidate_end_xsens
         else:
-            nb_jumps_considered = min(len(candidate_start_xsens), len(start_of_jump_pupil_index))
-
-        comb_tuple_xsens = list(itertools.combinations(range(len(candidate_start_xsens)), nb_jumps_considered))
-        comb_xsens = []
-        for comb_i in comb_tuple_xsens:
-            temp_comb_xsens = np.zeros((len(candidate_start_xsens),))
-            for j in comb_i:
-                temp_comb_xsens[j] = True
-            comb_xsens += [temp_comb_xsens.astype(int)]
-
-        comb_tuple_pupil = list(itertools.combinations(range(len(start_of_jump_pupil_index)), nb_jumps_considered))
-        comb_pupil = []
-        for comb_i in comb_tuple_pupil:
-            temp_comb_pupil = np.zeros((len(start_of_jump_pupil_index),))
-            for j in comb_i:
-                temp_comb_pupil[j] = True
-            comb_pupil += [temp_comb_pupil.astype(int)]
-
-        combine_lists = list(itertools.product(comb_xsens, comb_pupil))
-
-    else:
-        temp_comb_xsens = np.zeros((len(candidate_start_xsens),))
-        temp_comb_pupil = np.zeros((len(start_of_jump_pupil_index),))
-        for i in Pupil_jump_idx:
-            temp_comb_pupil[i] = 1
-        for i in Xsens_jump_idx:
-            temp_comb_xsens[i] = 1
-        combine_lists = [(np.array(temp_comb_xsens).astype(int), np.array(temp_comb_pupil).astype(int))]
-
-    for i in range(len(combine_lists)):
-        comb_xsens_i = combine_lists[i][0]
-        comb_xsens_i = comb_xsens_i.astype(bool)
-        comb_pupil_i = combine_lists[i][1]
-        comb_pupil_i = comb_pupil_i.astype(bool)
-
-        candidate_start_xsens_this_time = candidate_start_xsens[comb_xsens_i]
-        candidate_end_xsens_this_time = candidate_end_xsens[comb_xsens_i]
-        start_of_jump_pupil_index_this_time = start_of_jump_pupil_index[comb_pupil_i]
-        end_of_jump_pupil_index_this_time = end_of_jump_pupil_index[comb_pupil_i]
-        diff_time, time_offset, pupil_start_index_optim, pupil_end_index_optim, candidate_start_xsens_index_optim, candidate_end_xsens_index_optim = optim_time(
-            time_vector_pupil, time_vector_xsens, start_of_jump_pupil_index_this_time,
-            end_of_jump_pupil_index_this_time, candidate_start_xsens_this_time,
-            candidate_end_xsens_this_time, diff_time, time_offset, pupil_start_index_optim, pupil_end_index_optim,
-            candidate_start_xsens_index_optim, candidate_end_xsens_index_optim)
-
-        xsens_start_of_jump_index, xsens_end_of_jump_index, xsens_start_of_move_index, xsens_end_of_move_index, time_vector_pupil_offset = chose_closest_index_xsens(
-            time_vector_pupil,
-            time_offset,
-            start_of_jump_pupil_index,
-            end_of_jump_pupil_index,
-            time_vector_xsens,
-            start_of_move_index,
-            end_of_move_index)
+            print("The confidence is too low, the combinations of jumps are used instead")
+    elif sync_method != "combinations":
+        raise RuntimeError(f"sync_method {sync_method} is not implemented, use 'combinations' or 'cross_correlation'")
+
+    if time_offset is None:
+        if len(Pupil_jump_idx) == 0:
+            if min(len(candidate_start_xsens), len(start_of_jump_pupil_index)) > 2:
+                nb_jumps_considered = min(len(candidate_start_xsens), len(start_of_jump_pupil_index)) - 2
+            else:
+                nb_jumps_considered = min(len(candidate_start_xsens), len(start_of_jump_pupil_index))
 
+            comb_xsens = np.array(list(itertools.combinations(range(len(candidate_start_xsens)), nb_jumps_considered)), dtype=int)
+            comb_pupil = np.array(list(itertools.combinations(range(len(start_of_jump_pupil_index)), nb_jumps_considered)), dtype=int)
+        else:
+            comb_xsens = np.array([sorted(set(Xsens_jump_idx))], dtype=int)
+            comb_pupil = np.array([sorted(set(Pupil_jump_idx))], dtype=int)
+
+        diff_time, time_offset, best_pair = optim_time(
+            time_vector_pupil, time_vector_xsens, start_of_jump_pupil_index, end_of_jump_pupil_index,
+            candidate_start_xsens, candidate_end_xsens, comb_xsens, comb_pupil, diff_time)
+        if best_pair is not None:
+            pupil_start_index_optim = start_of_jump_pupil_index[comb_pupil[best_pair[1]]]
+            pupil_end_index_optim = end_of_jump_pupil_index[comb_pupil[best_pair[1]]]
+            candidate_start_xsens_index_optim = candidate_start_xsens[comb_xsens[best_pair[0]]]
+            candidate_end_xsens_index_optim = candidate_end_xsens[comb_xsens[best_pair[0]]]
+
+    xsens_start_of_jump_index, xsens_end_of_jump_index, xsens_start_of_move_index, xsens_end_of_move_index, time_vector_pupil_offset = chose_closest_index_xsens(
+        time_vector_pupil,
+        time_offset,
+        start_of_jump_pupil_index,
+        end_of_jump_pupil_index,
+        time_vector_xsens,
+        start_of_move_index,
+        end_of_move_index)
 
     if FLAG_SYNCHRO_PLOTS:
         plot_synchro(
@@ -517,6 +657,24 @@ def sync_jump(
             output_file_name,
         )
 
+    if sync_results_name is not None:
+        sync_results = {
+            "key": sync_key,
+            "time_offset": time_offset,
+            "residual": diff_time,
+            "confidence": confidence,
+            "pupil_start_index_optim": pupil_start_index_optim,
+            "pupil_end_index_optim": pupil_end_index_optim,
+            "candidate_start_xsens_index_optim": candidate_start_xsens_index_optim,
+            "candidate_end_xsens_index_optim": candidate_end_xsens_index_optim,
+            "xsens_start_of_jump_index": xsens_start_of_jump_index,
+            "xsens_end_of_jump_index": xsens_end_of_jump_index,
+            "xsens_start_of_move_index": xsens_start_of_move_index,
+            "xsens_end_of_move_index": xsens_end_of_move_index,
+        }
+        with open(sync_results_name, "wb") as handle:
+            pickle.dump(sync_results, handle)
+
     return (
         xsens_start_of_jump_index,
         xsens_end_of_jump_index,
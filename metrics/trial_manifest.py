@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+
+# Columns of Trials_name_mapping.csv which are used in the analysis
+SUBJECT_NAME_COLUMN = 0
+MOVE_NAMES_COLUMN = 1
+REPETITION_NUMBER_COLUMN = 2
+MOVE_ORIENTATION_COLUMN = 3
+XSENS_FILE_NAME_COLUMN = 4
+EYE_TRACKING_FOLDER_COLUMN = 10
+MOVIE_NAME_COLUMN = 11
+SUBJECT_EXPERTISE_COLUMN = 13
+MAX_THRESHOLD_COLUMN = 16
+AIR_TIME_THRESHOLD_COLUMN = 17
+XSENS_JUMP_IDX_COLUMN = 18
+PUPIL_JUMP_IDX_COLUMN = 19
+PUPIL_FRAMES_ZERO_COLUMN = 20
+XSENS_FRAMES_ZERO_COLUMN = 21
+INCLUDE_COLUMN = 22
+TWIST_SIDE_COLUMN = 25
+
+TrialRecord = namedtuple(
+    "TrialRecord",
+    [
+        "subject_name",
+        "move_names",
+        "repetition_number",
+        "move_orientation",
+        "xsens_file_name",
+        "eye_tracking_folder",
+        "movie_name",
+        "subject_expertise",
+        "max_threshold",
+        "air_time_threshold",
+        "Xsens_jump_idx",
+        "Pupil_jump_idx",
+        "Pupil_frames_zero",
+        "Xsens_frames_zero",
+        "include",
+        "twist_side",
+    ],
+)
+
+
+def split_ints(text, default):
+    return [int(x) for x in text.split()] if text != "" else default
+
+
+def split_float(text, default):
+    return float(text) if text != "" else default
+
+
+def parse_trial_row(row):
+    """
+    This function converts one line of Trials_name_mapping.csv (list of str) into a TrialRecord.
+    Empty cells take the default values used in the analysis.
+    The numeric fields are only converted for the included trials (they are None for the excluded trials), so that an
+    excluded line with bad numbers is never a problem.
+    """
+    row = list(row) + [""] * (TWIST_SIDE_COLUMN + 1 - len(row))
+    include = row[INCLUDE_COLUMN] == "True"
+    record = TrialRecord(
+        subject_name=row[SUBJECT_NAME_COLUMN],
+        move_names=row[MOVE_NAMES_COLUMN].split(" "),
+        repetition_number=row[REPETITION_NUMBER_COLUMN].split(" "),
+        move_orientation=None,
+        xsens_file_name=row[XSENS_FILE_NAME_COLUMN],
+        eye_tracking_folder=row[EYE_TRACKING_FOLDER_COLUMN],
+        movie_name=row[MOVIE_NAME_COLUMN].replace(".", "_"),
+        subject_expertise=row[SUBJECT_EXPERTISE_COLUMN],
+        max_threshold=None,
+        air_time_threshold=None,
+        Xsens_jump_idx=None,
+        Pupil_jump_idx=None,
+        Pupil_frames_zero=None,
+        Xsens_frames_zero=None,
+        include=include,
+        twist_side=row[TWIST_SIDE_COLUMN],
+    )
+    if not include:
+        return record
+
+    return record._replace(
+        move_orientation=split_ints(row[MOVE_ORIENTATION_COLUMN], []),
+        max_threshold=split_float(row[MAX_THRESHOLD_COLUMN], 2),
+        air_time_threshold=split_float(row[AIR_TIME_THRESHOLD_COLUMN], 0.25),
+        Xsens_jump_idx=split_ints(row[XSENS_JUMP_IDX_COLUMN], []),
+        Pupil_jump_idx=split_ints(row[PUPIL_JUMP_IDX_COLUMN], []),
+        # No zero for Pupil, we decided to trust their zero since it is odd to find a personal zero for each subject
+        Pupil_frames_zero=split_ints(row[PUPIL_FRAMES_ZERO_COLUMN], [0, 30]),
+        Xsens_frames_zero=split_ints(row[XSENS_FRAMES_ZERO_COLUMN], [0, 30]),
+    )
+
+
+class TrialManifest:
+    """
+    Content of Trials_name_mapping.csv, parsed once into TrialRecords (in the order of the file).
+    The trials can be looked up by subject, move or movie name without scanning the table.
+    """
+
+    def __init__(self, csv_name):
+        trial_table = np.char.split(pd.read_csv(csv_name, sep="\t").values.astype("str"), sep=",")
+        self.records = [parse_trial_row(trial_table[i_trial][0]) for i_trial in range(len(trial_table))]
+
+        self.by_subject = {}
+        self.by_move = {}
+        self.by_movie = {}
+        for record in self.records:
+            self.by_subject.setdefault(record.subject_name, []).append(record)
+            for move_name in set(record.move_names):
+                self.by_move.setdefault(move_name, []).append(record)
+            self.by_movie[record.movie_name] = record
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def included_trials(self):
+        """
+        Trials marked as included (column 22 == "True") in the table.
+        """
+        return [record for record in self.records if record.include]
+
+    def twist_side(self, subject_name):
+        """
+        Twist side of the subject (the value of the last line of this subject in the table is used).
+        """
+        return self.by_subject[subject_name][-1].twist_side
+
+
+def check_excluded_rows_are_not_converted():
+    """
+    This function checks that an excluded line of the table with bad numbers does not prevent loading the table, and
+    that the included trials and the twist sides are still available.
+    """
+    import os
+    import tempfile
+
+    header = ",".join([f"column_{i}" for i in range(TWIST_SIDE_COLUMN + 1)])
+    included_row = ["SubjectA", "4-/ 41/", "1 1", "0 1", "SubjectA_xsens", "", "", "", "", "", "SubjectA_folder",
+                    "SubjectA.movie", "", "Elite", "", "", "3.5", "0.3", "10 20", "11 21", "", "0 30", "True", "", "",
+                    "G"]
+    excluded_row = ["SubjectB", "8--o", "1", "0?", "SubjectB_xsens", "", "", "", "", "", "SubjectB_folder",
+                    "SubjectB.movie", "", "SubElite", "", "", "2.5?", "bad", "1 x", "", "", "", "False", "", "", "D"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_name = os.path.join(directory, "Trials_name_mapping.csv")
+        with open(csv_name, "w") as file:
+            file.write("\n".join([header, ",".join(included_row), ",".join(excluded_row)]) + "\n")
+        trial_manifest = TrialManifest(csv_name)
+
+    assert len(trial_manifest) == 2
+    included_trials = trial_manifest.included_trials()
+    assert [record.subject_name for record in included_trials] == ["SubjectA"]
+    assert included_trials[0].max_threshold == 3.5
+    assert included_trials[0].air_time_threshold == 0.3
+    assert included_trials[0].Xsens_jump_idx == [10, 20]
+    assert included_trials[0].Pupil_frames_zero == [0, 30]
+    assert included_trials[0].movie_name == "SubjectA_movie"
+    assert trial_manifest.by_subject["SubjectB"][0].max_threshold is None
+    assert trial_manifest.twist_side("SubjectA") == "G"
+    assert trial_manifest.twist_side("SubjectB") == "D"
+
+
+if __name__ == "__main__":
+    check_excluded_rows_are_not_converted()
+    print("Trials_name_mapping.csv parsing checked")
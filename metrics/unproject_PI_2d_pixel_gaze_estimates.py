@@ -5,6 +5,9 @@ from pprint import pprint
 import cv2
 import numpy as np
 import requests
+import json
+import os
+import argparse
 
 # # ------------ Change accordingly ----------------------
 # # To download the camera intrinsics, we need two things:
@@ -21,8 +24,193 @@ import requests
 # SCENE_CAMERA_SERIAL_NUMBER = "HS6VE"
 # # ------------------------------------------------------
 
+# The intrinsics are downloaded only once per scene camera and kept in this registry (keyed by the lower case serial
+# number), so that the analysis runs offline. Populate it with:
+# python unproject_PI_2d_pixel_gaze_estimates.py SCENE_CAMERA_SERIAL_NUMBER API_KEY
+INTRINSICS_REGISTRY_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "camera_intrinsics.json")
+loaded_intrinsics = {}
+loaded_lookup_tables = {}
 
-def pixelPoints_to_gazeAngles(elevation_pixel, azimuth_pixel, SCENE_CAMERA_SERIAL_NUMBER, API_KEY):
+# The scene camera (Pupil Invisible) images are 1088 x 1080 pixels, the lookup tables cover [0, 1088] in both columns
+LOOKUP_TABLE_SIZE = (1088, 1088)
+
+
+def download_intrinsics(SCENE_CAMERA_SERIAL_NUMBER, API_KEY):
+    """Download your camera's intrinsics from Pupil Cloud"""
+    # print("Downloading intrinsics...")
+    serial = SCENE_CAMERA_SERIAL_NUMBER.lower()
+    url = f"https://api.cloud.pupil-labs.com/hardware/{serial}/calibration.v1?json"
+    resp = requests.get(url, params={"api-key": API_KEY})
+    resp.raise_for_status()
+    return resp.json()["result"]
+
+
+def load_intrinsics_registry(registry_name=INTRINSICS_REGISTRY_NAME):
+    """
+    This function loads the camera intrinsics registry ({serial: {"camera_matrix": ..., "dist_coefs": ...}}).
+    An empty registry is returned if the file does not exist yet.
+    """
+    if not os.path.exists(registry_name):
+        return {}
+    with open(registry_name, "r") as f:
+        return json.load(f)
+
+
+def register_intrinsics(SCENE_CAMERA_SERIAL_NUMBER, intrinsics, registry_name=INTRINSICS_REGISTRY_NAME):
+    """
+    This function adds (or replaces) the intrinsics of a scene camera in the registry.
+    """
+    serial = SCENE_CAMERA_SERIAL_NUMBER.lower()
+    registry = load_intrinsics_registry(registry_name)
+    registry[serial] = {
+        "camera_matrix": np.asarray(intrinsics["camera_matrix"]).tolist(),
+        "dist_coefs": np.asarray(intrinsics["dist_coefs"]).tolist(),
+    }
+    temporary_name = registry_name + ".tmp"
+    with open(temporary_name, "w") as f:
+        json.dump(registry, f, indent=4, sort_keys=True)
+    os.replace(temporary_name, registry_name)
+    loaded_intrinsics[(registry_name, serial)] = registry[serial]
+
+
+def get_intrinsics(SCENE_CAMERA_SERIAL_NUMBER, API_KEY=None, registry_name=INTRINSICS_REGISTRY_NAME):
+    """
+    This function returns the intrinsics of the scene camera from the local registry (kept in memory after the first
+    read). If the camera is not in the registry, they are downloaded from Pupil Cloud (only if an API_KEY is given) and
+    added to the registry.
+    """
+    serial = SCENE_CAMERA_SERIAL_NUMBER.lower()
+    if (registry_name, serial) in loaded_intrinsics:
+        return loaded_intrinsics[(registry_name, serial)]
+
+    registry = load_intrinsics_registry(registry_name)
+    if serial in registry:
+        loaded_intrinsics[(registry_name, serial)] = registry[serial]
+        return registry[serial]
+
+    if API_KEY is None:
+        raise RuntimeError(
+            f"The intrinsics of the scene camera {SCENE_CAMERA_SERIAL_NUMBER} are not in {registry_name}, please run "
+            f"'python unproject_PI_2d_pixel_gaze_estimates.py {SCENE_CAMERA_SERIAL_NUMBER} API_KEY' once to download them"
+        )
+    register_intrinsics(SCENE_CAMERA_SERIAL_NUMBER, download_intrinsics(SCENE_CAMERA_SERIAL_NUMBER, API_KEY), registry_name)
+    return loaded_intrinsics[(registry_name, serial)]
+
+
+def unproject_points(points_2d, camera_matrix, distortion_coefs, normalize=False):
+    """
+    Undistorts points according to the camera model.
+    :param pts_2d, shape: Nx2
+    :return: Array of unprojected 3d points, shape: Nx3
+    """
+    # print("Unprojecting points...")
+    # Convert type to numpy arrays (OpenCV requirements)
+    camera_matrix = np.array(camera_matrix)
+    distortion_coefs = np.array(distortion_coefs)
+    points_2d = np.asarray(points_2d, dtype=np.float32)
+
+    # Add third dimension the way cv2 wants it
+    points_2d = points_2d.reshape((-1, 1, 2))
+
+    # Undistort 2d pixel coordinates
+    points_2d_undist = cv2.undistortPoints(points_2d, camera_matrix, distortion_coefs)
+    # Unproject 2d points into 3d directions; all points. have z=1
+    points_3d = np.ones((len(points_2d), 3))
+    points_3d[:, :2] = points_2d_undist.reshape((-1, 2))
+
+    if normalize:
+        # normalize vector length to 1
+        points_3d /= np.linalg.norm(points_3d, axis=1)[:, np.newaxis]
+
+    return points_3d
+
+
+def points_2d_to_gaze_angles(points_2d, camera_matrix, distortion_coeff):
+    """
+    This function converts the pixel points (Nx2 array, in the column order given to cv2.undistortPoints) into gaze
+    angles (rad) on the whole recording at once.
+    The rows containing a nan (blinks) are not given to OpenCV and their angles are nan.
+    Returns elevation and azimuth in the same convention as pixelPoints_to_gazeAngles.
+    """
+    points_2d = np.reshape(np.asarray(points_2d, dtype=float), (-1, 2))
+    elevation = np.full((len(points_2d),), np.nan)
+    azimuth = np.full((len(points_2d),), np.nan)
+    is_valid = np.all(np.isfinite(points_2d), axis=1)
+    if not np.any(is_valid):
+        return elevation, azimuth
+
+    # Unproject pixel locations with normalizing. Resulting 3d points lie on a sphere
+    # with radius=1 around the camera origin (0, 0, 0).
+    points_3d = unproject_points(points_2d[is_valid], camera_matrix, distortion_coeff, normalize=True)
+
+    # convert cartesian to spherical coordinates (directly in radians)
+    # source: http://stackoverflow.com/questions/4116658/faster-numpy-cartesian-to-spherical-coordinate-conversion
+    x = points_3d[:, 0]
+    y = points_3d[:, 1]
+    z = points_3d[:, 2]
+    radius = np.sqrt(x**2 + y**2 + z**2)
+    # Same names as the original Pupil Labs code, which were swapped when unpacking its outputs:
+    # elevation is pi/2 - arctan2(z, x) and azimuth is arccos(y / radius) - pi/2
+    elevation[is_valid] = np.pi / 2 - np.arctan2(z, x)
+    azimuth[is_valid] = np.arccos(y / radius) - np.pi / 2
+    return elevation, azimuth
+
+
+def gaze_angles_lookup_table(camera_matrix, distortion_coeff, size=LOOKUP_TABLE_SIZE):
+    """
+    This function precomputes the gaze angles of every integer pixel of a size[0] x size[1] grid (first and second
+    columns of points_2d), so that the angles of a gaze sample can then be interpolated in O(1) (see
+    lookup_gaze_angles).
+    """
+    first_coordinate, second_coordinate = np.meshgrid(np.arange(size[0] + 1), np.arange(size[1] + 1), indexing="ij")
+    grid_points = np.column_stack((first_coordinate.ravel(), second_coordinate.ravel()))
+    elevation, azimuth = points_2d_to_gaze_angles(grid_points, camera_matrix, distortion_coeff)
+    return np.reshape(elevation, first_coordinate.shape), np.reshape(azimuth, first_coordinate.shape)
+
+
+def lookup_gaze_angles(points_2d, lookup_table):
+    """
+    This function interpolates (bilinear) the gaze angles of the pixel points in the lookup table.
+    The points which are outside of the table (or contain a nan) get nan angles.
+    """
+    elevation_table, azimuth_table = lookup_table
+    points_2d = np.reshape(np.asarray(points_2d, dtype=float), (-1, 2))
+    elevation = np.full((len(points_2d),), np.nan)
+    azimuth = np.full((len(points_2d),), np.nan)
+
+    max_index = np.array(elevation_table.shape) - 1
+    with np.errstate(invalid="ignore"):
+        in_table = np.all((points_2d >= 0) & (points_2d <= max_index), axis=1)
+    points_in_table = points_2d[in_table]
+    index_0 = np.minimum(np.floor(points_in_table).astype(int), max_index - 1)
+    weight = points_in_table - index_0
+    for angle, table in ((elevation, elevation_table), (azimuth, azimuth_table)):
+        angle[in_table] = (
+            table[index_0[:, 0], index_0[:, 1]] * (1 - weight[:, 0]) * (1 - weight[:, 1])
+            + table[index_0[:, 0] + 1, index_0[:, 1]] * weight[:, 0] * (1 - weight[:, 1])
+            + table[index_0[:, 0], index_0[:, 1] + 1] * (1 - weight[:, 0]) * weight[:, 1]
+            + table[index_0[:, 0] + 1, index_0[:, 1] + 1] * weight[:, 0] * weight[:, 1]
+        )
+    return elevation, azimuth
+
+
+def get_lookup_table(SCENE_CAMERA_SERIAL_NUMBER, camera_matrix, distortion_coeff):
+    """
+    This function returns the gaze angles lookup table of the scene camera (computed once per camera and kept in memory).
+    """
+    serial = SCENE_CAMERA_SERIAL_NUMBER.lower()
+    if serial not in loaded_lookup_tables:
+        loaded_lookup_tables[serial] = gaze_angles_lookup_table(camera_matrix, distortion_coeff)
+    return loaded_lookup_tables[serial]
+
+
+def pixelPoints_to_gazeAngles(elevation_pixel, azimuth_pixel, SCENE_CAMERA_SERIAL_NUMBER, API_KEY=None, use_lookup_table=False):
+    """
+    This function converts the gaze pixel positions of the whole recording into gaze angles (rad).
+    The samples with nan pixel positions (blinks) get nan angles.
+    If use_lookup_table is True, the angles are interpolated in a lookup table computed once per scene camera (the
+    points outside of the table are unprojected exactly).
+    """
     # Here we define some example pixel locations. Required shape: Nx2
     # points_2d = [
     #     [0, 0],  # top left
@@ -33,103 +221,37 @@ def pixelPoints_to_gazeAngles(elevation_pixel, azimuth_pixel, SCENE_CAMERA_SERIA
     #     [0, 1080 // 2],  # left middle
     #     [1088 // 2, 0],  # top center
     # ]
+    points_2d = np.column_stack((azimuth_pixel, elevation_pixel)).astype(float)
 
-    points_2d = [[] for i in range(len(elevation_pixel))]
-    for i in range(len(elevation_pixel)):
-        points_2d[i] = [azimuth_pixel[i], elevation_pixel[i]]
-
-    def download_intrinsics():
-        """Download your camera's intrinsics from Pupil Cloud"""
-        # print("Downloading intrinsics...")
-        serial = SCENE_CAMERA_SERIAL_NUMBER.lower()
-        url = f"https://api.cloud.pupil-labs.com/hardware/{serial}/calibration.v1?json"
-        resp = requests.get(url, params={"api-key": API_KEY})
-        resp.raise_for_status()
-        return resp.json()["result"]
-
-    def unproject_points(points_2d, camera_matrix, distortion_coefs, normalize=False):
-        """
-        Undistorts points according to the camera model.
-        :param pts_2d, shape: Nx2
-        :return: Array of unprojected 3d points, shape: Nx3
-        """
-        # print("Unprojecting points...")
-        # Convert type to numpy arrays (OpenCV requirements)
-        camera_matrix = np.array(camera_matrix)
-        distortion_coefs = np.array(distortion_coefs)
-        points_2d = np.asarray(points_2d, dtype=np.float32)
-
-        # Add third dimension the way cv2 wants it
-        points_2d = points_2d.reshape((-1, 1, 2))
-
-        # Undistort 2d pixel coordinates
-        points_2d_undist = cv2.undistortPoints(points_2d, camera_matrix, distortion_coefs)
-        # Unproject 2d points into 3d directions; all points. have z=1
-        points_3d = cv2.convertPointsToHomogeneous(points_2d_undist)
-        points_3d.shape = -1, 3
-
-        if normalize:
-            # normalize vector length to 1
-            points_3d /= np.linalg.norm(points_3d, axis=1)[:, np.newaxis]
-
-        return points_3d
-
-    def cart_to_spherical(points_3d, apply_rad2deg=True):
-        # convert cartesian to spherical coordinates
-        # source: http://stackoverflow.com/questions/4116658/faster-numpy-cartesian-to-spherical-coordinate-conversion
-        # print("Converting cartesian to spherical coordinates...")
-        x = points_3d[:, 0]
-        y = points_3d[:, 1]
-        z = points_3d[:, 2]
-        radius = np.sqrt(x**2 + y**2 + z**2)
-        # elevation: vertical direction
-        #   positive numbers point up
-        #   negative numbers point bottom
-        elevation = np.arccos(y / radius) - np.pi / 2
-        # azimuth: horizontal direction
-        #   positive numbers point right
-        #   negative numbers point left
-        azimuth = np.pi / 2 - np.arctan2(z, x)
-
-        if apply_rad2deg:
-            elevation = np.rad2deg(elevation)
-            azimuth = np.rad2deg(azimuth)
-
-        return radius, elevation, azimuth
-
-    # print("pixel location input:")
-    # pprint(points_2d)
-
-    # Secondly, we download the camera intrinsics from Pupil Cloud
-    intrinsics = download_intrinsics()
+    # Secondly, we get the camera intrinsics from the local registry (downloaded from Pupil Cloud if missing)
+    intrinsics = get_intrinsics(SCENE_CAMERA_SERIAL_NUMBER, API_KEY)
     camera_matrix = intrinsics["camera_matrix"]
     distortion_coeff = intrinsics["dist_coefs"]
 
-    # Unproject pixel locations without normalizing. Resulting 3d points lie on a plane
-    # with z=1 in reference to the camera origin (0, 0, 0).
-    # points_3d = unproject_points(
-    #     points_2d, camera_matrix, distortion_coeff, normalize=False
-    # )
-    # print("3d directional output (normalize=False):")
-    # pprint(points_3d)
-
-    # Unproject pixel locations with normalizing. Resulting 3d points lie on a sphere
-    # with radius=1 around the camera origin (0, 0, 0).
-    points_3d = unproject_points(points_2d, camera_matrix, distortion_coeff, normalize=True)
-    # print("3d directional output (normalize=True):")
-    # pprint(points_3d)
-
-    radius, azimuth, elevation = cart_to_spherical(points_3d, apply_rad2deg=True)
-    elevation = elevation * np.pi / 180
-    azimuth = azimuth * np.pi / 180
-    # print("radius, elevation, azimuth (in degrees):")
+    if use_lookup_table:
+        lookup_table = get_lookup_table(SCENE_CAMERA_SERIAL_NUMBER, camera_matrix, distortion_coeff)
+        elevation, azimuth = lookup_gaze_angles(points_2d, lookup_table)
+        outside_table = np.isnan(elevation) & np.all(np.isfinite(points_2d), axis=1)
+        if np.any(outside_table):
+            elevation[outside_table], azimuth[outside_table] = points_2d_to_gaze_angles(
+                points_2d[outside_table], camera_matrix, distortion_coeff
+            )
+    else:
+        elevation, azimuth = points_2d_to_gaze_angles(points_2d, camera_matrix, distortion_coeff)
     # elevation: vertical direction
     #   positive numbers point up
     #   negative numbers point bottom
     # azimuth: horizontal direction
     #   positive numbers point right
     #   negative numbers point left
-    # convert to numpy array for display purposes:
-    # pprint(np.array([radius, elevation, azimuth]).T)
 
     return elevation, azimuth, camera_matrix, distortion_coeff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Download the intrinsics of a scene camera from Pupil Cloud into the registry")
+    parser.add_argument("SCENE_CAMERA_SERIAL_NUMBER", action="store", help="Serial number of the scene camera")
+    parser.add_argument("API_KEY", action="store", help="Pupils API_KEY")
+    args = parser.parse_args()
+    register_intrinsics(args.SCENE_CAMERA_SERIAL_NUMBER, download_intrinsics(args.SCENE_CAMERA_SERIAL_NUMBER, args.API_KEY))
+    print(f"Intrinsics of {args.SCENE_CAMERA_SERIAL_NUMBER} saved in {INTRINSICS_REGISTRY_NAME}")
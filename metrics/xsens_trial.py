@@ -0,0 +1,110 @@
+import numpy as np
+import scipy.io as sio
+import os
+from functools import cached_property
+
+from xsens_trial_store import get_store_name, read_xsens_trial_store_header, open_xsens_trial_store_channel
+
+
+# Order of the links between the points (joint coordinates system) provided by Xsens
+XSENS_LINKS = np.array([[0, 1],
+                        [1, 2],
+                        [2, 3],
+                        [3, 4],
+                        [4, 5],
+                        [5, 6],
+                        [4, 7],
+                        [7, 8],
+                        [8, 9],
+                        [9, 10],
+                        [4, 11],
+                        [11, 12],
+                        [12, 13],
+                        [13, 14],
+                        [0, 15],
+                        [15, 16],
+                        [16, 17],
+                        [17, 18],
+                        [0, 19],
+                        [19, 20],
+                        [20, 21],
+                        [21, 22]])
+
+
+class XsensTrial:
+    """
+    Xsens data of one trial which were exported using Xsens .mvnx and unpacked with main_gaze_mapping.m (or
+    load_mvnx.py).
+    Each channel is only loaded the first time it is accessed, and then kept in memory. If the trial was converted into a
+    single file store (xsens_trial_store.py), the channels are memory-mapped from this file, otherwise they are read
+    from the .mat files.
+    orientation_file_name allows to read another orientation file than orientation.mat (e.g.
+    "orientation_original_file_with_head_sideways" before the correction of the head IMU calibration).
+    """
+
+    links = XSENS_LINKS
+
+    def __init__(self, file_dir, xsens_file_name, orientation_file_name="orientation"):
+        self.file_dir = file_dir
+        self.xsens_file_name = xsens_file_name
+        self.orientation_file_name = orientation_file_name
+        self.store_name = get_store_name(file_dir, xsens_file_name)
+        if os.path.exists(self.store_name):
+            self.store_header = read_xsens_trial_store_header(self.store_name)
+        else:
+            self.store_header = None
+
+    def load_channel(self, key, mat_file_name=None):
+        if mat_file_name is None:
+            mat_file_name = key
+        if self.store_header is not None and mat_file_name == key:
+            # Plain ndarray view on the memory-mapped file (pickled as a normal array in the metrics files)
+            return np.asarray(open_xsens_trial_store_channel(self.store_name, self.store_header, key))
+        return sio.loadmat(self.file_dir + self.xsens_file_name + '/' + mat_file_name + ".mat")[key]
+
+    def channel_shape(self, key):
+        """
+        Shape of a channel, read from the headers only (the data of the channel is not loaded).
+        """
+        if self.store_header is not None:
+            return tuple(self.store_header["channels"][key]["shape"])
+        for name, shape, _ in sio.whosmat(self.file_dir + self.xsens_file_name + '/' + key + ".mat"):
+            if name == key:
+                return shape
+
+    @cached_property
+    def num_joints(self):
+        return int(round(self.channel_shape("position")[1]) / 3)
+
+    @cached_property
+    def ms(self):
+        return self.load_channel("ms")
+
+    @cached_property
+    def position(self):
+        return self.load_channel("position")
+
+    @cached_property
+    def orientation(self):
+        return self.load_channel("orientation", self.orientation_file_name)
+
+    @cached_property
+    def sensor_free_acceleration(self):
+        return self.load_channel("sensorFreeAcceleration")
+
+    @cached_property
+    def joint_angle(self):
+        # Xsens joint angles are in degrees
+        return self.load_channel("jointAngle") * np.pi / 180
+
+    @cached_property
+    def center_of_mass(self):
+        return self.load_channel("centerOfMass")
+
+    @cached_property
+    def global_JCS_positions(self):
+        return self.load_channel("global_JCS_positions")
+
+    @cached_property
+    def global_JCS_orientations(self):
+        return self.load_channel("global_JCS_orientations")
@@ -0,0 +1,133 @@
+"""
+Single file container for the Xsens data of one trial.
+The file starts with a small json header (name, dtype, shape and position of each channel) followed by one contiguous
+array per channel. The channels are opened memory-mapped, so loading a trial only reads the header and the pages of the
+channels which are actually used.
+"""
+
+import numpy as np
+import scipy.io as sio
+import json
+import os
+import sys
+
+
+STORE_EXTENSION = ".xtrial"
+STORE_MAGIC = b"XTRIAL01"
+STORE_ALIGNMENT = 64
+# Channels saved by mvnx_converter_general_trampo (.m or .py) which are used in the analysis
+XSENS_CHANNELS = (
+    "time",
+    "index",
+    "ms",
+    "position",
+    "orientation",
+    "sensorFreeAcceleration",
+    "jointAngle",
+    "centerOfMass",
+    "global_JCS_positions",
+    "global_JCS_orientations",
+)
+XSENS_METADATA = ("Subject_name", "frameRate")
+
+
+def get_store_name(file_dir, xsens_file_name):
+    return file_dir + xsens_file_name + STORE_EXTENSION
+
+
+def write_xsens_trial_store(store_name, channels, metadata):
+    """
+    Writes the channels (dictionary of 2D arrays) and the metadata (dictionary of str/float) in a single file.
+    """
+    channels = {key: np.ascontiguousarray(channels[key]) for key in channels.keys()}
+
+    # The offsets depend on the header length, so the header is built until its length is stable
+    header_length = 0
+    while True:
+        offset = len(STORE_MAGIC) + 8 + header_length
+        header = {"metadata": metadata, "channels": {}}
+        for key in channels.keys():
+            offset += -offset % STORE_ALIGNMENT
+            header["channels"][key] = {
+                "dtype": channels[key].dtype.str,
+                "shape": list(np.shape(channels[key])),
+                "offset": offset,
+            }
+            offset += channels[key].nbytes
+        header_bytes = json.dumps(header).encode("utf-8")
+        if len(header_bytes) == header_length:
+            break
+        header_length = len(header_bytes)
+
+    with open(store_name, "wb") as f:
+        f.write(STORE_MAGIC)
+        f.write(np.uint64(header_length).tobytes())
+        f.write(header_bytes)
+        for key in channels.keys():
+            f.write(b"\0" * (header["channels"][key]["offset"] - f.tell()))
+            f.write(channels[key].tobytes())
+    return
+
+
+def read_xsens_trial_store_header(store_name):
+    with open(store_name, "rb") as f:
+        if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+            raise RuntimeError(f"{store_name} is not a Xsens trial store")
+        header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    return header
+
+
+def open_xsens_trial_store_channel(store_name, header, key):
+    """
+    Memory-maps one channel. The mode is copy-on-write, the file on disk is never modified.
+    """
+    channel_info = header["channels"][key]
+    return np.memmap(
+        store_name,
+        dtype=np.dtype(channel_info["dtype"]),
+        mode="c",
+        offset=channel_info["offset"],
+        shape=tuple(channel_info["shape"]),
+    )
+
+
+def open_xsens_trial_store(store_name):
+    """
+    Opens all the channels of the store memory-mapped (nothing is read from the channels until they are used).
+    Returns the channels and the metadata as dictionaries.
+    """
+    header = read_xsens_trial_store_header(store_name)
+    channels = {}
+    for key in header["channels"].keys():
+        channels[key] = open_xsens_trial_store_channel(store_name, header, key)
+    return channels, header["metadata"]
+
+
+def convert_mat_directory_to_store(file_dir, xsens_file_name):
+    """
+    One-shot conversion of the folder of .mat files (one per channel) generated by the unpacking of the .mvnx file into
+    a single store file placed next to this folder.
+    """
+    mat_dir = file_dir + xsens_file_name + "/"
+    channels = {}
+    for key in XSENS_CHANNELS:
+        channels[key] = sio.loadmat(mat_dir + key + ".mat")[key]
+    metadata = {
+        "Subject_name": str(np.squeeze(sio.loadmat(mat_dir + "Subject_name.mat")["Subject_name"])),
+        "frameRate": float(np.squeeze(sio.loadmat(mat_dir + "frameRate.mat")["frameRate"])),
+    }
+    store_name = get_store_name(file_dir, xsens_file_name)
+    write_xsens_trial_store(store_name, channels, metadata)
+    return store_name
+
+
+if __name__ == "__main__":
+    # Converts all the unpacked trials of a folder (e.g. .../XsensData/{subject_name}/exports_shoulder_height/)
+    file_dir = sys.argv[1]
+    if not file_dir.endswith("/"):
+        file_dir += "/"
+    for xsens_file_name in sorted(os.listdir(file_dir)):
+        if os.path.exists(file_dir + xsens_file_name + "/position.mat"):
+            store_name = convert_mat_directory_to_store(file_dir, xsens_file_name)
+            print(f"{store_name} created")
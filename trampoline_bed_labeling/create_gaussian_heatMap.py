@@ -11,14 +11,13 @@ from IPython import embed
 import sys
 sys.path.append("../metrics")
 from remove_data_during_blinks import remove_data_during_blinks_pupil, home_made_blink_confidence_threshold, remove_data_during_blinks_manual_labeling
-from rectangle_labeler_video_suplementary_info import load_csv
+from rectangle_labeler_video_suplementary_info import load_csv_cached, load_world_timestamps_cached
+from closest_index import find_closest_index
+from trial_manifest import TrialManifest
 
 def get_blinks(filename_timestamps, filename_info, filename_curent_label, curent_label, csv_eye_tracking):
 
-    timestamp_image_read = np.char.split(pd.read_csv(filename_timestamps, sep='\t').values.astype('str'), sep=',')
-    timestamp_image = np.zeros((len(timestamp_image_read, )))
-    for i in range(len(timestamp_image_read)):
-        timestamp_image[i] = timestamp_image_read[i][0][2]
+    timestamp_image = load_world_timestamps_cached(filename_timestamps)
     info = np.char.split(pd.read_csv(filename_info, sep='\t').values.astype('str'), sep=',')
     for i in range(len(info)):
         if "scene_camera_serial_number" in info[i][0][0]:
@@ -39,9 +38,8 @@ def get_blinks(filename_timestamps, filename_info, filename_curent_label, curent
     with open(blinks_labeled_file_name, "rb") as handle:
         active_blinks, time_stamps_left_eye = pickle.load(handle)
 
-    time_stamps_eye_tracking_index_on_pupil = np.zeros((len(timestamp_image),))
-    for i in range(len(timestamp_image)):
-        time_stamps_eye_tracking_index_on_pupil[i] = np.argmin(np.abs(csv_eye_tracking[:, 0] - float(timestamp_image[i])))
+    # Float indices as before (they were stored in a np.zeros array)
+    time_stamps_eye_tracking_index_on_pupil = find_closest_index(csv_eye_tracking[:, 0], timestamp_image).astype(float)
 
     # Don't mess with begining as an acrobatics, this is a labeling error, not a real behavior
     curent_label["Not an acrobatics"][0] = 1
@@ -113,10 +111,7 @@ def load_pupil_jumps_only(gaze_jumps_labels, eye_tracking_data_path):
     filename_timestamps = eye_tracking_data_path + 'world_timestamps.csv'
     filename_info = eye_tracking_data_path + 'info.json'
 
-    csv_read = np.char.split(pd.read_csv(filename, sep='\t').values.astype('str'), sep=',')
-    timestamps_read = np.char.split(pd.read_csv(filename_timestamps, sep='\t').values.astype('str'), sep=',')
-
-    csv_eye_tracking = load_csv(csv_read, timestamps_read)
+    csv_eye_tracking = load_csv_cached(filename, filename_timestamps)
 
     active_blinks, time_stamps_left_eye, start_of_cluster_index_image, end_of_cluster_index_image, time_stamps_eye_tracking_index_on_pupil, SCENE_CAMERA_SERIAL_NUMBER = get_blinks(filename_timestamps, filename_info, gaze_jumps_labels, curent_jumps_label, csv_eye_tracking)
 
@@ -499,20 +494,18 @@ def __main__():
         root_path = '/home/charbie'
 
     csv_name = root_path + "/disk/Eye-tracking/Trials_name_mapping.csv"
-    csv_table = np.char.split(pd.read_csv(csv_name, sep='\t').values.astype('str'), sep=',')
+    trial_manifest = TrialManifest(csv_name)
 
-    for i_trial in range(len(csv_table)):
-        if csv_table[i_trial][0][22] != 'True':
-            continue
+    for trial in trial_manifest.included_trials():
         movie_path = "/home/user/disk/Eye-tracking/PupilData/points_labeled/"
-        movie_name = csv_table[i_trial][0][11].replace('.', '_')
+        movie_name = trial.movie_name
         out_path = '/home/user/disk/Eye-tracking/Results'
-        subject_name = csv_table[i_trial][0][0]
-        move_names = csv_table[i_trial][0][1].split(" ")
-        repetition_number = csv_table[i_trial][0][2].split(" ")
-        move_orientation = [int(x) for x in csv_table[i_trial][0][3].split(" ")]
-        eye_tracking_folder = csv_table[i_trial][0][10]
-        subject_expertise = csv_table[i_trial][0][13]
+        subject_name = trial.subject_name
+        move_names = trial.move_names
+        repetition_number = trial.repetition_number
+        move_orientation = trial.move_orientation
+        eye_tracking_folder = trial.eye_tracking_folder
+        subject_expertise = trial.subject_expertise
         eye_tracking_data_path = root_path + "/disk/Eye-tracking/PupilData/CloudExport/" + subject_name + '/' + eye_tracking_folder + "/"
 
         points_labeled_path = root_path + "/disk/Eye-tracking/PupilData/points_labeled/"
@@ -533,7 +526,7 @@ def __main__():
          time_stamps_eye_tracking_index_on_pupil,
          SCENE_CAMERA_SERIAL_NUMBER, ) = load_pupil(gaze_position_labels, eye_tracking_data_path)
 
-        csv_eye_tracking_confident = remove_data_during_blinks_manual_labeling(csv_eye_tracking, active_blinks, time_stamps_left_eye)
+        csv_eye_tracking_confident, _ = remove_data_during_blinks_manual_labeling(csv_eye_tracking, active_blinks, time_stamps_left_eye)
 
         run_create_heatmaps(subject_name, subject_expertise, move_names, move_orientation, repetition_number, movie_name,
                         out_path, start_of_move_index_image, end_of_move_index_image, curent_AOI_label,
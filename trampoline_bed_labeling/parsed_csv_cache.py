@@ -0,0 +1,85 @@
+import numpy as np
+import hashlib
+import json
+import os
+
+
+# Increment if the content of the parsed arrays changes, so that the old caches are invalidated
+CACHE_VERSION = 1
+
+
+def file_hash(file_name):
+    hash_function = hashlib.blake2b()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hash_function.update(chunk)
+    return hash_function.hexdigest()
+
+
+def file_fingerprint(file_name, compute_hash=True):
+    stat = os.stat(file_name)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if compute_hash:
+        fingerprint["hash"] = file_hash(file_name)
+    return fingerprint
+
+
+def is_cache_valid(cached_fingerprints, source_file_names):
+    """
+    The cache is valid if the source files have the same size and modification time as when the cache was created.
+    If only the modification time changed (e.g. the files were copied), the content is compared through its hash.
+    Returns (is_valid, cache_needs_update).
+    """
+    if cached_fingerprints["version"] != CACHE_VERSION or len(cached_fingerprints["files"]) != len(source_file_names):
+        return False, False
+
+    cache_needs_update = False
+    for cached_fingerprint, source_file_name in zip(cached_fingerprints["files"], source_file_names):
+        fingerprint = file_fingerprint(source_file_name, compute_hash=False)
+        if fingerprint["size"] != cached_fingerprint["size"]:
+            return False, False
+        if fingerprint["mtime_ns"] != cached_fingerprint["mtime_ns"]:
+            if file_hash(source_file_name) != cached_fingerprint["hash"]:
+                return False, False
+            cache_needs_update = True
+    return True, cache_needs_update
+
+
+def save_cache(cache_name, arrays, source_file_names):
+    fingerprints = {
+        "version": CACHE_VERSION,
+        "files": [file_fingerprint(source_file_name) for source_file_name in source_file_names],
+    }
+    # Written in a temporary file first, so that a trial processed in parallel never reads a partial cache
+    temporary_cache_name = cache_name[:-4] + f"_{os.getpid()}.tmp.npz"
+    np.savez(
+        temporary_cache_name,
+        fingerprints=np.array(json.dumps(fingerprints)),
+        **{f"array_{i}": array for i, array in enumerate(arrays)},
+    )
+    os.replace(temporary_cache_name, cache_name)
+    return
+
+
+def load_with_cache(cache_name, source_file_names, parse_function):
+    """
+    Returns the arrays returned by parse_function(*source_file_names).
+    The parsed arrays are saved in cache_name (.npz binary file) and reused as long as the source files are unchanged,
+    so that the csv files are only tokenized once.
+    """
+    if os.path.exists(cache_name):
+        with np.load(cache_name) as cache:
+            cached_fingerprints = json.loads(str(cache["fingerprints"]))
+            is_valid, cache_needs_update = is_cache_valid(cached_fingerprints, source_file_names)
+            if is_valid:
+                arrays = tuple(cache[f"array_{i}"] for i in range(len(cache.files) - 1))
+        if is_valid:
+            if cache_needs_update:
+                save_cache(cache_name, arrays, source_file_names)
+            return arrays
+
+    arrays = parse_function(*source_file_names)
+    if not isinstance(arrays, tuple):
+        arrays = (arrays,)
+    save_cache(cache_name, arrays, source_file_names)
+    return arrays
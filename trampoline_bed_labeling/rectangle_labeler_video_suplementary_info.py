@@ -11,6 +11,10 @@ import os.path
 import json
 import tkinter as tk
 from tkinter import filedialog
+import sys
+sys.path.append("../metrics")
+from closest_index import find_closest_index
+from parsed_csv_cache import load_with_cache
 
 
 def load_video_frames(video_file, num_frames=None):
@@ -876,19 +880,29 @@ def point_choice(*args):
 def nothing(x):
     return
 
-def load_csv(csv_read, timestamps_read):
-    time_stamps_eye_tracking = np.zeros((len(timestamps_read),))
-    for i in range(len(timestamps_read)):
-        time_stamps_eye_tracking[i] = float(timestamps_read[i][0][2])
+def load_world_timestamps(filename_timestamps):
+    """
+    Reads the timestamps of the world camera images (world_timestamps.csv, column 2 = timestamp [ns]).
+    """
+    timestamps_read = pd.read_csv(filename_timestamps, usecols=[2], dtype=np.float64, engine="c", float_precision="round_trip")
+    time_stamps_eye_tracking = timestamps_read.values[:, 0]
+    return time_stamps_eye_tracking
+
+
+def load_csv(filename, filename_timestamps):
+    """
+    Reads the gaze data exported from Pupil Cloud (gaze.csv), only the columns which are used are parsed.
+    Each gaze sample is associated with the closest world camera image with a sorted search (the timestamps are sorted).
+    """
+    time_stamps_eye_tracking = load_world_timestamps(filename_timestamps)
+    csv_read = pd.read_csv(filename, usecols=[2, 3, 4, 5], dtype=np.float64, engine="c", float_precision="round_trip").values
 
     csv_eye_tracking = np.zeros((len(csv_read), 7))
-    for i in range(len(csv_read)):
-        csv_eye_tracking[i, 0] = float(csv_read[i][0][2])  # timestemp
-        csv_eye_tracking[i, 1] = int(round(float(csv_read[i][0][3])))  # pos_x
-        csv_eye_tracking[i, 2] = int(round(float(csv_read[i][0][4])))  # pos_y
-        csv_eye_tracking[i, 3] = float(csv_read[i][0][5])  # confidence
-        csv_eye_tracking[i, 4] = np.argmin(
-            np.abs(csv_eye_tracking[i, 0] - time_stamps_eye_tracking))  # closest image timestemp
+    csv_eye_tracking[:, 0] = csv_read[:, 0]  # timestemp
+    csv_eye_tracking[:, 1] = np.round(csv_read[:, 1])  # pos_x
+    csv_eye_tracking[:, 2] = np.round(csv_read[:, 2])  # pos_y
+    csv_eye_tracking[:, 3] = csv_read[:, 3]  # confidence
+    csv_eye_tracking[:, 4] = find_closest_index(time_stamps_eye_tracking, csv_eye_tracking[:, 0])  # closest image timestemp
 
     # 2 -> 0: gaze_timestamp
     # 3 -> 1: norm_pos_x
@@ -900,6 +914,26 @@ def load_csv(csv_read, timestamps_read):
     return csv_eye_tracking
 
 
+def load_world_timestamps_cached(filename_timestamps):
+    """
+    Same as load_world_timestamps, but the parsed timestamps are kept in a binary file next to world_timestamps.csv
+    (world_timestamps_parsed.npz) which is reused as long as the csv file is unchanged.
+    """
+    cache_name = os.path.join(os.path.dirname(filename_timestamps), "world_timestamps_parsed.npz")
+    time_stamps_eye_tracking, = load_with_cache(cache_name, [filename_timestamps], load_world_timestamps)
+    return time_stamps_eye_tracking
+
+
+def load_csv_cached(filename, filename_timestamps):
+    """
+    Same as load_csv, but the parsed array is kept in a binary file next to gaze.csv (gaze_parsed.npz) which is reused
+    as long as gaze.csv and world_timestamps.csv are unchanged.
+    """
+    cache_name = os.path.join(os.path.dirname(filename), "gaze_parsed.npz")
+    csv_eye_tracking, = load_with_cache(cache_name, [filename, filename_timestamps], load_csv)
+    return csv_eye_tracking
+
+
 ############################### code beginning #######################################################################
 
 def main():
@@ -949,10 +983,7 @@ def main():
     frames_clone = frames.copy()
     frames_clone = frames.copy()
 
-    csv_read = np.char.split(pd.read_csv(filename, sep='\t').values.astype('str'), sep=',')
-    timestamps_read = np.char.split(pd.read_csv(filename_timestamps, sep='\t').values.astype('str'), sep=',')
-
-    csv_eye_tracking = load_csv(csv_read, timestamps_read)
+    csv_eye_tracking = load_csv_cached(filename, filename_timestamps)
 
     point_label_names = ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "q", "w", "e", "r", "t", "y", "u", "i", "o", "p"]
     points_labels = {"0": np.zeros((2, len(frames))),
@@ -0,0 +1,144 @@
+"""
+Python version of load_mvnx.m + mvnx_converter_general_trampo.m.
+The .mvnx file is parsed incrementally (one frame at a time) so that the memory used does not depend on the length of
+the recording, and the channels used in metrics/main.py:load_xsens are written in the same .mat files as the Matlab
+code.
+"""
+
+import numpy as np
+import scipy.io as sio
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+import argparse
+import os
+
+
+# Channels (fields of the frames) extracted from the .mvnx file
+FRAME_CHANNELS = ("orientation", "position", "sensorFreeAcceleration", "jointAngle", "centerOfMass")
+# Attributes of the frames extracted from the .mvnx file
+FRAME_ATTRIBUTES = ("time", "index", "ms")
+# The first frames are not recorded frames ('identity', 'tpose', 'tpose-isb'), the third one is the global JCS
+NUMBER_OF_CALIBRATION_FRAMES = 3
+INITIAL_NUMBER_OF_FRAMES = 4096
+
+
+def strip_namespace(tag):
+    """
+    Removes the xml namespace ("{http://www.xsens.com/mvn/mvnx}frame" -> "frame").
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def text_to_array(text):
+    return np.array(text.split(), dtype=float)
+
+
+def grow_array(array, number_of_frames):
+    """
+    Doubles the number of rows of the preallocated array (amortized O(1) per frame instead of the quadratic
+    concatenation of the Matlab code).
+    """
+    new_array = np.zeros((2 * np.shape(array)[0], np.shape(array)[1]))
+    new_array[:number_of_frames, :] = array[:number_of_frames, :]
+    return new_array
+
+
+def load_mvnx(filename, channels=FRAME_CHANNELS):
+    """
+    This function reads the .mvnx file exported from Xsens and returns the channels of interest in a dictionary.
+    The keys are the same as the name of the .mat files saved by mvnx_converter_general_trampo.m.
+    """
+    if not filename.endswith(".mvnx"):
+        filename = filename + ".mvnx"
+    if not os.path.exists(filename):
+        raise RuntimeError(f"No file with filename: {filename}, file is not present or file has wrong format (function only reads .mvnx)")
+
+    data = {"frameRate": None}
+    data_arrays = {}
+    frames_element = None
+    frame_counter = 0
+    number_of_frames = 0
+
+    for event, elem in ET.iterparse(filename, events=("start", "end")):
+        tag = strip_namespace(elem.tag)
+
+        if event == "start":
+            if tag == "subject":
+                data["frameRate"] = float(elem.get("frameRate"))
+            elif tag == "frames":
+                frames_element = elem
+            continue
+
+        if tag != "frame":
+            continue
+
+        if frame_counter < NUMBER_OF_CALIBRATION_FRAMES:
+            if frame_counter == NUMBER_OF_CALIBRATION_FRAMES - 1:
+                for child in elem:
+                    if strip_namespace(child.tag) == "position":
+                        data["global_JCS_positions"] = text_to_array(child.text)[np.newaxis, :]
+                    elif strip_namespace(child.tag) == "orientation":
+                        data["global_JCS_orientations"] = text_to_array(child.text)[np.newaxis, :]
+        else:
+            values = {strip_namespace(child.tag): child.text for child in elem}
+            for key in channels:
+                frame_values = text_to_array(values[key])
+                if key not in data_arrays:
+                    data_arrays[key] = np.zeros((INITIAL_NUMBER_OF_FRAMES, len(frame_values)))
+                elif number_of_frames == np.shape(data_arrays[key])[0]:
+                    data_arrays[key] = grow_array(data_arrays[key], number_of_frames)
+                data_arrays[key][number_of_frames, :] = frame_values
+            for key in FRAME_ATTRIBUTES:
+                if key not in data_arrays:
+                    data_arrays[key] = np.zeros((INITIAL_NUMBER_OF_FRAMES, 1))
+                elif number_of_frames == np.shape(data_arrays[key])[0]:
+                    data_arrays[key] = grow_array(data_arrays[key], number_of_frames)
+                data_arrays[key][number_of_frames, 0] = float(elem.get(key))
+            number_of_frames += 1
+
+        frame_counter += 1
+        # Free the frame which was just read to keep a constant memory usage
+        frames_element.clear()
+
+    for key in data_arrays.keys():
+        data[key] = data_arrays[key][:number_of_frames, :]
+
+    return data
+
+
+def mvnx_converter_general_trampo(mvnx, file_dir, Subject_name, Move_name):
+    """
+    This function saves the data extracted from the .mvnx file in one .mat file per channel (same format as the Matlab
+    code) in the folder file_dir/Move_name.
+    """
+    new_folder_name = os.path.join(file_dir, Move_name)
+    if not os.path.exists(new_folder_name):
+        os.makedirs(new_folder_name)
+
+    sio.savemat(os.path.join(new_folder_name, "Subject_name.mat"), {"Subject_name": Subject_name})
+    sio.savemat(os.path.join(new_folder_name, "Move_name.mat"), {"Move_name": Move_name})
+    for key in mvnx.keys():
+        sio.savemat(os.path.join(new_folder_name, f"{key}.mat"), {key: mvnx[key]})
+    return
+
+
+def unpack_mvnx_file(file_dir, file_name, Subject_name):
+    mvnx = load_mvnx(os.path.join(file_dir, file_name))
+    Move_name = file_name[:-5]
+    mvnx_converter_general_trampo(mvnx, file_dir, Subject_name, Move_name)
+    print(f"{file_name} unpacked")
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Unpack all the .mvnx files of a folder (Python version of main_gaze_mapping.m)")
+    parser.add_argument("Subject_name", action="store", help="Name of the subject (e.g. JeCh_2)")
+    parser.add_argument("file_dir", action="store", help="Folder containing the .mvnx files")
+    parser.add_argument("--processes", action="store", type=int, default=None, help="Number of parallel processes")
+    args = parser.parse_args()
+
+    file_names = [file_name for file_name in sorted(os.listdir(args.file_dir)) if file_name.endswith(".mvnx")]
+    with Pool(args.processes) as pool:
+        pool.starmap(unpack_mvnx_file, [(args.file_dir, file_name, args.Subject_name) for file_name in file_names])
+
+    print("Success")